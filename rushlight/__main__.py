@@ -0,0 +1,3 @@
+from rushlight.cli import main
+
+raise SystemExit(main())
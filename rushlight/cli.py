@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Command line interface: `rushlight render JOB_FILE` renders the synthetic maps of a job file,
+# `rushlight serve` runs a local render server
+
+import argparse
+import os
+import sys
+
+
+def render(args):
+    """Runs the `render` command"""
+
+    from rushlight.utils.render_jobs import load_job_file, expand_jobs, run_jobs
+
+    spec = load_job_file(args.job_file)
+    base_dir = os.path.dirname(os.path.abspath(args.job_file))
+    output_dir = args.output or os.path.join(base_dir, spec.get('output', 'renders'))
+
+    if args.dry_run:
+        for task in expand_jobs(spec, output_dir, base_dir=base_dir):
+            print(f"{'exists ' if os.path.exists(task.output) else 'pending'} {task.output}")
+        return 0
+
+    manifest = run_jobs(spec, output_dir=output_dir, workers=args.workers, overwrite=args.overwrite,
+                        base_dir=base_dir)
+    counts = {}
+    for record in manifest['tasks']:
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+        if record['status'] == 'failed':
+            print(f"Failed: {record['output']}: {record['error']}", file=sys.stderr)
+    print(', '.join(f"{n} {status}" for status, n in sorted(counts.items())) or 'No tasks')
+    return 1 if counts.get('failed') else 0
+
+
+def serve(args):
+    """Runs the `serve` command"""
+
+    from rushlight.utils.render_server import RenderServer
+
+    server = RenderServer(host=args.host, port=args.port, max_scenes=args.max_scenes)
+    print(f"Serving on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
+
+def main(argv=None):
+    """Entry point of the `rushlight` command
+
+    :param argv: Command line arguments, defaults to `sys.argv[1:]`
+    :type argv: list, optional
+    :return: Exit status
+    :rtype: int
+    """
+
+    parser = argparse.ArgumentParser(prog='rushlight', description=__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    render_parser = commands.add_parser('render', help='Render the synthetic maps of a job file')
+    render_parser.add_argument('job_file', help='TOML or YAML job specification')
+    render_parser.add_argument('-o', '--output', help='Output directory (overrides the job file)')
+    render_parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (overrides the job file)')
+    render_parser.add_argument('--overwrite', action='store_true', help='Render tasks whose output exists')
+    render_parser.add_argument('-n', '--dry-run', action='store_true', help='List the tasks without rendering them')
+    render_parser.set_defaults(func=render)
+
+    serve_parser = commands.add_parser('serve', help='Run a local render server')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: localhost)')
+    serve_parser.add_argument('-p', '--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    serve_parser.add_argument('--max-scenes', type=int, default=8, help='Number of scenes kept in memory')
+    serve_parser.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
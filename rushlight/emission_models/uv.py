@@ -1,16 +1,15 @@
-import yt
 import numpy as np
 from pathlib import Path
-from yt.data_objects.static_output import Dataset
 import math
 
 import rushlight
+from rushlight.utils.lazy import lazy_import
 
 from scipy import interpolate
-from astropy import constants as const
 from astropy import units as u
-from yt.fields.particle_fields import obtain_relative_velocity_vector
-from yt.fields.vector_operations import get_bulk
+
+yt = lazy_import('yt')
+const = lazy_import('astropy.constants')
 
         
 class UVModel:
@@ -20,7 +19,11 @@ class UVModel:
     This model utilizes temperature response functions for specific SDO/AIA channels
     to estimate the UV intensity emitted by plasma.
     """
-    def __init__(self, temperature_field, density_field, channel):
+
+    # Derived field of the channel emissivity, added by `make_intensity_fields`
+    emissivity_field = ("gas", "aia_filter_band")
+
+    def __init__(self, temperature_field, density_field, channel, t_absorb=3e4):
         """
         Initializes the UVModel with temperature and density field names and the AIA channel.
 
@@ -32,10 +35,13 @@ class UVModel:
             The name of the field representing density.
         channel : str
             The SDO/AIA channel to use ('A94', 'A131', 'A171', 'A193', 'A211', 'A335').
+        t_absorb : float
+            Temperature (K) below which plasma is treated as neutral, absorbing material.
         """
         self.temperature_field = temperature_field
         self.density_field = density_field
         self.channel = channel  # 'A94', 'A131', 'A171', 'A193', 'A211', 'A335'
+        self.t_absorb = t_absorb
         pass
 
     def setup_model(self, data_source):
@@ -52,7 +58,7 @@ class UVModel:
             and domain information. If not a Dataset object, it is assumed
             to have a 'ds' attribute that is a Dataset.
         """
-        if isinstance(data_source, Dataset):
+        if isinstance(data_source, yt.data_objects.static_output.Dataset):
             ds = data_source
         else:
             ds = data_source.ds
@@ -111,6 +117,76 @@ class UVModel:
         uvfield = (dens * dens * aia_trm_interpf(np.log10(np.abs(temp))))
         return uvfield
 
+    def absorption_coefficient(self, dens, temp):
+        """
+        Computes the continuum absorption coefficient of cool plasma at the channel wavelength.
+
+        Material below `t_absorb` is treated as neutral hydrogen with 10% helium, absorbing
+        EUV radiation by photoionization of H I and He I (see Anzer & Heinzel 2005).
+
+        Parameters
+        ----------
+        dens : numpy.ndarray
+            Number density in cm^-3.
+        temp : numpy.ndarray
+            Temperature in K.
+
+        Returns
+        -------
+        numpy.ndarray
+            Absorption coefficient in cm^-1.
+        """
+        try:
+            wvl = float(self.channel.to(u.angstrom).value)
+        except AttributeError:
+            wvl = float(self.channel)
+
+        # Hydrogenic cross-section scaled from the Lyman edge; He I approximated from its 504 A edge
+        sigma_h = 6.3e-18 * (wvl / 911.8)**3
+        sigma_he = 7.4e-18 * (wvl / 504.3)**2
+        sigma = sigma_h + 0.1 * sigma_he
+
+        return np.where(np.abs(temp) < self.t_absorb, dens * sigma, 0.)
+
+    def make_absorption_fields(self, ds):
+        """
+        Adds a derived field for the EUV absorption coefficient to the provided dataset.
+
+        Parameters
+        ----------
+        ds : yt.data_objects.dataset.Dataset
+            The yt dataset to which the absorption coefficient field will be added.
+        """
+        self.setup_model(ds)
+
+        def _aia_absorption(field, data):
+            """
+            Calculates the absorption coefficient for a given data object.
+
+            Parameters
+            ----------
+            field : yt.fields.yt_field.YTField
+                The field object being calculated.
+            data : yt.data_objects.data_containers.DataContainer
+                The data container for which the field is being calculated.
+
+            Returns
+            -------
+            yt.arraymath.physical_quantity.YTQuantity
+                The absorption coefficient with appropriate units.
+            """
+            dens = data[self.density_field].d
+            temp = data[self.temperature_field].d
+            return data.ds.arr(self.absorption_coefficient(dens, temp), "1/cm")
+
+        ds.add_field(
+            name=("gas", "aia_absorption"),
+            function=_aia_absorption,
+            sampling_type="local",
+            units="1/cm",
+            force_override=True,
+        )
+
     def make_intensity_fields(self, ds):
         """
         Adds a derived field for the UV intensity to the provided dataset.
@@ -153,9 +229,57 @@ class UVModel:
             return uvfield
 
         ds.add_field(
-            name=("gas", "aia_filter_band"),
+            name=self.emissivity_field,
             function=_aia_filter_band,
             sampling_type="local",
             units="1/(cm*s)",
             force_override=True,
         )
+
+
+def make_los_velocity_field(ds, normal_vector):
+    """
+    Adds a derived field for the line-of-sight velocity along the viewing direction.
+
+    The velocity is taken relative to the 'bulk_velocity' field parameter of the data
+    container (zero unless set), and is positive for plasma moving along `normal_vector`,
+    i.e. away from the observer (redshift).
+
+    Parameters
+    ----------
+    ds : yt.data_objects.dataset.Dataset
+        The yt dataset to which the velocity field will be added. Must provide
+        ("gas", "velocity_x"), ("gas", "velocity_y") and ("gas", "velocity_z").
+    normal_vector : array-like
+        Line of sight direction, as used for the projection.
+    """
+    normal = np.asarray(normal_vector, dtype=np.float64)
+    normal = normal / np.linalg.norm(normal)
+
+    def _los_velocity(field, data):
+        """
+        Projects the velocity relative to the bulk velocity onto the line of sight.
+
+        Parameters
+        ----------
+        field : yt.fields.yt_field.YTField
+            The field object being calculated.
+        data : yt.data_objects.data_containers.DataContainer
+            The data container for which the field is being calculated.
+
+        Returns
+        -------
+        yt.arraymath.physical_quantity.YTQuantity
+            Line-of-sight velocity in km/s.
+        """
+        rel_vel = yt.fields.particle_fields.obtain_relative_velocity_vector(data)
+        los = normal[0] * rel_vel[0] + normal[1] * rel_vel[1] + normal[2] * rel_vel[2]
+        return data.ds.arr(los.d, rel_vel.units).to("km/s")
+
+    ds.add_field(
+        name=("gas", "los_velocity"),
+        function=_los_velocity,
+        sampling_type="local",
+        units="km/s",
+        force_override=True,
+    )
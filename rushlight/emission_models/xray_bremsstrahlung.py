@@ -0,0 +1,222 @@
+import numpy as np
+from functools import lru_cache
+
+
+from scipy import special
+
+from rushlight.utils.lazy import lazy_import
+
+yt = lazy_import('yt')
+
+'''
+Class to compute thermal bremsstrahlung (free-free) X-ray emission in energy bands, such as RHESSI images
+'''
+
+# Photon emissivity coefficient of thermal bremsstrahlung, photons cm^3 s^-1 keV^-1 K^(1/2):
+# 6.8e-38 erg cm^3 s^-1 Hz^-1 K^(1/2) (Rybicki & Lightman eq. 5.14b), converted per keV and per photon energy
+BREMS_COEFF = 1.026e-11
+
+# Boltzmann constant in keV / K
+K_B_KEV = 8.617333e-8
+
+
+@lru_cache(maxsize=1)
+def gaunt_table(umin=1e-4, umax=1e2, npts=512):
+    """
+    Precomputes the free-free Gaunt factor on a logarithmic grid of u = E / kT.
+
+    Uses the non-relativistic Born approximation g = sqrt(3) / pi * exp(u/2) * K0(u/2).
+
+    Parameters
+    ----------
+    umin, umax : float
+        Range of the tabulated E / kT values.
+    npts : int
+        Number of table entries.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        log10(u) grid and the corresponding Gaunt factors.
+    """
+    log_u = np.linspace(np.log10(umin), np.log10(umax), npts)
+    gaunt = np.sqrt(3.) / np.pi * special.k0e(0.5 * 10**log_u)
+    return log_u, gaunt
+
+
+class ThermalBremsstrahlungModel:
+    """
+    A class to model thermal bremsstrahlung X-ray emission in a set of energy bins.
+
+    The photon emissivity of every bin between `emin` and `emax` is evaluated for all cells
+    in one vectorized pass, using a precomputed Gaunt factor table and a fixed
+    Gauss-Legendre quadrature over each bin.
+    """
+    def __init__(self, temperature_field, density_field, emin, emax, nbins, binscale='linear'):
+        """
+        Initializes the ThermalBremsstrahlungModel with field names and the energy binning.
+
+        Parameters
+        ----------
+        temperature_field : str
+            The name of the field representing temperature.
+        density_field : str
+            The name of the field representing number density.
+        emin : float
+            Low energy limit in keV.
+        emax : float
+            High energy limit in keV.
+        nbins : int
+            Number of energy bins between `emin` and `emax`.
+        binscale : str
+            Spacing of the energy bins, 'linear' or 'log'.
+        """
+        self.temperature_field = temperature_field
+        self.density_field = density_field
+        self.emin = emin
+        self.emax = emax
+        self.nbins = nbins
+        self.binscale = binscale
+
+        if binscale == 'linear':
+            self.energy_edges = np.linspace(emin, emax, nbins + 1)
+        elif binscale == 'log':
+            self.energy_edges = np.geomspace(emin, emax, nbins + 1)
+        else:
+            raise ValueError("binscale should be either 'linear' or 'log'")
+
+        # Quadrature nodes / weights of every bin, flattened to (nbins * nq,)
+        nodes, weights = np.polynomial.legendre.leggauss(4)
+        lo = self.energy_edges[:-1, None]
+        half_width = 0.5 * np.diff(self.energy_edges)[:, None]
+        self.energies = (lo + half_width * (nodes + 1)).ravel()
+        self.quad_weights = (half_width * weights).ravel()
+
+        self.log_u, self.gaunt = gaunt_table()
+
+    def setup_model(self, data_source):
+        """
+        Sets up the model parameters based on the provided data source.
+
+        Parameters
+        ----------
+        data_source : Dataset or object with a 'ds' attribute
+            The data source containing the temperature and density fields
+            and domain information. If not a Dataset object, it is assumed
+            to have a 'ds' attribute that is a Dataset.
+        """
+        if isinstance(data_source, yt.data_objects.static_output.Dataset):
+            ds = data_source
+        else:
+            ds = data_source.ds
+        self.temperature_field = ds._get_field_info(self.temperature_field).name
+        self.density_field = ds._get_field_info(self.density_field).name
+        self.ftype = self.temperature_field[0]
+        self.left_edge = ds.domain_left_edge
+        self.right_edge = ds.domain_right_edge
+        self.domain_dimensions = ds.domain_dimensions
+
+    @property
+    def field_name(self):
+        """Name of the band-integrated emission field"""
+        return f"xray_{self.emin}_{self.emax}_keV_band"
+
+    def spectrum(self, dens, temp, chunk_size=65536, bins=None):
+        """
+        Computes the photon emissivity of every energy bin for a set of cells.
+
+        Parameters
+        ----------
+        dens : numpy.ndarray
+            Number density in cm^-3, shape (n,).
+        temp : numpy.ndarray
+            Temperature in K, shape (n,).
+        chunk_size : int
+            Number of cells evaluated at once, bounding the size of the temporaries.
+        bins : slice, optional
+            Energy bins to evaluate, by default all of them.
+
+        Returns
+        -------
+        numpy.ndarray
+            Photon emissivity integrated over each bin, photons cm^-3 s^-1, shape (n, number of bins).
+        """
+        dens = np.asarray(dens, dtype=np.float64).ravel()
+        temp = np.abs(np.asarray(temp, dtype=np.float64).ravel())
+        bins = slice(None) if bins is None else bins
+        energies = self.energies.reshape(self.nbins, -1)[bins]
+        weights = self.quad_weights.reshape(self.nbins, -1)[bins].ravel()
+        nbins, nq = energies.shape
+        energies = energies.ravel()
+        spec = np.zeros((dens.size, nbins))
+
+        for start in range(0, dens.size, chunk_size):
+            sl = slice(start, start + chunk_size)
+            kt = K_B_KEV * temp[sl, None]
+            with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+                u_ = energies / kt
+                gaunt = np.interp(np.log10(u_), self.log_u, self.gaunt)
+                integrand = gaunt * np.exp(-u_) / energies
+            integrand = np.nan_to_num(integrand, nan=0., posinf=0.)
+            band = (integrand * weights).reshape(-1, nbins, nq).sum(-1)
+            with np.errstate(divide='ignore'):
+                norm = BREMS_COEFF * dens[sl]**2 / np.sqrt(temp[sl])
+            spec[sl] = band * np.nan_to_num(norm, posinf=0.)[:, None]
+
+        return spec
+
+    def process_data(self, chunk):
+        """
+        Processes a data chunk to calculate the band-integrated photon emissivity.
+
+        Parameters
+        ----------
+        chunk : yt.data_objects.chunk.DataChunk
+            A chunk of data containing the temperature and density fields.
+
+        Returns
+        -------
+        numpy.ndarray
+            The photon emissivity summed over all energy bins for each cell in the chunk.
+        """
+        dens = chunk[self.density_field].d
+        temp = chunk[self.temperature_field].d
+
+        return self.spectrum(dens, temp).sum(axis=-1).reshape(dens.shape)
+
+    def make_intensity_fields(self, ds):
+        """
+        Adds a derived field for the band-integrated X-ray emissivity to the provided dataset.
+
+        Parameters
+        ----------
+        ds : yt.data_objects.dataset.Dataset
+            The yt dataset to which the X-ray emissivity field will be added.
+        """
+        self.setup_model(ds)
+
+        def _xray_band(field, data):
+            """
+            Calculates the band-integrated photon emissivity for a given data object.
+
+            Parameters
+            ----------
+            field : yt.fields.yt_field.YTField
+                The field object being calculated.
+            data : yt.data_objects.data_containers.DataContainer
+                The data container for which the field is being calculated.
+
+            Returns
+            -------
+            yt.arraymath.physical_quantity.YTQuantity
+                The calculated photon emissivity with appropriate units.
+            """
+            return data.ds.arr(self.process_data(data), "1/(cm**3*s)")
+
+        ds.add_field(
+            name=("gas", self.field_name),
+            function=_xray_band,
+            sampling_type="local",
+            units="1/(cm**3*s)",
+            force_override=True,
+        )
@@ -1,13 +1,14 @@
-import yt
 import numpy as np
 from pathlib import Path
 
 import rushlight
+from rushlight.utils.lazy import lazy_import
 
-from yt.data_objects.static_output import Dataset
 
 from scipy import interpolate
 
+yt = lazy_import('yt')
+
 '''
 Class to plot synthetic X-ray images as observed from Hinode XRT
 '''
@@ -19,6 +20,10 @@ class XRTModel:
     This model uses temperature and density fields along with the temperature response
     functions for specific XRT filters to estimate the observed X-ray intensity.
     """
+
+    # Derived field of the channel emissivity, added by `make_intensity_fields`
+    emissivity_field = ("gas", "xrt_filter_band")
+
     def __init__(self, temperature_field, density_field, channel):
         """
         Initializes the XRTModel with temperature and density field names and the XRT channel.
@@ -51,7 +56,7 @@ class XRTModel:
             and domain information. If not a Dataset object, it is assumed
             to have a 'ds' attribute that is a Dataset.
         """
-        if isinstance(data_source, Dataset):
+        if isinstance(data_source, yt.data_objects.static_output.Dataset):
             ds = data_source
         else:
             ds = data_source.ds
@@ -146,7 +151,7 @@ class XRTModel:
             return xrtfield
 
         ds.add_field(
-            name=("gas", "xrt_filter_band"),
+            name=self.emissivity_field,
             function=_xrt_filter_band,
             sampling_type="local",
             units="1/(cm*s)",
@@ -19,8 +19,11 @@ from CoronalLoopBuilder.builder import CoronalLoopBuilder # type: ignore
 from rushlight.utils.proj_imag_classified import SyntheticFilterImage as sfi
 # from rushlight.utils.proj_imag_classified import XRTReferenceImage
 from rushlight.utils.rimage import XRTReferenceImage
+from rushlight.utils.fits_index import FitsHeaderIndex
+from rushlight.utils.box import Box
 
 import itertools
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 import glob
@@ -177,22 +180,11 @@ def find_matching_fits(directory):
     with different instruments but equal filter wavelengths.
   """
 
-  fits_files = glob.glob(os.path.join(directory, '*.fits')) + glob.glob(os.path.join(directory, '*.fts'))
-  fits_maps = [sunpy.map.Map(f) for f in fits_files]
+  # Headers are read once into a persistent index of the directory, and files are
+  # only compared within their wavelength group
+  return FitsHeaderIndex(directory).pairs()
 
-  matches = []
-  for i, map1 in enumerate(fits_maps):
-    for j, map2 in enumerate(fits_maps):
-      different_instruments = map1.meta['TELESCOP'] != map2.meta['TELESCOP']
-      same_wavelength = (map1.meta['WAVELNTH'] == map2.meta['WAVELNTH'])
-      almost = (map1.meta['WAVELNTH'] == 195 and map2.meta['WAVELNTH'] == 193) \
-            or (map1.meta['WAVELNTH'] == 193 and map2.meta['WAVELNTH'] == 195)
-      if i < j and different_instruments and (same_wavelength or almost):
-        matches.append((fits_files[i], fits_files[j]))
-
-  return matches
-
-def select_pair_by_wavelength(matching_pairs, target_wavelength):
+def select_pair_by_wavelength(matching_pairs, target_wavelength, index=None):
   """
   Selects the pair of FITS files from the given list that corresponds to the specified target wavelength.
 
@@ -200,17 +192,23 @@ def select_pair_by_wavelength(matching_pairs, target_wavelength):
     matching_pairs: A list of tuples, where each tuple contains the paths to two FITS files 
                     with different instruments but equal filter wavelengths.
     target_wavelength: The target wavelength to search for.
+    index: FitsHeaderIndex of the directory of the files, to avoid rescanning it
+           (by default the directories of the pairs are indexed).
 
   Returns:
     The first pair of FITS files found with the specified target wavelength, 
     or None if no such pair exists.
   """
+  indices = {}
+  if index is not None:
+    indices[os.path.dirname(matching_pairs[0][0]) or '.'] = index
   for pair in matching_pairs:
-    map1 = sunpy.map.Map(pair[0])
-    match_target = map1.meta['WAVELNTH'] == target_wavelength
-    almost = map1.meta['WAVELNTH'] == 195 and target_wavelength == 193 \
-          or map1.meta['WAVELNTH'] == 193 and target_wavelength == 195
-    if match_target or almost: 
+    # Wavelengths come from the header index instead of loading the maps
+    directory = os.path.dirname(pair[0]) or '.'
+    if directory not in indices:
+      indices[directory] = FitsHeaderIndex(directory)
+    index = indices[directory]
+    if index.channel(index[pair[0]]['wavelength']) == index.channel(target_wavelength):
       return pair  # Only need to check one map in the pair
   return None
 
@@ -397,23 +395,25 @@ def color_slice(ax, m, los1, los2, **kwargs):
 
 def plot_ribbon(ax, pair_matches, **kwargs):
 
-    # Get 304 image
-    pr = select_pair_by_wavelength(pair_matches, 304)
-    pr_maps = [sunpy.map.Map(item) for item in pr]
+    # Get 304 image; the header index of the files can be passed as `index` to avoid rescanning their directory
+    index = kwargs.get('index', None) or FitsHeaderIndex(os.path.dirname(pair_matches[0][0]) or '.')
+    pr = select_pair_by_wavelength(pair_matches, 304, index=index)
+
+    # select between aia or stereo contour
+    instr = kwargs.get('instr', 'STEREO')
 
-    # Load AIA and SDO maps
+    # Load only the AIA or STEREO map that is plotted, identified from the header index
     a_map = None
     s_map = None
-    for ma in pr_maps:
-        if ma.meta['TELESCOP'] == 'SDO/AIA':
-            a_map = ma
-        elif ma.meta['TELESCOP'] == 'STEREO':
-            s_map = ma
+    for item in pr:
+        if index[item]['telescope'] == 'SDO/AIA':
+            if instr != 'STEREO':
+                a_map = sunpy.map.Map(item)
+        elif index[item]['telescope'] == 'STEREO':
+            if instr == 'STEREO':
+                s_map = sunpy.map.Map(item)
         else:
             print('Pair contains maps from non AIA / STEREO instruments')
-
-    # select between aia or stereo contour
-    instr = kwargs.get('instr', 'STEREO')
     if instr == 'STEREO':
         s_crop_lims = kwargs.get('cl', None)
         s_map_roi = crop_map(s_map, **s_crop_lims)
@@ -588,282 +588,6 @@ def get_angle(pta1, pta2, ptb1, ptb2):
     return theta
 
 # Either Trim Code or include link/reference
-class Box:
-    """
-    Represents a 3D box in solar or observer coordinates defined by its origin, center, dimensions, and resolution.
-
-    This class calculates and stores the coordinates of the box's edges, differentiating between bottom edges and other edges.
-    It is designed to integrate with solar physics data analysis frameworks such as SunPy and Astropy.
-
-    :param frame_obs: The observer's frame of reference as a `SkyCoord` object.
-    :param box_origin: The origin point of the box in the specified coordinate frame as a `SkyCoord`.
-    :param box_center: The geometric center of the box as a `SkyCoord`.
-    :param box_dims: The dimensions of the box specified as an `astropy.units.Quantity` array-like in the order (x, y, z).
-    :param box_res: The resolution of the box, given as an `astropy.units.Quantity` typically in units of megameters.
-
-    Attributes
-    ----------
-    corners : list of tuple
-        List containing tuples representing the corner points of the box in the specified units.
-    edges : list of tuple
-        List containing tuples that represent the edges of the box by connecting the corners.
-    bottom_edges : list of `SkyCoord`
-        A list containing the bottom edges of the box calculated based on the minimum z-coordinate value.
-    non_bottom_edges : list of `SkyCoord`
-        A list containing all edges of the box that are not classified as bottom edges.
-
-    Methods
-    -------
-    bl_tr_coords(pad_frac=0.0)
-        Calculates and returns the bottom left and top right coordinates of the box in the observer frame.
-        Optionally applies a padding factor to expand the box dimensions symmetrically.
-
-    Example
-    -------
-    >>> from astropy.coordinates import SkyCoord
-    >>> from astropy.time import Time
-    >>> import astropy.units as u
-    >>> time = Time('2024-05-09T17:12:00')
-    >>> box_origin = SkyCoord(450 * u.arcsec, -256 * u.arcsec, obstime=time, observer="earth", frame='helioprojective')
-    >>> box_center = SkyCoord(500 * u.arcsec, -200 * u.arcsec, obstime=time, observer="earth", frame='helioprojective')
-    >>> box_dims = u.Quantity([100, 100, 50], u.Mm)
-    >>> box_res = 1.4 * u.Mm
-    >>> box = Box(frame_obs=box_origin.frame, box_origin=box_origin, box_center=box_center, box_dims=box_dims, box_res=box_res)
-    >>> print(box.bounds_coords_bl_tr())
-    """
-
-    def __init__(self, frame_obs, box_origin, box_center, box_dims, box_res):
-        '''
-        Initializes the Box instance with origin, dimensions, and computes the corners and edges.
-
-        :param box_center: SkyCoord, the origin point of the box in a given coordinate frame.
-        :param box_dims: u.Quantity, the dimensions of the box (x, y, z) in specified units. x and y are in the solar frame, z is the height above the solar surface.
-        '''
-        self._frame_obs = frame_obs
-        with Helioprojective.assume_spherical_screen(frame_obs.observer):
-            self._origin = box_origin
-            self._center = box_center
-        self._dims = box_dims
-        self._res = box_res
-        self._dims_pix = np.int_(np.round(self._dims / self._res.to(self._dims.unit)))
-        # Generate corner points based on the dimensions
-        self.corners = list(itertools.product(self._dims[0] / 2 * [-1, 1],
-                                                self._dims[1] / 2 * [-1, 1],
-                                                self._dims[2] / 2 * [-1, 1]))
-
-        # Identify edges as pairs of corners differing by exactly one dimension
-        self.edges = [edge for edge in itertools.combinations(self.corners, 2)
-                        if np.count_nonzero(u.Quantity(edge[0]) - u.Quantity(edge[1])) == 1]
-        # Initialize properties to store categorized edges
-        self._bottom_edges = None
-        self._non_bottom_edges = None
-        self._calculate_edge_types()  # Categorize edges upon initialization
-        self.b3dtype = ['lfff', 'nlfff']
-        self.b3d = {b3dtype: None for b3dtype in self.b3dtype}
-
-    @property
-    def dims_pix(self):
-        return self._dims_pix
-
-    @property
-    def grid_coords(self):
-        return self._get_grid_coords(self._center)
-
-    def _get_grid_coords(self, grid_center):
-        grid_coords = {}
-        grid_coords['x'] = np.linspace(grid_center.x.to(self._dims.unit) - self._dims[0] / 2,
-                                        grid_center.x.to(self._dims.unit) + self._dims[0] / 2, self._dims_pix[0])
-        grid_coords['y'] = np.linspace(grid_center.y.to(self._dims.unit) - self._dims[1] / 2,
-                                        grid_center.y.to(self._dims.unit) + self._dims[1] / 2, self._dims_pix[1])
-        grid_coords['z'] = np.linspace(grid_center.z.to(self._dims.unit) - self._dims[2] / 2,
-                                        grid_center.z.to(self._dims.unit) + self._dims[2] / 2, self._dims_pix[2])
-        grid_coords['frame'] = self._frame_obs
-        return grid_coords
-
-    def _get_edge_coords(self, edges, box_center):
-        """
-        Translates edge corner points to their corresponding SkyCoord based on the box's origin.
-
-        :param edges: List of tuples, each tuple contains two corner points defining an edge.
-        :type edges: list of tuple
-        :param box_center: The origin point of the box in the specified coordinate frame as a `SkyCoord`.
-        :type box_center: `~astropy.coordinates.SkyCoord`
-        :return: List of `SkyCoord` coordinates of edges in the box's frame.
-        :rtype: list of `~astropy.coordinates.SkyCoord`
-        """
-        return [SkyCoord(x=box_center.x + u.Quantity([edge[0][0], edge[1][0]]),
-                         y=box_center.y + u.Quantity([edge[0][1], edge[1][1]]),
-                         z=box_center.z + u.Quantity([edge[0][2], edge[1][2]]),
-                         frame=box_center.frame) for edge in edges]
-
-    # def _get_bottom_bl_tr_coords(self,box_center):
-    #    return [SkyCoord(x=box_center.x - self._box_dims[0] / 2,
-    def _get_bottom_cea_header(self):
-        """
-        Generates a CEA header for the bottom of the box.
-
-        :return: The FITS WCS header for the bottom of the box.
-        :rtype: dict
-        """
-        origin = self._origin.transform_to(HeliographicStonyhurst)
-        shape = self._dims[:-1][::-1] / self._res.to(self._dims.unit)
-        shape = list(shape.value)
-        shape = [int(np.ceil(s)) for s in shape]
-        rsun = origin.rsun.to(self._res.unit)
-        scale = np.arcsin(self._res / rsun).to(u.deg) / u.pix
-        scale = u.Quantity((scale, scale))
-        # bottom_cea_header = make_fitswcs_header(shape, origin,
-        #                                          scale=scale, observatory=self._origin.observer, projection_code='CEA')
-        bottom_cea_header = make_fitswcs_header(shape, origin,
-                                                 scale=scale, projection_code='CEA')
-        bottom_cea_header['OBSRVTRY'] = str(origin.observer)
-        return bottom_cea_header
-
-    def _calculate_edge_types(self):
-        """
-        Separates the box's edges into bottom edges and non-bottom edges. This is done in a single pass to improve efficiency.
-        """
-        min_z = min(corner[2] for corner in self.corners)
-        bottom_edges, non_bottom_edges = [], []
-        for edge in self.edges:
-            if edge[0][2] == min_z and edge[1][2] == min_z:
-                bottom_edges.append(edge)
-            else:
-                non_bottom_edges.append(edge)
-        self._bottom_edges = self._get_edge_coords(bottom_edges, self._center)
-        self._non_bottom_edges = self._get_edge_coords(non_bottom_edges, self._center)
-
-    def _get_bounds_coords(self, edges, bltr=False, pad_frac=0.0):
-        """
-        Provides the bounding box of the edges in solar x and y.
-
-        :param edges: List of tuples, each tuple contains two corner points defining an edge.
-        :type edges: list of tuple
-        :param bltr: If True, returns bottom left and top right coordinates, otherwise returns minimum and maximum coordinates.
-        :type bltr: bool, optional
-        :param pad_frac: Fractional padding applied to each side of the box, expressed as a decimal, defaults to 0.0.
-        :type pad_frac: float, optional
-
-        :return: Coordinates of the box's bounds.
-        :rtype: list of `~astropy.coordinates.SkyCoord`
-        """
-        xx = []
-        yy = []
-        for edge in edges:
-            xx.append(edge.transform_to(self._frame_obs).Tx)
-            yy.append(edge.transform_to(self._frame_obs).Ty)
-        unit = xx[0][0].unit
-        min_x = np.min(xx)
-        max_x = np.max(xx)
-        min_y = np.min(yy)
-        max_y = np.max(yy)
-        if pad_frac > 0:
-            _pad = pad_frac * np.max([max_x - min_x, max_y - min_y, 20])
-            min_x -= _pad
-            max_x += _pad
-            min_y -= _pad
-            max_y += _pad
-        if bltr:
-            bottom_left = SkyCoord(min_x * unit, min_y * unit, frame=self._frame_obs)
-            top_right = SkyCoord(max_x * unit, max_y * unit, frame=self._frame_obs)
-            return [bottom_left, top_right]
-        else:
-            coords = SkyCoord(Tx=[min_x, max_x] * unit, Ty=[min_y, max_y] * unit,
-                                frame=self._frame_obs)
-            return coords
-
-    def bounds_coords_bl_tr(self, pad_frac=0.0):
-        """
-        Calculates and returns the bottom left and top right coordinates of the box in the observer frame.
-        Optionally applies a padding factor to expand the box dimensions symmetrically.
-
-        :param pad_frac: Fractional padding applied to each side of the box, expressed as a decimal, defaults to 0.0.
-        :type pad_frac: float, optional
-        :return: Bottom left and top right coordinates of the box in the observer frame.
-        :rtype: list of `~astropy.coordinates.SkyCoord`
-        """
-        return self._get_bounds_coords(self.all_edges, bltr=True, pad_frac=pad_frac)
-
-    @property
-    def bounds_coords(self):
-        """
-        Provides access to the box's bounds in the observer frame.
-
-        :return: Coordinates of the box's bounds.
-        :rtype: `~astropy.coordinates.SkyCoord`
-        """
-        return self._get_bounds_coords(self.all_edges)
-
-    @property
-    def bottom_bounds_coords(self):
-        """
-        Provides access to the box's bottom bounds in the observer frame.
-
-        :return: Coordinates of the box's bottom bounds.
-        :rtype: `~astropy.coordinates.SkyCoord`
-        """
-        return self._get_bounds_coords(self.bottom_edges)
-
-    @property
-    def bottom_cea_header(self):
-        """
-        Provides access to the box's bottom WCS CEA header.
-
-        :return: The WCS CEA header for the box's bottom.
-        :rtype: dict
-        """
-        return self._get_bottom_cea_header()
-
-    @property
-    def bottom_edges(self):
-        """
-        Provides access to the box's bottom edge coordinates.
-
-        :return: Coordinates of the box's bottom edges.
-        :rtype: list of `~astropy.coordinates.SkyCoord`
-        """
-        return self._bottom_edges
-
-    @property
-    def non_bottom_edges(self):
-        """
-        Provides access to the box's non-bottom edge coordinates.
-
-        :return: Coordinates of the box's non-bottom edges.
-        :rtype: list of `~astropy.coordinates.SkyCoord`
-        """
-        return self._non_bottom_edges
-
-    @property
-    def all_edges(self):
-        """
-        Provides access to all the edge coordinates of the box, combining both bottom and non-bottom edges.
-
-        :return: Coordinates of all the edges of the box.
-        :rtype: list of `~astropy.coordinates.SkyCoord`
-        """
-        return self._bottom_edges + self._non_bottom_edges
-
-    @property
-    def box_origin(self):
-        """
-        Provides read-only access to the box's origin coordinates.
-
-        :return: The origin of the box in the specified frame.
-        :rtype: `~astropy.coordinates.SkyCoord`
-        """
-        return self._center
-
-    @property
-    def box_dims(self):
-        """
-        Provides read-only access to the box's dimensions.
-
-        :return: The dimensions of the box (length, width, height) in specified units.
-        :rtype: `~astropy.units.Quantity`
-        """
-        return self._dims
-
 def plot_edges(ax, m, sfiObj, **kwargs):
     # Get domain widths from 3d object
     dom_width = sfiObj.domain_width
@@ -916,99 +640,25 @@ def plot_edges(ax, m, sfiObj, **kwargs):
                               )
 
     # Overlay Box edges onto the map
-    # Transform box edges to the map's coordinate frame
-    bottom_edges_transformed = [edge.transform_to(target_frame) for edge in box.bottom_edges]
-    non_bottom_edges_transformed = [edge.transform_to(target_frame) for edge in box.non_bottom_edges]
+    # Transform all box edges to the map's coordinate frame at once
+    edges = box.transform_edges(target_frame)
+    cart_vect = edges.cartesian.xyz
 
     # Specify rotation matrix to apply to all edge coordinates
     deg_rot = kwargs.get('rotation', None)
     if deg_rot:
       R = rotation_matrix(deg_rot*u.deg, axis='y')
-
-      new_bottom_edges = []
-      for edge in bottom_edges_transformed:
-        cart_vect = edge.cartesian.xyz.value
-        unit = edge.cartesian.x.unit
-
-        rot_vect = R @ cart_vect
-        
-        rotated_cartesian_rep = CartesianRepresentation(
-            rot_vect[0] * unit,
-            rot_vect[1] * unit,
-            rot_vect[2] * unit
-          )
-        
-        rotated_coord = SkyCoord(
-          rotated_cartesian_rep,
-          frame=edge.frame
-          )
-        
-        new_bottom_edges.append(rotated_coord)
-
-      new_non_bottom_edges = []
-      for edge in non_bottom_edges_transformed:
-        cart_vect = edge.cartesian.xyz.value
-        unit = edge.cartesian.x.unit
-
-        rot_vect = R @ cart_vect
-        
-        rotated_cartesian_rep = CartesianRepresentation(
-            rot_vect[0] * unit,
-            rot_vect[1] * unit,
-            rot_vect[2] * unit
-          )
-        
-        rotated_coord = SkyCoord(
-          rotated_cartesian_rep,
-          frame=edge.frame
-          )
-        
-        new_non_bottom_edges.append(rotated_coord)
-
-      bottom_edges_transformed = new_bottom_edges
-      non_bottom_edges_transformed = new_non_bottom_edges
+      cart_vect = np.einsum('ij,j...->i...', R, cart_vect)
 
     # Specify if the box edges should be adjusted based on SfiObj origin shift
     ori_shift = kwargs.get('shift', False)
     if ori_shift:
-      new_bottom_edges = []
-      for edge in bottom_edges_transformed:
-        cart_vect = edge.cartesian.xyz.value
-        unit = edge.cartesian.x.unit
-        
-        shifted_cartesian_rep = CartesianRepresentation(
-            cart_vect[0] * unit,
-            cart_vect[1] * unit,
-            cart_vect[2] * unit - (box_dims[2] / 2)
-          )
-        
-        shifted_coord = SkyCoord(
-          shifted_cartesian_rep,
-          frame=edge.frame
-          )
-        
-        new_bottom_edges.append(shifted_coord)
-
-      new_non_bottom_edges = []
-      for edge in non_bottom_edges_transformed:
-        cart_vect = edge.cartesian.xyz.value
-        unit = edge.cartesian.x.unit
-        
-        shifted_cartesian_rep = CartesianRepresentation(
-            cart_vect[0] * unit,
-            cart_vect[1] * unit,
-            cart_vect[2] * unit- (box_dims[2] / 2)
-          )
-        
-        shifted_coord = SkyCoord(
-          shifted_cartesian_rep,
-          frame=edge.frame
-          )
-        
-        new_non_bottom_edges.append(shifted_coord)
-
-      bottom_edges_transformed = new_bottom_edges
-      non_bottom_edges_transformed = new_non_bottom_edges
+      cart_vect = u.Quantity([cart_vect[0], cart_vect[1], cart_vect[2] - (box_dims[2] / 2)])
+
+    if deg_rot or ori_shift:
+      edges = SkyCoord(CartesianRepresentation(cart_vect), frame=edges.frame)
+    bottom_edges_transformed = edges[box.bottom]
+    non_bottom_edges_transformed = edges[~box.bottom]
 
     color = kwargs.get('color', 'blue')
 
@@ -1,13 +1,250 @@
-from sunpy.net import Fido
-from sunpy.net import attrs as a
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import astropy.units as u
 from astropy.time import Time
+from sunpy.time import parse_time
+
+from rushlight.utils.fits_index import FitsHeaderIndex
 
 '''
 This script provides functionality to download FITS data and apply calibrations to the images
-provided by different solar observatories, including SDO/AIA, Hinode/XRT
+provided by different solar observatories, including SDO/AIA, Hinode/XRT.
+
+Requests are resolved against a local archive directory first; only the observations missing from it
+are searched for and fetched (in parallel, with bounded concurrency) from a remote archive, either
+the VSO / JSOC through `sunpy.net.Fido` or another directory of FITS files (`DirectoryArchive`).
 '''
 
+# Default local archive directory
+LOCAL_ARCHIVE = os.path.join(os.path.expanduser('~'), 'sunpy', 'data')
+
+
+def _matches(record, instrument, channel):
+    """Whether an indexed file (or remote record) was taken by `instrument` in `channel`"""
+
+    names = f"{record.get('telescope') or ''} {record.get('instrument') or ''}".lower()
+    if instrument.lower() not in names:
+        return False
+    if channel is None:
+        return True
+    if isinstance(channel, str):
+        return channel.replace('-', '_').lower() in [f.lower() for f in record.get('filters') or []]
+    return record.get('wavelength') is not None and \
+        FitsHeaderIndex.channel(record['wavelength']) == FitsHeaderIndex.channel(u.Quantity(channel, u.AA).value)
+
+
+def _filter_names(value):
+    """Normalized XRT filter names of a header or table value, e.g. 'Open/Ti-poly' -> {'open', 'ti_poly'}"""
+    return {name.replace('-', '_').lower() for name in re.split(r'[\s/,;+]+', str(value)) if name}
+
+
+def _mjd_range(start_time, end_time):
+    return Time(start_time).mjd, Time(end_time).mjd
+
+
+class DirectoryArchive:
+    """
+    ## Archive of FITS files in a directory
+
+    Serves as the local archive of `acquire`, and as a remote archive standing in for the VSO / JSOC
+    (e.g. a shared network drive, or a fake archive in tests): `search` lists its files from their
+    headers and `fetch` copies them into the local archive.
+    """
+
+    def __init__(self, directory):
+        """
+        ### Constructor for the archive
+
+        :param directory: Directory of the FITS files, created if needed
+        :type directory: str
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.index = FitsHeaderIndex(directory)
+
+    def search(self, instrument, channel, start_time, end_time):
+        """Records of the observations of an instrument and channel within a time range
+
+        :param instrument: Instrument name, e.g. 'AIA' or 'XRT'
+        :type instrument: str
+        :param channel: AIA wavelength (in Angstrom if no unit is given) or XRT filter, e.g. 'Ti-poly';
+            None for any channel
+        :type channel: int, astropy.units.Quantity, str
+        :param start_time: Start of the time range
+        :type start_time: str, astropy.time.Time
+        :param end_time: End of the time range (inclusive)
+        :type end_time: str, astropy.time.Time
+        :return: Records with the observation time ('mjd') and the file ('ref'), sorted by time
+        :rtype: list
+        """
+
+        self.index.update()
+        start, end = _mjd_range(start_time, end_time)
+        records = [{**record, 'ref': self.index.path(name)} for name, record in self.index.records.items()
+                   if record['mjd'] is not None and start <= record['mjd'] <= end
+                   and _matches(record, instrument, channel)]
+        return sorted(records, key=lambda record: record['mjd'])
+
+    def fetch(self, records, directory, max_workers=4):
+        """Copies the files of records into `directory`, `max_workers` at a time
+
+        :param records: Records from `search`
+        :type records: list
+        :param directory: Local archive directory
+        :type directory: str
+        :param max_workers: Number of concurrent copies, defaults to 4
+        :type max_workers: int, optional
+        :return: Paths of the copies
+        :rtype: list
+        """
+
+        def copy(record):
+            target = os.path.join(directory, os.path.basename(record['ref']))
+            shutil.copy2(record['ref'], f"{target}.part")
+            os.replace(f"{target}.part", target)
+            return target
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(copy, records))
+
+
+class FidoArchive:
+    """
+    ## Remote archive queried through `sunpy.net.Fido`
+
+    Search results are kept as table rows, so that only the misses of a request are downloaded.
+    """
+
+    def __init__(self, *attrs, **fetch_kwargs):
+        """
+        ### Constructor for the archive
+
+        :param attrs: Extra search attributes, e.g. `a.jsoc.Series.aia_lev1_euv_12s`, `a.jsoc.Notify(email)`
+        :type attrs: sunpy.net.attrs
+        :param fetch_kwargs: Keyword arguments of `Fido.fetch`
+        :type fetch_kwargs: dict
+        """
+
+        self.attrs = attrs
+        self.fetch_kwargs = fetch_kwargs
+
+    def search(self, instrument, channel, start_time, end_time):
+        """Search results of an instrument and channel within a time range, see `DirectoryArchive.search`"""
+
+        from sunpy.net import Fido, attrs as a
+
+        query = [a.Time(Time(start_time), Time(end_time)), *self.attrs]
+        if not any(type(attr).__name__ == 'Series' for attr in self.attrs):
+            query.append(a.Instrument(instrument))
+        if channel is not None and not isinstance(channel, str):
+            query.append(a.Wavelength(u.Quantity(channel, u.AA)))
+
+        records = []
+        for table in Fido.search(*query):
+            times = table['Start Time'] if 'Start Time' in table.colnames else table['T_REC']
+            # XRT filters are selected from the 'Filter' column of the VSO results before any download
+            if isinstance(channel, str) and 'Filter' in table.colnames:
+                selected = [_filter_names(channel) <= _filter_names(value) for value in table['Filter']]
+            else:
+                selected = [True] * len(times)
+            records += [{'mjd': parse_time(str(time)).utc.mjd, 'ref': (table, k)}
+                        for k, (time, keep) in enumerate(zip(times, selected)) if keep]
+        return sorted(records, key=lambda record: record['mjd'])
+
+    def fetch(self, records, directory, max_workers=4):
+        """Downloads the files of search results into `directory`, see `DirectoryArchive.fetch`
+
+        Rows of the same search are requested together (one export request for the JSOC), with
+        at most `max_workers` simultaneous downloads.
+
+        :return: Paths of the downloaded files
+        :rtype: list
+        """
+
+        from sunpy.net import Fido
+
+        tables = {}
+        for record in records:
+            table, k = record['ref']
+            tables.setdefault(id(table), (table, []))[1].append(k)
+
+        paths = []
+        for table, rows in tables.values():
+            files = Fido.fetch(table[rows], path=os.path.join(directory, '{file}'), max_conn=max_workers,
+                               progress=False, **self.fetch_kwargs)
+            if files.errors:
+                print(f"{len(files.errors)} downloads failed: {list(files.errors)}")
+            paths += list(files)
+        return paths
+
+
+def acquire(instrument, channel, start_time, end_time, local=LOCAL_ARCHIVE, remote=None, cadence=None,
+            tolerance=1 * u.s, max_workers=4):
+    """Local files of an instrument and channel within a time range, fetching the missing ones
+
+    With a `cadence`, the request is split into time slots and the remote archive is only searched
+    when some slot has no local file within half a cadence; otherwise the remote observations with
+    no local file within `tolerance` are missing. Missing files are fetched with at most `max_workers`
+    concurrent transfers.
+
+    :param instrument: Instrument name, e.g. 'AIA' or 'XRT'
+    :type instrument: str
+    :param channel: AIA wavelength (in Angstrom if no unit is given) or XRT filter, e.g. 'Ti-poly'
+    :type channel: int, astropy.units.Quantity, str
+    :param start_time: Start of the time range
+    :type start_time: str, astropy.time.Time
+    :param end_time: End of the time range (inclusive)
+    :type end_time: str, astropy.time.Time
+    :param local: Local archive, or its directory, defaults to `LOCAL_ARCHIVE`
+    :type local: str, DirectoryArchive, optional
+    :param remote: Remote archive, defaults to local files only
+    :type remote: DirectoryArchive, FidoArchive, optional
+    :param cadence: Expected time between observations, defaults to None
+    :type cadence: astropy.units.Quantity, optional
+    :param tolerance: Largest time difference between a remote observation and a local file
+        considered to be the same observation, defaults to 1 s
+    :type tolerance: astropy.units.Quantity, optional
+    :param max_workers: Number of concurrent downloads, defaults to 4
+    :type max_workers: int, optional
+    :return: Paths of the local files, sorted by observation time
+    :rtype: list
+    """
+
+    local = local if isinstance(local, DirectoryArchive) else DirectoryArchive(local)
+    found = local.search(instrument, channel, start_time, end_time)
+    times = np.array([record['mjd'] for record in found])
+
+    def covered(mjd, radius):
+        return times.size > 0 and np.abs(times - mjd).min() <= radius
+
+    missing = []
+    if remote is not None:
+        start, end = _mjd_range(start_time, end_time)
+        if cadence is not None:
+            step = u.Quantity(cadence, u.s).to_value(u.day)
+            slots = [mjd for mjd in np.arange(start, end + 0.5 * step, step) if not covered(mjd, 0.5 * step)]
+            if slots:
+                search_start = Time(max(start, min(slots) - 0.5 * step), format='mjd')
+                search_end = Time(min(end, max(slots) + 0.5 * step), format='mjd')
+                remote_records = remote.search(instrument, channel, search_start, search_end)
+                missing = [record for record in remote_records
+                           if not covered(record['mjd'], u.Quantity(tolerance, u.s).to_value(u.day))]
+        else:
+            remote_records = remote.search(instrument, channel, start_time, end_time)
+            missing = [record for record in remote_records
+                       if not covered(record['mjd'], u.Quantity(tolerance, u.s).to_value(u.day))]
+
+    if missing:
+        remote.fetch(missing, local.directory, max_workers=max_workers)
+        found = local.search(instrument, channel, start_time, end_time)
+
+    return [record['ref'] for record in found]
+
 
 def get_sdo_aia_data(start_time=Time('2011-03-07T18:06:04', scale='utc', format='isot'),
                      channel: int = 171,
@@ -16,31 +253,49 @@ def get_sdo_aia_data(start_time=Time('2011-03-07T18:06:04', scale='utc', format=
                      **kwargs):
 
     """
-    Downloads SDO/AIA data from JSOC database
+    Returns local SDO/AIA files, downloading the missing ones from the JSOC database
     :param start_time: Observations start time
     :param channel: AIA channel
     :param duration: Observations duration in seconds
     :param jsoc_email: email address to access JSOC database
-    :param kwargs: Optional keyword arguments
-    :return:
+    :param kwargs: Optional keyword arguments: `local` archive directory (by default files are
+        stored in the ~/sunpy/data folder), `remote` archive (by default the JSOC 12 s series),
+        `max_workers` concurrent downloads
+    :return: Paths of the local files, sorted by time
     """
 
+    remote = kwargs.get('remote', None)
+    if remote is None:
+        from sunpy.net import attrs as a
+        remote = FidoArchive(a.Sample(12*u.s), a.jsoc.Series.aia_lev1_euv_12s, a.jsoc.Notify(jsoc_email))
 
-    wavelength = channel*u.angstrom
-    query = Fido.search(
-        a.Time(start_time - 0*u.h, start_time + duration*u.s),
-        a.Wavelength(wavelength),
-        a.Sample(12*u.s),
-        a.jsoc.Series.aia_lev1_euv_12s,
-        a.jsoc.Notify(jsoc_email),
-        #a.jsoc.Segment.image,
-        #cutout,
-    )
+    start_time = Time(start_time)
+    return acquire('AIA', channel, start_time, start_time + duration*u.s,
+                   local=kwargs.get('local', LOCAL_ARCHIVE), remote=remote,
+                   cadence=kwargs.get('cadence', 12*u.s), max_workers=kwargs.get('max_workers', 4))
+
+def get_hinode_xrt_data(start_time=Time('2011-03-07T18:06:04', scale='utc', format='isot'),
+                        channel: str = 'Ti-poly',
+                        duration: int = 60,
+                        **kwargs):
+    """
+    Returns local Hinode/XRT files, downloading the missing ones through the VSO
+    :param start_time: Observations start time
+    :param channel: XRT filter, e.g. 'Ti-poly' or 'Al-mesh'
+    :param duration: Observations duration in seconds
+    :param kwargs: Optional keyword arguments: `local` archive directory, `remote` archive
+        (by default Fido searches for XRT level 1 data, keeping the results of the filter),
+        `cadence` of the filter images, which decides whether local files cover the request (60 s by default),
+        `max_workers` concurrent downloads
+    :return: Paths of the local files of the filter, sorted by time
+    """
 
-    print(query)
-    # by default files wil be downloaded to ~/sunpy/data folder
-    files = Fido.fetch(query)
-    files.sort()
+    remote = kwargs.get('remote', None)
+    if remote is None:
+        from sunpy.net import attrs as a
+        remote = FidoArchive(a.Level(1))
 
-def get_hinode_xrt_data(**kwargs):
-    pass
+    start_time = Time(start_time)
+    return acquire('XRT', channel, start_time, start_time + duration*u.s,
+                   local=kwargs.get('local', LOCAL_ARCHIVE), remote=remote,
+                   cadence=kwargs.get('cadence', 60*u.s), max_workers=kwargs.get('max_workers', 4))
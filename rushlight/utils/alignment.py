@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# FFT phase-correlation alignment of synthetic images with an observed reference image:
+# sub-pixel translation and, optionally, rotation and scale from log-polar spectra
+
+from functools import lru_cache
+
+import numpy as np
+from scipy import fft, ndimage
+
+
+@lru_cache(maxsize=8)
+def _window(shape):
+    """Separable Hann window of a given image shape"""
+    window = np.outer(np.hanning(shape[0]), np.hanning(shape[1]))
+    window.setflags(write=False)
+    return window
+
+
+def center_to_shape(image, shape):
+    """Pads (with zeros) or crops an image about its center to a given shape
+
+    :param image: Image to resize
+    :type image: numpy.ndarray
+    :param shape: Shape of the output
+    :type shape: tuple
+    :return: Resized image, and the offset (dy, dx) of its content from an exact centering: -0.5 pixels
+        along the axes where the parities of the shapes differ, 0 elsewhere
+    :rtype: tuple (numpy.ndarray, numpy.ndarray)
+    """
+
+    out = np.zeros(shape, dtype=np.result_type(image, np.float64))
+    exact = (np.subtract(shape, image.shape)) / 2
+    start = np.floor(exact).astype(int)
+    src = tuple(slice(max(0, -d), max(0, -d) + min(n_in - max(0, -d), n_out - max(0, d)))
+                for d, n_in, n_out in zip(start, image.shape, shape))
+    dst = tuple(slice(max(0, d), max(0, d) + s.stop - s.start) for d, s in zip(start, src))
+    out[dst] = image[src]
+    return out, start - exact
+
+
+def _upsampled_dft(data, region, factor, offsets):
+    """Inverse DFT of `data` on a `region`-sized grid around `offsets`, upsampled by `factor`
+
+    Matrix-multiply DFT of Guizar-Sicairos et al. (2008), only evaluating the neighbourhood of the peak.
+    """
+    for n_items, offset in zip(data.shape[::-1], offsets[::-1]):
+        kernel = np.exp(-2j * np.pi * (np.arange(region) - offset)[:, None] * fft.fftfreq(n_items, factor))
+        data = np.tensordot(kernel, data, axes=(1, -1))
+    return data
+
+
+def _normalized_product(reference_spectrum, spectrum):
+    """Normalized cross-power spectrum (phase correlation)"""
+    product = reference_spectrum * spectrum.conj()
+    product /= np.maximum(np.abs(product), 1e-30)
+    return product
+
+
+def _peak_shift(product, upsample):
+    """Sub-pixel location of the phase-correlation peak and its height
+
+    :return: Shift (dy, dx) and the peak of the correlation surface (1 for identical images)
+    :rtype: tuple (numpy.ndarray, float)
+    """
+
+    correlation = fft.ifft2(product)
+    peak = np.unravel_index(np.argmax(np.abs(correlation)), correlation.shape)
+    height = float(np.abs(correlation[peak]))
+    shape = np.array(product.shape)
+    shift = np.array(peak, dtype=np.float64)
+    shift[shift > shape // 2] -= shape[shift > shape // 2]
+
+    if upsample > 1:
+        shift = np.round(shift * upsample) / upsample
+        region = int(np.ceil(upsample * 1.5))
+        center = np.fix(region / 2.)
+        refined = _upsampled_dft(product.conj(), region, upsample, center - shift * upsample).conj()
+        peak = np.unravel_index(np.argmax(np.abs(refined)), refined.shape)
+        height = float(np.abs(refined[peak])) / product.size
+        shift = shift + (np.array(peak) - center) / upsample
+
+    return shift, height
+
+
+class PhaseCorrelator:
+    """
+    ## Phase-correlation alignment against a fixed reference image
+
+    The windowed reference spectrum (and its log-polar magnitude, for rotation and scale) is
+    computed once, so matching many candidate images against one observation costs one forward
+    FFT per candidate (plus one log-polar resampling when rotation and scale are estimated).
+    """
+
+    def __init__(self, reference, upsample=20, rotation_scale=False, log_polar_shape=None):
+        """
+        ### Constructor for the correlator
+
+        :param reference: Reference image, e.g. the observed map data
+        :type reference: numpy.ndarray
+        :param upsample: Sub-pixel precision of the shifts is 1 / `upsample` pixels, defaults to 20
+        :type upsample: int, optional
+        :param rotation_scale: Also estimate rotation and scale, defaults to False
+        :type rotation_scale: bool, optional
+        :param log_polar_shape: (angles, radii) of the log-polar resampling, defaults to the image shape
+        :type log_polar_shape: tuple, optional
+        """
+
+        self.reference = np.nan_to_num(np.asarray(reference, dtype=np.float64))
+        self.shape = self.reference.shape
+        self.upsample = int(upsample)
+        self.rotation_scale = rotation_scale
+
+        self.reference_spectrum = self._spectrum(self.reference)
+
+        if rotation_scale:
+            n_angles, n_radii = log_polar_shape or self.shape
+            radius = min(self.shape) / 2.
+            self._log_base = np.exp(np.log(radius) / n_radii)
+            angles = np.linspace(0, np.pi, n_angles, endpoint=False)
+            radii = self._log_base ** np.arange(n_radii)
+            center = np.array(self.shape) // 2
+            self._log_polar_coords = np.array([center[0] + radii[None, :] * np.sin(angles[:, None]),
+                                               center[1] + radii[None, :] * np.cos(angles[:, None])])
+            self._angles = n_angles
+            self.reference_log_polar = fft.fft2(self._log_polar(self.reference_spectrum))
+
+    def _spectrum(self, image):
+        """FFT of the windowed, mean-subtracted image"""
+        image = np.nan_to_num(np.asarray(image, dtype=np.float64))
+        if image.shape != self.shape:
+            raise ValueError(f"Image shape {image.shape} does not match the reference shape {self.shape}")
+        return fft.fft2((image - image.mean()) * _window(self.shape), workers=-1)
+
+    def _log_polar(self, spectrum):
+        """Log-polar resampling of the logarithmic magnitude spectrum"""
+        magnitude = np.log1p(np.abs(fft.fftshift(spectrum)))
+        return ndimage.map_coordinates(magnitude, self._log_polar_coords, order=1)
+
+    def shift(self, image):
+        """Translation of `image` relative to the reference
+
+        :param image: Image with the shape of the reference
+        :type image: numpy.ndarray
+        :return: Shift (dy, dx) in pixels that moves `image` onto the reference, and the correlation peak
+        :rtype: tuple (numpy.ndarray, float)
+        """
+        return _peak_shift(_normalized_product(self.reference_spectrum, self._spectrum(image)), self.upsample)
+
+    def similarity(self, image):
+        """Peak of the normalized cross-correlation with the reference over all (circular) shifts
+
+        Unlike the phase-correlation peak, which only approaches 1 for nearly identical images,
+        it degrades smoothly as the image departs from the reference and suits parameter searches.
+
+        :param image: Image with the shape of the reference
+        :type image: numpy.ndarray
+        :return: Correlation coefficient of the windowed images at the best shift, in [-1, 1]
+        :rtype: float
+        """
+
+        spectrum = self._spectrum(image)
+        correlation = fft.ifft2(self.reference_spectrum * spectrum.conj(), workers=-1).real
+        # Parseval: the energies of the windowed images from their spectra
+        norm = np.sqrt(np.sum(np.abs(self.reference_spectrum) ** 2) * np.sum(np.abs(spectrum) ** 2))
+        return float(correlation.max() * correlation.size / norm) if norm > 0 else 0.
+
+    def align(self, image):
+        """Estimates the transformation of `image` relative to the reference
+
+        :param image: Image with the shape of the reference
+        :type image: numpy.ndarray
+        :return: Dictionary with 'shift' (dy, dx) in pixels, 'rotation' in degrees (counter-clockwise),
+            'scale' and 'peak' (phase-correlation peak, a similarity measure in [0, 1])
+        :rtype: dict
+        """
+
+        rotation, scale = (0., 1.)
+        if self.rotation_scale:
+            log_polar = fft.fft2(self._log_polar(self._spectrum(image)))
+            (d_angle, d_radius), _ = _peak_shift(_normalized_product(self.reference_log_polar, log_polar),
+                                                 self.upsample)
+            rotation = -180. * d_angle / self._angles
+            scale = self._log_base ** -d_radius
+
+            # Magnitude spectra cannot tell `rotation` from `rotation + 180`: undo both about the
+            # image center and keep the one whose translation gives the higher correlation peak
+            best = None
+            for candidate in (rotation, rotation + 180. if rotation <= 0. else rotation - 180.):
+                shift, peak = self.shift(self.transform(image, candidate, scale))
+                if best is None or peak > best['peak']:
+                    best = {'shift': shift, 'rotation': candidate, 'scale': scale, 'peak': peak}
+            return best
+
+        shift, peak = self.shift(image)
+        return {'shift': shift, 'rotation': rotation, 'scale': scale, 'peak': peak}
+
+    def transform(self, image, rotation=0., scale=1., shift=(0., 0.)):
+        """Rotates and scales `image` about its center, then shifts it
+
+        :param rotation: Rotation in degrees (counter-clockwise), defaults to 0
+        :type rotation: float, optional
+        :param scale: Magnification, defaults to 1
+        :type scale: float, optional
+        :param shift: Shift (dy, dx) in pixels, defaults to (0, 0)
+        :type shift: tuple, optional
+        :return: Transformed image, e.g. `image` aligned with the reference using the output of `align`
+        :rtype: numpy.ndarray
+        """
+
+        theta = np.radians(rotation)
+        # Output -> input coordinates for ndimage.affine_transform, (y, x) order
+        matrix = np.array([[np.cos(theta), np.sin(theta)], [-np.sin(theta), np.cos(theta)]]) / scale
+        center = (np.array(self.shape) - 1) / 2.
+        offset = center - matrix @ (center + np.asarray(shift))
+        return ndimage.affine_transform(np.nan_to_num(image), matrix, offset=offset, order=1)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# Simulation box outline for context plots: corners and edges are held as arrays and transformed
+# to a target frame in a single coordinate transformation, cached per frame
+
+import itertools
+
+import numpy as np
+
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from sunpy.coordinates import Helioprojective, HeliographicStonyhurst
+from sunpy.map import make_fitswcs_header
+
+
+class Box:
+    """
+    ## 3D box in solar or observer coordinates, defined by its origin, center, dimensions and resolution
+
+    The 8 corners are stored as a (8, 3) Quantity of offsets from the box center and the 12 edges
+    as a (12, 2, 3) Quantity of corner pairs; the edges are kept as one (12, 2) `SkyCoord`, so that
+    drawing the box on a map takes a single `transform_to` call. Transformed edges are cached for
+    the last `TRANSFORM_CACHE_SIZE` target frames (`transform_edges`), which makes redrawing the box
+    on the same frame free. `bottom_edges`, `non_bottom_edges` and `all_edges` are lists of two-point
+    `SkyCoord` edges, as before; `edge_coords` holds all of them as one (12, 2) `SkyCoord`.
+
+    :param frame_obs: The observer's frame of reference as a `SkyCoord` object.
+    :param box_origin: The origin point of the box in the specified coordinate frame as a `SkyCoord`.
+    :param box_center: The geometric center of the box as a `SkyCoord`.
+    :param box_dims: The dimensions of the box specified as an `astropy.units.Quantity` array-like in the order (x, y, z).
+    :param box_res: The resolution of the box, given as an `astropy.units.Quantity` typically in units of megameters.
+
+    Attributes
+    ----------
+    corners : `~astropy.units.Quantity`
+        Corner offsets from the box center, of shape (8, 3).
+    edges : `~astropy.units.Quantity`
+        Pairs of corners differing in exactly one dimension, of shape (12, 2, 3).
+    bottom : numpy.ndarray
+        Boolean mask of the edges lying in the bottom face of the box.
+    edge_coords : `~astropy.coordinates.SkyCoord`
+        Edges in the frame of the box center, of shape (12, 2).
+
+    Example
+    -------
+    >>> from astropy.coordinates import SkyCoord
+    >>> from astropy.time import Time
+    >>> import astropy.units as u
+    >>> time = Time('2024-05-09T17:12:00')
+    >>> box_origin = SkyCoord(450 * u.arcsec, -256 * u.arcsec, obstime=time, observer="earth", frame='helioprojective')
+    >>> box_center = SkyCoord(500 * u.arcsec, -200 * u.arcsec, obstime=time, observer="earth", frame='helioprojective')
+    >>> box_dims = u.Quantity([100, 100, 50], u.Mm)
+    >>> box_res = 1.4 * u.Mm
+    >>> box = Box(frame_obs=box_origin.frame, box_origin=box_origin, box_center=box_center, box_dims=box_dims, box_res=box_res)
+    >>> print(box.bounds_coords_bl_tr())
+    """
+
+    # Number of target frames whose transformed edges are kept (e.g. the maps of an observer pair)
+    TRANSFORM_CACHE_SIZE = 4
+
+    def __init__(self, frame_obs, box_origin, box_center, box_dims, box_res):
+        '''
+        ### Initializes the Box instance with origin, dimensions, and computes the corners and edges.
+
+        :param box_center: SkyCoord, the origin point of the box in a given coordinate frame.
+        :param box_dims: u.Quantity, the dimensions of the box (x, y, z) in specified units. x and y are in the solar frame, z is the height above the solar surface.
+        '''
+        self._frame_obs = frame_obs
+        with Helioprojective.assume_spherical_screen(frame_obs.observer):
+            self._origin = box_origin
+            self._center = box_center
+        self._dims = box_dims
+        self._res = box_res
+        self._dims_pix = np.int_(np.round(self._dims / self._res.to(self._dims.unit)))
+
+        # Corner offsets, and edges as the pairs of corners differing by exactly one dimension
+        signs = np.array(list(itertools.product([-1, 1], repeat=3)))
+        self.corners = signs * self._dims / 2
+        first, second = np.triu_indices(len(signs), k=1)
+        along = np.count_nonzero(signs[first] != signs[second], axis=-1) == 1
+        self._edge_corners = np.stack([first[along], second[along]], axis=-1)
+        self.edges = self.corners[self._edge_corners]
+        self.bottom = np.all(signs[self._edge_corners][..., 2] < 0, axis=-1)
+
+        self.edge_coords = self._get_edge_coords(self.edges, self._center)
+        self._transformed = []  # (frame, edges transformed to the frame)
+        self.b3dtype = ['lfff', 'nlfff']
+        self.b3d = {b3dtype: None for b3dtype in self.b3dtype}
+
+    @property
+    def dims_pix(self):
+        return self._dims_pix
+
+    @property
+    def grid_coords(self):
+        return self._get_grid_coords(self._center)
+
+    def _get_grid_coords(self, grid_center):
+        grid_coords = {}
+        grid_coords['x'] = np.linspace(grid_center.x.to(self._dims.unit) - self._dims[0] / 2,
+                                        grid_center.x.to(self._dims.unit) + self._dims[0] / 2, self._dims_pix[0])
+        grid_coords['y'] = np.linspace(grid_center.y.to(self._dims.unit) - self._dims[1] / 2,
+                                        grid_center.y.to(self._dims.unit) + self._dims[1] / 2, self._dims_pix[1])
+        grid_coords['z'] = np.linspace(grid_center.z.to(self._dims.unit) - self._dims[2] / 2,
+                                        grid_center.z.to(self._dims.unit) + self._dims[2] / 2, self._dims_pix[2])
+        grid_coords['frame'] = self._frame_obs
+        return grid_coords
+
+    def _get_edge_coords(self, edges, box_center):
+        """
+        Translates edge corner offsets to their corresponding SkyCoord based on the box's center.
+
+        :param edges: Corner offsets of the edges, of shape (n_edges, 2, 3).
+        :type edges: `~astropy.units.Quantity`
+        :param box_center: The center of the box in the specified coordinate frame as a `SkyCoord`.
+        :type box_center: `~astropy.coordinates.SkyCoord`
+        :return: Coordinates of the edges in the box's frame, of shape (n_edges, 2).
+        :rtype: `~astropy.coordinates.SkyCoord`
+        """
+        return SkyCoord(x=box_center.x + edges[..., 0],
+                        y=box_center.y + edges[..., 1],
+                        z=box_center.z + edges[..., 2],
+                        frame=box_center.frame)
+
+    def transform_edges(self, frame):
+        """
+        Edges transformed to a frame, in one transformation that is cached for equivalent frames
+        (the last `TRANSFORM_CACHE_SIZE` frames are kept).
+
+        :param frame: Target frame, e.g. the `coordinate_frame` of a map.
+        :type frame: `~astropy.coordinates.BaseCoordinateFrame`
+        :return: Coordinates of the edges in `frame`, of shape (n_edges, 2); the rows of `bottom`
+            are the bottom edges.
+        :rtype: `~astropy.coordinates.SkyCoord`
+        """
+        for k, (cached_frame, edges) in enumerate(self._transformed):
+            if cached_frame.is_equivalent_frame(frame):
+                self._transformed.append(self._transformed.pop(k))
+                return edges
+        edges = self.edge_coords.transform_to(frame)
+        self._transformed.append((frame, edges))
+        # Least recently used frames first
+        del self._transformed[:-self.TRANSFORM_CACHE_SIZE]
+        return edges
+
+    def _get_bottom_cea_header(self):
+        """
+        Generates a CEA header for the bottom of the box.
+
+        :return: The FITS WCS header for the bottom of the box.
+        :rtype: dict
+        """
+        origin = self._origin.transform_to(HeliographicStonyhurst)
+        shape = self._dims[:-1][::-1] / self._res.to(self._dims.unit)
+        shape = list(shape.value)
+        shape = [int(np.ceil(s)) for s in shape]
+        rsun = origin.rsun.to(self._res.unit)
+        scale = np.arcsin(self._res / rsun).to(u.deg) / u.pix
+        scale = u.Quantity((scale, scale))
+        bottom_cea_header = make_fitswcs_header(shape, origin,
+                                                 scale=scale, projection_code='CEA')
+        bottom_cea_header['OBSRVTRY'] = str(origin.observer)
+        return bottom_cea_header
+
+    def _get_bounds_coords(self, mask, bltr=False, pad_frac=0.0):
+        """
+        Provides the bounding box of the edges in solar x and y.
+
+        :param mask: Boolean mask (or indices) of the edges to bound.
+        :type mask: numpy.ndarray
+        :param bltr: If True, returns bottom left and top right coordinates, otherwise returns minimum and maximum coordinates.
+        :type bltr: bool, optional
+        :param pad_frac: Fractional padding applied to each side of the box, expressed as a decimal, defaults to 0.0.
+        :type pad_frac: float, optional
+
+        :return: Coordinates of the box's bounds.
+        :rtype: list of `~astropy.coordinates.SkyCoord`
+        """
+        edges = self.transform_edges(self._frame_obs)[mask]
+        unit = edges.Tx.unit
+        xx = edges.Tx.to_value(unit)
+        yy = edges.Ty.to_value(unit)
+        min_x = np.min(xx)
+        max_x = np.max(xx)
+        min_y = np.min(yy)
+        max_y = np.max(yy)
+        if pad_frac > 0:
+            _pad = pad_frac * np.max([max_x - min_x, max_y - min_y, 20])
+            min_x -= _pad
+            max_x += _pad
+            min_y -= _pad
+            max_y += _pad
+        if bltr:
+            bottom_left = SkyCoord(min_x * unit, min_y * unit, frame=self._frame_obs)
+            top_right = SkyCoord(max_x * unit, max_y * unit, frame=self._frame_obs)
+            return [bottom_left, top_right]
+        else:
+            coords = SkyCoord(Tx=[min_x, max_x] * unit, Ty=[min_y, max_y] * unit,
+                                frame=self._frame_obs)
+            return coords
+
+    def bounds_coords_bl_tr(self, pad_frac=0.0):
+        """
+        Calculates and returns the bottom left and top right coordinates of the box in the observer frame.
+        Optionally applies a padding factor to expand the box dimensions symmetrically.
+
+        :param pad_frac: Fractional padding applied to each side of the box, expressed as a decimal, defaults to 0.0.
+        :type pad_frac: float, optional
+        :return: Bottom left and top right coordinates of the box in the observer frame.
+        :rtype: list of `~astropy.coordinates.SkyCoord`
+        """
+        return self._get_bounds_coords(slice(None), bltr=True, pad_frac=pad_frac)
+
+    @property
+    def bounds_coords(self):
+        """
+        Provides access to the box's bounds in the observer frame.
+
+        :return: Coordinates of the box's bounds.
+        :rtype: `~astropy.coordinates.SkyCoord`
+        """
+        return self._get_bounds_coords(slice(None))
+
+    @property
+    def bottom_bounds_coords(self):
+        """
+        Provides access to the box's bottom bounds in the observer frame.
+
+        :return: Coordinates of the box's bottom bounds.
+        :rtype: `~astropy.coordinates.SkyCoord`
+        """
+        return self._get_bounds_coords(self.bottom)
+
+    @property
+    def bottom_cea_header(self):
+        """
+        Provides access to the box's bottom WCS CEA header.
+
+        :return: The WCS CEA header for the box's bottom.
+        :rtype: dict
+        """
+        return self._get_bottom_cea_header()
+
+    @property
+    def bottom_edges(self):
+        """
+        Provides access to the box's bottom edge coordinates.
+
+        :return: Coordinates of the box's bottom edges, one two-point `SkyCoord` per edge.
+        :rtype: list of `~astropy.coordinates.SkyCoord`
+        """
+        return list(self.edge_coords[self.bottom])
+
+    @property
+    def non_bottom_edges(self):
+        """
+        Provides access to the box's non-bottom edge coordinates.
+
+        :return: Coordinates of the box's non-bottom edges, one two-point `SkyCoord` per edge.
+        :rtype: list of `~astropy.coordinates.SkyCoord`
+        """
+        return list(self.edge_coords[~self.bottom])
+
+    @property
+    def all_edges(self):
+        """
+        Provides access to all the edge coordinates of the box, bottom edges first.
+
+        :return: Coordinates of all the edges of the box, one two-point `SkyCoord` per edge.
+        :rtype: list of `~astropy.coordinates.SkyCoord`
+        """
+        return list(self.edge_coords[np.argsort(~self.bottom, kind='stable')])
+
+    @property
+    def box_origin(self):
+        """
+        Provides read-only access to the box's origin coordinates.
+
+        :return: The origin of the box in the specified frame.
+        :rtype: `~astropy.coordinates.SkyCoord`
+        """
+        return self._center
+
+    @property
+    def box_dims(self):
+        """
+        Provides read-only access to the box's dimensions.
+
+        :return: The dimensions of the box (length, width, height) in specified units.
+        :rtype: `~astropy.units.Quantity`
+        """
+        return self._dims
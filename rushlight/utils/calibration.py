@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# On-disk cache of calibrated (level 1.5) AIA maps, keyed by the hash of the input file and of
+# the calibration settings, so that raw level 1 files are only processed once
+
+import fnmatch
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import sunpy.map
+
+# aiapy calibration steps, in the order of the level 1 -> 1.5 pipeline
+AIA_STEPS = ('pointing', 'register', 'degradation', 'exposure')
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 digest of a file, read in chunks
+
+    :param path: Path of the file
+    :type path: str
+    :return: Hexadecimal digest
+    :rtype: str
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=8)
+def _read_table(path):
+    """Calibration table (pointing or degradation) from a local file, read once per process"""
+    from astropy.table import QTable
+    return QTable.read(path)
+
+
+def _aiapy_step(name, settings):
+    """aiapy function applying the calibration step `name` with local tables"""
+
+    try:
+        from aiapy.calibrate import update_pointing, register, correct_degradation, normalize_exposure
+    except ImportError as err:
+        raise ImportError("aiapy is required for the AIA calibration steps, see https://aiapy.readthedocs.io") from err
+
+    if name == 'pointing':
+        table = _read_table(settings['pointing_table']) if settings['pointing_table'] else None
+        return lambda smap: update_pointing(smap, pointing_table=table)
+    if name == 'register':
+        return register
+    if name == 'degradation':
+        table = _read_table(settings['correction_table']) if settings['correction_table'] else None
+        kwargs = {'correction_table': table}
+        if settings['calibration_version'] is not None:
+            kwargs['calibration_version'] = settings['calibration_version']
+        return lambda smap: correct_degradation(smap, **kwargs)
+    if name == 'exposure':
+        return normalize_exposure
+    raise ValueError(f"Unknown calibration step '{name}', expected one of {AIA_STEPS}")
+
+
+def _calibrate(task):
+    """Calibrates one file and writes the result atomically (run in the worker processes)"""
+
+    path, output, steps, settings = task
+    smap = sunpy.map.Map(path)
+    for step in steps:
+        smap = (_aiapy_step(step, settings) if isinstance(step, str) else step)(smap)
+
+    temporary = f"{output}.{os.getpid()}.tmp"
+    smap.save(temporary, filetype='fits', overwrite=True)
+    os.replace(temporary, output)
+    return output
+
+
+class CalibrationCache:
+    """
+    ## Cache of calibrated maps
+
+    The output of a file is stored as `<name>_lev15_<key>.fits` in `cache_dir`, where the key hashes
+    the content of the input file, the calibration steps and settings, the content of the local
+    pointing and degradation tables and the aiapy version; files whose output exists are not
+    processed again. The hashes of the inputs are kept by size and modification time, so unchanged
+    files are only read once per cache object. Supplying the tables (e.g. saved from `aiapy.calibrate.util.get_pointing_table`
+    and `get_correction_table`) keeps the calibration offline and reproducible.
+    """
+
+    def __init__(self, cache_dir, steps=AIA_STEPS, pointing_table=None, correction_table=None,
+                 calibration_version=None):
+        """
+        ### Constructor for the calibration cache
+
+        :param cache_dir: Directory of the calibrated files, created if needed
+        :type cache_dir: str
+        :param steps: Calibration steps, names of `AIA_STEPS` or functions mapping a sunpy map to
+            a calibrated map (picklable for parallel processing), defaults to all aiapy steps
+        :type steps: tuple, optional
+        :param pointing_table: Local pointing table file (e.g. ECSV) for `update_pointing`, defaults to None
+        :type pointing_table: str, optional
+        :param correction_table: Local degradation table file for `correct_degradation`, defaults to None
+        :type correction_table: str, optional
+        :param calibration_version: Version of the degradation calibration, defaults to the aiapy default
+        :type calibration_version: int, optional
+        """
+
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.steps = tuple(steps)
+        self.settings = {'pointing_table': pointing_table, 'correction_table': correction_table,
+                         'calibration_version': calibration_version}
+        self.stats = {'calibrated': 0, 'cached': 0}
+        self._settings_key = None
+        self._hashes = {}
+
+    @property
+    def settings_key(self):
+        """Hash of the calibration steps, settings and tables"""
+
+        if self._settings_key is None:
+            try:
+                import aiapy
+                version = aiapy.__version__
+            except ImportError:
+                version = None
+            description = {'steps': [step if isinstance(step, str) else f"{step.__module__}.{step.__qualname__}"
+                                     for step in self.steps],
+                           'calibration_version': self.settings['calibration_version'],
+                           'aiapy': version if any(isinstance(step, str) for step in self.steps) else None}
+            for name in ('pointing_table', 'correction_table'):
+                path = self.settings[name]
+                description[name] = file_hash(path) if path else None
+            self._settings_key = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+        return self._settings_key
+
+    def input_hash(self, path):
+        """Hash of the content of an input file, read again only if its size or modification time changed
+
+        :param path: Level 1 file
+        :type path: str
+        :rtype: str
+        """
+
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self._hashes:
+            self._hashes[key] = file_hash(path)
+        return self._hashes[key]
+
+    def output_path(self, path):
+        """Path of the calibrated version of `path` in the cache
+
+        :param path: Level 1 file
+        :type path: str
+        :rtype: str
+        """
+
+        key = hashlib.sha256((self.input_hash(path) + self.settings_key).encode()).hexdigest()[:16]
+        name, extension = os.path.splitext(os.path.basename(path))
+        if extension.lower() == '.gz':
+            name = os.path.splitext(name)[0]
+        return os.path.join(self.cache_dir, f"{name}_lev15_{key}.fits")
+
+    def calibrate(self, paths, workers=None):
+        """Calibrated versions of files, processing only those missing from the cache
+
+        :param paths: Level 1 files
+        :type paths: list
+        :param workers: Number of worker processes, defaults to serial processing
+        :type workers: int, optional
+        :return: Paths of the calibrated files, in the order of `paths`
+        :rtype: list
+        """
+
+        if workers and workers > 1 and len(paths) > 1:
+            # Inputs new to the cache are hashed concurrently (hashlib releases the GIL)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(self.input_hash, paths))
+        outputs = [self.output_path(path) for path in paths]
+        tasks = [(path, output, self.steps, self.settings) for path, output in zip(paths, outputs)
+                 if not os.path.exists(output)]
+        tasks = list({task[1]: task for task in tasks}.values())  # duplicated inputs are processed once
+
+        if workers and workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+                for _ in pool.imap_unordered(_calibrate, tasks):
+                    pass
+        else:
+            for task in tasks:
+                _calibrate(task)
+
+        self.stats = {'calibrated': len(tasks), 'cached': len(paths) - len(tasks)}
+        return outputs
+
+    def calibrate_directory(self, directory, patterns=('*.fits', '*.fts'), workers=None):
+        """Calibrated versions of the files of a directory, see `calibrate`
+
+        :param directory: Directory of the level 1 files
+        :type directory: str
+        :param patterns: File name patterns of the level 1 files, defaults to .fits and .fts
+        :type patterns: tuple, optional
+        :param workers: Number of worker processes, defaults to serial processing
+        :type workers: int, optional
+        :return: Paths of the calibrated files, in the order of the sorted input file names
+        :rtype: list
+        """
+
+        paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                       if any(fnmatch.fnmatch(name, pattern) for pattern in patterns))
+        return self.calibrate(paths, workers=workers)
+
+    def maps(self, paths, workers=None):
+        """Calibrated maps of files, see `calibrate`
+
+        :return: Calibrated maps, in the order of `paths`
+        :rtype: list
+        """
+        return [sunpy.map.Map(output) for output in self.calibrate(paths, workers=workers)]
@@ -5,9 +5,9 @@ import pathlib
 
 import numpy as np
 
-import yt
-from yt.data_objects.selection_objects.region import YTRegion
-yt.set_log_level(50)
+from rushlight.utils.lazy import lazy_import
+
+yt = lazy_import('yt', setup=lambda module: module.set_log_level(50))
 
 
 class Dcube(ABC):
@@ -155,7 +155,7 @@ class Dcube(ABC):
                                         fields=[("gas", "temperature"), ("stream", "density")])
                 dataset = yt.load("test.h5")
 
-        if isinstance(dataset, YTRegion):
+        if isinstance(dataset, yt.data_objects.selection_objects.region.YTRegion):
             self.box = dataset
             self.data = self.box.ds
             self.domain_width = np.abs(self.box.right_edge - self.box.left_edge).in_units('cm').to_astropy() #TODO generalize this cm parameter
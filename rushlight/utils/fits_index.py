@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# Persistent index of the headers of a local FITS archive: files are matched by telescope,
+# wavelength and observation time without loading their data as sunpy maps
+
+import bisect
+import fnmatch
+import itertools
+import json
+import os
+from collections import defaultdict
+
+from astropy.io import fits
+from astropy.time import Time
+
+# Channels treated as the same wavelength when pairing instruments (STEREO/EUVI 195 with AIA 193)
+WAVELENGTH_ALIASES = {195: 193}
+
+# File name of the index written into the indexed directory
+INDEX_NAME = '.fits_index.json'
+
+
+def _number(value):
+    """Header value as a float, or None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_header_record(path):
+    """Reads the indexed keywords of a FITS file, without reading its data
+
+    The first HDU containing an image is used (the primary HDU of compressed files is empty).
+
+    :param path: Path of the FITS file
+    :type path: str
+    :return: Telescope, instrument, wavelength, DATE-OBS (and its MJD), filters and observer location
+    :rtype: dict
+    """
+
+    with fits.open(path, lazy_load_hdus=True) as hdul:
+        header = hdul[0].header
+        for hdu in hdul:
+            if hdu.header.get('NAXIS', 0) > 0:
+                header = hdu.header
+                break
+
+        date_obs = header.get('DATE-OBS', header.get('DATE_OBS', None))
+        try:
+            mjd = float(Time(date_obs).mjd) if date_obs else None
+        except ValueError:
+            mjd = None
+
+        return {'telescope': header.get('TELESCOP', None),
+                'instrument': header.get('INSTRUME', None),
+                'wavelength': _number(header.get('WAVELNTH', None)),
+                'date_obs': date_obs,
+                'mjd': mjd,
+                # XRT filter wheel positions, identifying its channels (no WAVELNTH keyword)
+                'filters': [header[key] for key in ('EC_FW1_', 'EC_FW2_') if key in header],
+                'observer': {key.lower(): _number(header.get(key, None))
+                             for key in ('HGLN_OBS', 'HGLT_OBS', 'DSUN_OBS')}}
+
+
+class FitsHeaderIndex:
+    """
+    ## Header index of the FITS files in a directory
+
+    The index is stored in the directory (`INDEX_NAME`) and `update` only reads the headers of files
+    that are new or changed (size or modification time) since the last scan. Files are grouped by
+    wavelength, so pairs of instruments are matched in linear time, and the files of every
+    (wavelength, telescope) group are sorted by time for nearest-in-time matching.
+    """
+
+    def __init__(self, directory, patterns=('*.fits', '*.fts', '*.fits.gz', '*.fts.gz'), index_path=None,
+                 update=True):
+        """
+        ### Constructor, loading the stored index of `directory`
+
+        :param directory: Directory containing the FITS files
+        :type directory: str
+        :param patterns: File name patterns of the indexed files, defaults to .fits and .fts (gzipped or not)
+        :type patterns: tuple, optional
+        :param index_path: Path of the stored index, defaults to `INDEX_NAME` in `directory`; the index
+            of a directory that cannot be written to is kept in memory
+        :type index_path: str, optional
+        :param update: Scan the directory for changes, defaults to True
+        :type update: bool, optional
+        """
+
+        self.directory = os.path.abspath(directory)
+        self.patterns = patterns
+        self.index_path = index_path or os.path.join(self.directory, INDEX_NAME)
+        self.records = {}
+        self._groups, self._undated = (None, None)
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    self.records = json.load(f)
+            except (ValueError, OSError):
+                self.records = {}
+        if update:
+            self.update()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, path):
+        """Record of a file, by path or by name within the directory"""
+        return self.records[os.path.basename(path)]
+
+    def path(self, name):
+        """Full path of an indexed file"""
+        return os.path.join(self.directory, name)
+
+    def update(self):
+        """Indexes new and changed files and forgets removed ones, saving the index if it changed
+
+        :return: Number of headers read
+        :rtype: int
+        """
+
+        found = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and any(fnmatch.fnmatch(entry.name, pattern) for pattern in self.patterns):
+                stat = entry.stat()
+                found[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+        changed, n_read = (set(self.records) - set(found), 0)
+        for name in changed:
+            del self.records[name]
+
+        for name, (size, mtime) in found.items():
+            record = self.records.get(name)
+            if record is None or record['size'] != size or record['mtime_ns'] != mtime:
+                try:
+                    record = read_header_record(self.path(name))
+                except OSError as err:
+                    print(f"Skipping unreadable FITS file {name}: {err}")
+                    continue
+                self.records[name] = {**record, 'size': size, 'mtime_ns': mtime}
+                changed.add(name)
+                n_read += 1
+
+        if changed:
+            self._groups, self._undated = (None, None)
+            self.save()
+        return n_read
+
+    def save(self):
+        """Writes the index next to the files (atomically, so concurrent readers see a complete index)
+
+        If the index cannot be written (e.g. a read-only archive), it is only kept in memory.
+
+        :return: Whether the index was written
+        :rtype: bool
+        """
+
+        temporary = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, 'w') as f:
+                json.dump(self.records, f)
+            os.replace(temporary, self.index_path)
+        except OSError as err:
+            print(f"Keeping the index of {self.directory} in memory, it cannot be saved: {err}")
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return False
+        return True
+
+    @staticmethod
+    def channel(wavelength):
+        """Wavelength used to group files, with `WAVELENGTH_ALIASES` applied"""
+        if wavelength is None:
+            return None
+        wavelength = int(round(wavelength))
+        return WAVELENGTH_ALIASES.get(wavelength, wavelength)
+
+    def groups(self):
+        """Files grouped by channel and telescope, each group sorted by observation time
+
+        Files without an observation time (DATE-OBS) are left out of the groups, so that they are
+        never matched in time; `pairs` still pairs them by channel.
+
+        :return: Channel -> telescope -> (sorted MJDs, file names)
+        :rtype: dict
+        """
+
+        if self._groups is None:
+            groups = defaultdict(lambda: defaultdict(list))
+            undated = defaultdict(lambda: defaultdict(list))
+            for name in sorted(self.records):
+                record = self.records[name]
+                channel = self.channel(record['wavelength'])
+                if record['mjd'] is None:
+                    undated[channel][record['telescope']].append(name)
+                else:
+                    groups[channel][record['telescope']].append((record['mjd'], name))
+            self._groups = {channel: {telescope: tuple(map(list, zip(*sorted(files))))
+                                      for telescope, files in by_telescope.items()}
+                            for channel, by_telescope in groups.items()}
+            self._undated = {channel: dict(by_telescope) for channel, by_telescope in undated.items()}
+        return self._groups
+
+    def pairs(self, wavelength=None):
+        """Pairs of files with different telescopes and equal channels
+
+        Replaces the pairwise comparison of `find_matching_fits`: files are grouped by channel and
+        telescope in one pass, and only the pairs across telescope groups are generated.
+
+        :param wavelength: Only pair files of this channel, defaults to all channels
+        :type wavelength: float, optional
+        :return: Pairs of file paths, sorted by file name
+        :rtype: list
+        """
+
+        groups = self.groups()
+        channels = set(groups) | set(self._undated) if wavelength is None else [self.channel(wavelength)]
+        matches = []
+        for channel in channels:
+            by_telescope = defaultdict(list, {telescope: list(names)
+                                              for telescope, (_, names) in groups.get(channel, {}).items()})
+            for telescope, names in self._undated.get(channel, {}).items():
+                by_telescope[telescope] += names
+            for telescope1, telescope2 in itertools.combinations(sorted(by_telescope, key=str), 2):
+                for name1 in by_telescope[telescope1]:
+                    for name2 in by_telescope[telescope2]:
+                        matches.append(tuple(self.path(name) for name in sorted((name1, name2))))
+        return sorted(matches)
+
+    def nearest(self, path, telescope=None, tolerance=None):
+        """File of the same channel observed closest in time to `path` by another telescope
+
+        :param path: Indexed file
+        :type path: str
+        :param telescope: Telescope of the match, defaults to any telescope other than that of `path`
+        :type telescope: str, optional
+        :param tolerance: Largest time difference, as an astropy Quantity or in seconds, defaults to no limit
+        :type tolerance: astropy.units.Quantity, float, optional
+        :return: Path of the closest file, or None if there is none within the tolerance
+        :rtype: str
+        """
+
+        record = self[path]
+        if record['mjd'] is None:
+            return None
+        by_telescope = self.groups().get(self.channel(record['wavelength']), {})
+        telescopes = [telescope] if telescope else [t for t in by_telescope if t != record['telescope']]
+        limit = float('inf') if tolerance is None else _seconds(tolerance) / 86400.
+
+        best, best_dt = (None, limit)
+        for t in telescopes:
+            if t not in by_telescope:
+                continue
+            times, names = by_telescope[t]
+            k = bisect.bisect_left(times, record['mjd'])
+            for j in (k - 1, k):
+                if 0 <= j < len(times) and abs(times[j] - record['mjd']) <= best_dt:
+                    best, best_dt = (names[j], abs(times[j] - record['mjd']))
+        return self.path(best) if best else None
+
+    def time_pairs(self, telescope1, telescope2, tolerance=None, wavelength=None):
+        """Files of `telescope1` matched with the closest file of `telescope2` in time, per channel
+
+        :param tolerance: Largest time difference, as an astropy Quantity or in seconds, defaults to no limit
+        :type tolerance: astropy.units.Quantity, float, optional
+        :param wavelength: Only pair files of this channel, defaults to all channels
+        :type wavelength: float, optional
+        :return: Pairs of file paths
+        :rtype: list
+        """
+
+        channels = self.groups() if wavelength is None else [self.channel(wavelength)]
+        matches = []
+        for channel in channels:
+            files = self.groups().get(channel, {}).get(telescope1, ([], []))[1]
+            for name in files:
+                match = self.nearest(name, telescope=telescope2, tolerance=tolerance)
+                if match:
+                    matches.append((self.path(name), match))
+        return matches
+
+
+def _seconds(tolerance):
+    """Tolerance in seconds"""
+    try:
+        return float(tolerance.to_value('s'))
+    except AttributeError:
+        return float(tolerance)
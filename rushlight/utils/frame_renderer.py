@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# Frame renderer for comparison movies: the figure and its artists are built once per process,
+# and every frame only updates the image data, overlays and titles before being written out
+
+import os
+import threading
+
+import numpy as np
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from rushlight.utils.worker_pool import imap_shared
+
+
+def _pixels(overlay, smap):
+    """Pixel coordinates of an overlay: a SkyCoord (converted with the WCS of `smap`) or (x, y) arrays
+
+    Overlays of shape (n_segments, n_points), e.g. `Box.transform_edges`, and lists of SkyCoords
+    (e.g. the contours of `sunpy.map.GenericMap.contour`) are joined into one line broken by NaNs.
+    """
+
+    if isinstance(overlay, list):
+        if not overlay:
+            return [], []
+        pixels = [_pixels(segment, smap) for segment in overlay]
+        return tuple(np.concatenate([np.append(p[axis], np.nan) for p in pixels]) for axis in range(2))
+    if hasattr(overlay, 'frame'):
+        x, y = smap.wcs.world_to_pixel(overlay)
+    else:
+        x, y = overlay
+    x, y = (np.asarray(v, dtype=np.float64) for v in (x, y))
+    if x.ndim > 1:
+        gap = np.full(x.shape[:-1] + (1,), np.nan)
+        x, y = (np.concatenate([v, gap], axis=-1).ravel() for v in (x, y))
+    return x, y
+
+
+# Overlay settings matching the static plots of `rushlight.user_notebooks.aiastereo`
+# (`plot_edges`, `plot_los`, `plot_ribbon`), for the panels built by `map_panel`
+OVERLAY_STYLES = {
+    'box_bottom': {'color': 'blue', 'linewidth': 2, 'alpha': 0.6},
+    'box': {'color': 'blue', 'linewidth': 2, 'alpha': 0.4},
+    'los': {'color': 'r', 'linewidth': 2},
+    'ribbon': {'color': 'c'},
+}
+
+
+def map_panel(smap, box=None, los=None, contours=None, **kwargs):
+    """Panel of a frame showing a map with the overlays of the static comparison plots
+
+    :param smap: Map of the panel
+    :type smap: sunpy.map.GenericMap
+    :param box: Simulation box whose edges are drawn, transformed once per map frame, defaults to None
+    :type box: rushlight.utils.box.Box, optional
+    :param los: Line of sight, e.g. returned by `plot_los`, defaults to None
+    :type los: astropy.coordinates.SkyCoord, optional
+    :param contours: Ribbon contours, e.g. returned by `plot_ribbon`, defaults to None
+    :type contours: list, optional
+    :param kwargs: Other panel entries ('title', 'clim')
+    :return: Panel with the overlays named as in `OVERLAY_STYLES`
+    :rtype: dict
+    """
+
+    overlays = {}
+    if box is not None:
+        edges = box.transform_edges(smap.coordinate_frame)
+        overlays['box_bottom'], overlays['box'] = (edges[box.bottom], edges[~box.bottom])
+    if los is not None:
+        overlays['los'] = los
+    if contours is not None:
+        overlays['ribbon'] = list(contours)
+    return dict(kwargs, map=smap, overlays=overlays)
+
+
+class FrameRenderer:
+    """
+    ## Renderer of comparison frames from one reusable figure
+
+    The figure holds one image panel per map (synthetic, observed, ...), drawn in pixel coordinates,
+    with one line artist per named overlay. `draw` only replaces the image data, color limits,
+    overlay data and titles, so that the cost of a frame is that of rasterizing it. The figure is
+    attached to an Agg canvas directly, independently of the pyplot backend.
+
+    A frame is a dictionary with the 'panels' (or a list of panels) and an optional 'title'. Each
+    panel is a dictionary with:
+
+    - 'map': sunpy map or 2D array
+    - 'title': panel title, optional
+    - 'clim': (vmin, vmax) of the image, defaults to the limits of the panel settings, or to the data range
+    - 'overlays': name -> SkyCoord (requires a map) or (x, y) pixel coordinates, optional
+    """
+
+    def __init__(self, panels=2, overlays=None, figsize=None, dpi=100, cmap='inferno'):
+        """
+        ### Constructor, the figure is built on the first frame
+
+        :param panels: Number of panels, or a list of `imshow` settings (cmap, norm, vmin, vmax, ...) per panel
+        :type panels: int, list
+        :param overlays: Overlay name -> `plot` settings (color, linewidth, ...), defaults to no overlays
+        :type overlays: dict, optional
+        :param figsize: Figure size in inches, defaults to 5 x 5 inches per panel
+        :type figsize: tuple, optional
+        :param dpi: Resolution of the written frames, defaults to 100
+        :type dpi: int, optional
+        :param cmap: Colormap of the panels without their own, defaults to 'inferno'
+        :type cmap: str, optional
+        """
+
+        self.panels = [{} for _ in range(panels)] if isinstance(panels, int) else [dict(p) for p in panels]
+        for settings in self.panels:
+            settings.setdefault('cmap', cmap)
+        self.overlays = dict(overlays or {})
+        self.figsize = figsize or (5. * len(self.panels), 5.)
+        self.dpi = dpi
+        self._figure = None
+
+    def copy(self):
+        """Renderer with the same settings and its own figure"""
+        return FrameRenderer(self.panels, self.overlays, self.figsize, self.dpi)
+
+    def _build(self):
+        """Creates the figure, image and overlay artists"""
+
+        self._figure = Figure(figsize=self.figsize, dpi=self.dpi)
+        FigureCanvasAgg(self._figure)
+        self._title = self._figure.suptitle('')
+        self._artists = []
+        for ax, settings in zip(np.atleast_1d(self._figure.subplots(1, len(self.panels))), self.panels):
+            ax.set_axis_off()
+            image = ax.imshow(np.zeros((2, 2)), origin='lower', interpolation='nearest', **settings)
+            lines = {name: ax.plot([], [], **kwargs)[0] for name, kwargs in self.overlays.items()}
+            self._artists.append({'ax': ax, 'image': image, 'lines': lines, 'title': ax.set_title(''),
+                                  'shape': None})
+
+    def draw(self, frame):
+        """Updates the figure with a frame
+
+        :param frame: Frame, see the class description
+        :type frame: dict, list
+        :return: Figure of the renderer
+        :rtype: matplotlib.figure.Figure
+        """
+
+        if self._figure is None:
+            self._build()
+        if not isinstance(frame, dict):
+            frame = {'panels': frame}
+        if len(frame['panels']) != len(self._artists):
+            raise ValueError(f"Frame has {len(frame['panels'])} panels, the renderer has {len(self._artists)}")
+
+        self._title.set_text(frame.get('title', ''))
+        for panel, artists, settings in zip(frame['panels'], self._artists, self.panels):
+            smap = panel.get('map', None)
+            data = np.asarray(getattr(smap, 'data', smap), dtype=np.float64)
+            image = artists['image']
+            image.set_data(data)
+            if data.shape != artists['shape']:
+                extent = (-0.5, data.shape[1] - 0.5, -0.5, data.shape[0] - 0.5)
+                image.set_extent(extent)
+                artists['ax'].set_xlim(extent[:2])
+                artists['ax'].set_ylim(extent[2:])
+                artists['shape'] = data.shape
+
+            clim = panel.get('clim', None)
+            if clim is None and 'norm' not in settings and ('vmin' not in settings or 'vmax' not in settings):
+                finite = data[np.isfinite(data)]
+                clim = (finite.min(), finite.max()) if finite.size else (0., 1.)
+            if clim is not None:
+                image.set_clim(*clim)
+
+            artists['title'].set_text(panel.get('title', ''))
+            overlays = panel.get('overlays', {})
+            for name, line in artists['lines'].items():
+                line.set_data(*(_pixels(overlays[name], smap) if name in overlays else ([], [])))
+        return self._figure
+
+    def render(self, frame, path):
+        """Draws a frame and writes it to `path`
+
+        :return: Path of the written image
+        :rtype: str
+        """
+        self.draw(frame).savefig(path, dpi=self.dpi)
+        return path
+
+
+def _render_frame(settings, task):
+    """Renders one frame with the settings of a `render_frames` call"""
+
+    renderer, prepare = settings
+    if getattr(_WORKER, 'source', None) is not renderer:
+        _WORKER.source, _WORKER.renderer = (renderer, renderer.copy())
+    frame, path = task
+    return _WORKER.renderer.render(prepare(frame) if prepare else frame, path)
+
+
+# Renderer of each worker
+_WORKER = threading.local()
+
+
+def render_frames(renderer, frames, output_dir, prepare=None, workers=None, name='frame_{:05d}.png',
+                  overwrite=True):
+    """Writes the frames of a comparison movie, rendered in parallel worker processes
+
+    Every worker builds the figure of `renderer` once and reuses it for all of its frames.
+
+    :param renderer: Renderer defining the figure layout
+    :type renderer: FrameRenderer
+    :param frames: Frames, or the inputs of `prepare` (e.g. pairs of file names)
+    :type frames: list
+    :param output_dir: Directory of the frame images, created if needed
+    :type output_dir: str
+    :param prepare: Function building a frame from an item of `frames` (loading maps, computing
+        overlays), run in the workers, defaults to using the items as frames
+    :type prepare: callable, optional
+    :param workers: Number of worker processes, defaults to serial rendering
+    :type workers: int, optional
+    :param name: File name format of the frames, formatted with the frame number, defaults to 'frame_00000.png'
+    :type name: str, optional
+    :param overwrite: Render frames whose file exists, defaults to True
+    :type overwrite: bool, optional
+    :return: Paths of the frame images, in the order of `frames`
+    :rtype: list
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, name.format(k)) for k in range(len(frames))]
+    tasks = [(frame, path) for frame, path in zip(frames, paths) if overwrite or not os.path.exists(path)]
+
+    if workers and workers > 1 and len(tasks) > 1:
+        # A copy without figure, as spawned workers receive the settings pickled
+        for _ in imap_shared(_render_frame, tasks, (renderer.copy(), prepare), workers,
+                             chunksize=max(1, len(tasks) // (4 * workers))):
+            pass
+    else:
+        for frame, path in tasks:
+            renderer.render(prepare(frame) if prepare else frame, path)
+    return paths
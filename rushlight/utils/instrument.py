@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# Instrument forward model for synthetic images: PSF convolution, photon statistics and read noise
+# of AIA and XRT, applied in place to float32 stacks of maps
+
+import numpy as np
+from scipy import fft
+
+import astropy.units as u
+
+# Approximate instrument properties. PSFs are a Gaussian core with Lorentzian wings carrying
+# `wing_fraction` of the flux; widths are in arcsec. Pass a measured kernel for precise work.
+INSTRUMENTS = {
+    'aia': {'pixel': 0.6,  # arcsec / pixel
+            'psf_fwhm': 1.2,
+            'wing_fraction': 0.1,
+            'wing_width': 3.,
+            'gain': 17.7,  # electrons / DN
+            'read_noise': 1.15,  # DN
+            'photon_energy': None},  # eV, from the channel wavelength
+    'xrt': {'pixel': 1.0286,
+            'psf_fwhm': 1.6,
+            'wing_fraction': 0.2,
+            'wing_width': 4.,
+            'gain': 57.5,
+            'read_noise': 1.0,
+            'photon_energy': 1000.},  # typical energy of the broadband X-ray photons
+}
+
+# Mean energy needed to free one electron in silicon, eV
+E_PAIR = 3.65
+
+
+class InstrumentModel:
+    """
+    ## Forward model of an imaging instrument
+
+    Converts synthetic count rates (DN / s / pixel) into observed DN: the image is convolved with
+    the instrument PSF through cached kernel FFTs, scaled by the exposure time, drawn from photon
+    (Poisson) statistics and given Gaussian read noise. Stacks of shape (n, y, x) are processed in
+    one call, in place when they already are float32.
+    """
+
+    def __init__(self, instr, channel=None, exposure=1., scale=None, psf=None, **kwargs):
+        """
+        ### Constructor for the instrument model
+
+        :param instr: Instrument name, 'aia' or 'xrt'
+        :type instr: str
+        :param channel: Channel wavelength (AIA) or filter name (XRT), defaults to None
+        :type channel: astropy.units.Quantity, float or str, optional
+        :param exposure: Exposure time, in s if not a Quantity, defaults to 1
+        :type exposure: float, astropy.units.Quantity, optional
+        :param scale: Plate scale of the images in arcsec / pixel, defaults to the instrument pixel
+        :type scale: float, astropy.units.Quantity, optional
+        :param psf: Measured PSF kernel at the image scale, replacing the parametric PSF, defaults to None
+        :type psf: numpy.ndarray, optional
+        :param kwargs: Overrides of the `INSTRUMENTS` parameters (e.g. `read_noise`, `gain`, `photon_energy`)
+        :raises ValueError: Raised if the instrument is unknown, or an EUV channel wavelength is missing
+        """
+
+        if instr.lower() not in INSTRUMENTS:
+            raise ValueError(f"Unknown instrument '{instr}', choose from {list(INSTRUMENTS)}")
+
+        self.instr = instr.lower()
+        self.channel = channel
+        self.params = {**INSTRUMENTS[self.instr], **{k: v for k, v in kwargs.items() if k in INSTRUMENTS[self.instr]}}
+
+        self.exposure = float(u.Quantity(exposure, u.s).value)
+        scale = scale if scale is not None else self.params['pixel']
+        self.scale = float(u.Quantity(scale, u.arcsec / u.pix).value) if isinstance(scale, u.Quantity) else float(scale)
+
+        photon_energy = self.params['photon_energy']
+        if photon_energy is None:
+            if channel is None:
+                raise ValueError("The channel wavelength is needed to convert EUV photons into DN")
+            # EUV channels: energy of a photon at the channel wavelength
+            wavelength = u.Quantity(channel, u.angstrom)
+            photon_energy = wavelength.to(u.eV, equivalencies=u.spectral()).value
+        self.dn_per_photon = photon_energy / E_PAIR / self.params['gain']
+        self.read_noise = self.params['read_noise']
+
+        self.psf = self.psf_kernel() if psf is None else np.asarray(psf, dtype=np.float32) / np.sum(psf)
+        self._kernel_ffts = {}
+
+    def psf_kernel(self):
+        """Parametric PSF sampled at the image scale: Gaussian core plus Lorentzian wings
+
+        :return: Normalized kernel with an odd number of pixels along each axis
+        :rtype: numpy.ndarray
+        """
+
+        sigma = self.params['psf_fwhm'] / (2 * np.sqrt(2 * np.log(2))) / self.scale
+        gamma = self.params['wing_width'] / self.scale
+        radius = int(min(max(np.ceil(4 * sigma), np.ceil(8 * gamma), 1), 128))
+
+        y, x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        r2 = (x**2 + y**2).astype(np.float64)
+        core = np.exp(-0.5 * r2 / sigma**2)
+        wings = 1. / (1. + r2 / gamma**2)**1.5
+        kernel = (1 - self.params['wing_fraction']) * core / core.sum() + self.params['wing_fraction'] * wings / wings.sum()
+        return (kernel / kernel.sum()).astype(np.float32)
+
+    def kernel_fft(self, shape):
+        """FFT of the PSF for images of a given shape, cached per shape
+
+        The kernel is zero-padded to a fast FFT length large enough to avoid wrap-around.
+
+        :param shape: Image shape (y, x)
+        :type shape: tuple
+        :return: Padded shape and the real FFT of the centered kernel
+        :rtype: tuple (tuple, numpy.ndarray)
+        """
+
+        shape = tuple(shape)
+        if shape not in self._kernel_ffts:
+            ky, kx = self.psf.shape
+            padded = (fft.next_fast_len(shape[0] + ky - 1, real=True), fft.next_fast_len(shape[1] + kx - 1, real=True))
+            kernel = np.zeros(padded, dtype=np.float32)
+            kernel[:ky, :kx] = self.psf
+            kernel = np.roll(kernel, (-(ky // 2), -(kx // 2)), axis=(0, 1))
+            self._kernel_ffts[shape] = (padded, fft.rfft2(kernel))
+        return self._kernel_ffts[shape]
+
+    def convolve(self, images):
+        """Convolves images with the PSF, in place
+
+        :param images: Float32 images of shape (..., y, x)
+        :type images: numpy.ndarray
+        :return: The convolved `images`
+        :rtype: numpy.ndarray
+        """
+
+        padded, kernel = self.kernel_fft(images.shape[-2:])
+        spectrum = fft.rfft2(images, s=padded, axes=(-2, -1), workers=-1)
+        spectrum *= kernel
+        images[...] = fft.irfft2(spectrum, s=padded, axes=(-2, -1), overwrite_x=True,
+                                 workers=-1)[..., :images.shape[-2], :images.shape[-1]]
+        return images
+
+    def add_noise(self, counts, rng):
+        """Draws photon statistics and read noise for one map of expected DN, in place
+
+        :param counts: Expected DN of one map, float32, shape (y, x)
+        :type counts: numpy.ndarray
+        :param rng: Random number generator
+        :type rng: numpy.random.Generator
+        :return: The noisy `counts`
+        :rtype: numpy.ndarray
+        """
+
+        np.clip(counts, 0, None, out=counts)
+        counts /= self.dn_per_photon
+        counts[...] = rng.poisson(counts)
+        counts *= self.dn_per_photon
+
+        noise = rng.standard_normal(counts.shape, dtype=np.float32)
+        noise *= self.read_noise
+        counts += noise
+        return counts
+
+    def apply(self, images, seed=None, rng=None, psf=True, noise=True):
+        """Forward-models synthetic count rates into observed DN
+
+        :param images: Count rates in DN / s / pixel, shape (y, x) or a stack (n, y, x); float32 input is
+            modified in place, other types are converted once
+        :type images: numpy.ndarray
+        :param seed: Seed of a new `numpy.random.Generator`, defaults to None
+        :type seed: int, optional
+        :param rng: Generator to draw from, taking precedence over `seed`, defaults to None
+        :type rng: numpy.random.Generator, optional
+        :param psf: Convolve with the instrument PSF, defaults to True
+        :type psf: bool, optional
+        :param noise: Draw photon statistics and read noise, defaults to True
+        :type noise: bool, optional
+        :return: Observed DN, float32, same shape as `images`
+        :rtype: numpy.ndarray
+        """
+
+        images = np.asarray(images, dtype=np.float32)
+        rng = rng if rng is not None else np.random.default_rng(seed)
+
+        if psf:
+            self.convolve(images)
+        images *= self.exposure
+
+        if noise:
+            stack = images[None] if images.ndim == 2 else images.reshape((-1,) + images.shape[-2:])
+            for counts in stack:
+                self.add_noise(counts, rng)
+        return images
+
+    def expected_counts(self, image, psf=True):
+        """Noise-free DN of an image: PSF-convolved count rate times the exposure
+
+        :param image: Count rates in DN / s / pixel, shape (y, x)
+        :type image: numpy.ndarray
+        :param psf: Convolve with the instrument PSF, defaults to True
+        :type psf: bool, optional
+        :return: Expected DN, float32 copy
+        :rtype: numpy.ndarray
+        """
+
+        expected = np.array(image, dtype=np.float32)
+        if psf:
+            self.convolve(expected)
+        expected *= self.exposure
+        return expected
+
+    def ensemble(self, image, n, seed=None, batch=32, psf=True):
+        """Noisy realizations of one image, generated in batches
+
+        The PSF is applied once; member `i` draws its noise from its own generator spawned from
+        `seed`, so every member is reproducible whatever the batch size.
+
+        :param image: Count rates in DN / s / pixel, shape (y, x)
+        :type image: numpy.ndarray
+        :param n: Number of realizations
+        :type n: int
+        :param seed: Root seed of the ensemble, defaults to None
+        :type seed: int, optional
+        :param batch: Number of realizations per yielded array, defaults to 32
+        :type batch: int, optional
+        :param psf: Convolve with the instrument PSF, defaults to True
+        :type psf: bool, optional
+        :return: Generator of float32 arrays of shape (nbatch, y, x) in DN
+        :rtype: generator
+        """
+
+        expected = self.expected_counts(image, psf=psf)
+        seeds = np.random.SeedSequence(seed).spawn(n)
+        for start in range(0, n, batch):
+            members = np.empty((min(batch, n - start),) + expected.shape, dtype=np.float32)
+            for member, member_seed in zip(members, seeds[start:start + len(members)]):
+                member[...] = expected
+                self.add_noise(member, np.random.default_rng(member_seed))
+            yield members
+
+    def realizations(self, image, n, seed=None, psf=True):
+        """All noisy realizations of one image as a single array, see `ensemble`
+
+        :return: Float32 array of shape (n, y, x) in DN
+        :rtype: numpy.ndarray
+        """
+        return next(self.ensemble(image, n, seed=seed, batch=n, psf=psf))
+
+    def ensemble_stats(self, image, n, seed=None, batch=32, psf=True, percentiles=(16, 50, 84), bins=32):
+        """Streams an ensemble into per-pixel summary statistics without storing its members
+
+        :param percentiles: Percentiles tracked by the statistics, defaults to (16, 50, 84)
+        :type percentiles: tuple, optional
+        :param bins: Number of histogram bins per pixel used for the percentiles (each 0.375 sigma
+            of the expected noise wide with the default), see `EnsembleStats` for the memory cost,
+            defaults to 32
+        :type bins: int, optional
+        :return: Mean, standard deviation and percentiles of the ensemble, see `ensemble` for the other arguments
+        :rtype: EnsembleStats
+        """
+
+        # Percentile histograms span +-6 sigma of the expected noise around the noise-free counts
+        expected = self.expected_counts(image, psf=psf)
+        sigma = np.sqrt(self.dn_per_photon * np.clip(expected, 0, None) + self.read_noise**2)
+        stats = EnsembleStats(expected.shape, percentiles=percentiles, bins=bins,
+                              low=expected - 6 * sigma, high=expected + 6 * sigma)
+        for members in self.ensemble(image, n, seed=seed, batch=batch, psf=psf):
+            stats.update(members)
+        return stats
+
+
+class EnsembleStats:
+    """
+    ## Streaming per-pixel statistics of an ensemble of maps
+
+    Mean and standard deviation are accumulated exactly (batched Welford updates); percentiles
+    come from per-pixel histograms between `low` and `high`, interpolated within the bins and
+    accurate to one bin width. Values outside the range are counted in the edge bins.
+
+    Memory: the accumulators take 16 bytes per pixel for the mean and variance, plus `bins`
+    counters per pixel stored in the smallest unsigned type holding the number of members (1 byte
+    up to 255 members, 2 bytes up to 65535), i.e. 48 bytes per pixel with the defaults (~0.8 GB
+    at 4096 x 4096, as much as 6 float64 members). Updates and percentiles only add temporaries
+    of the size of a batch of members and of one map, respectively.
+    """
+
+    # Pixels per chunk of the percentile computation
+    CHUNK = 1 << 16
+
+    def __init__(self, shape, percentiles=(16, 50, 84), bins=32, low=None, high=None):
+        """
+        ### Constructor for the accumulators
+
+        :param shape: Shape of one map (y, x)
+        :type shape: tuple
+        :param percentiles: Percentiles reported by `summary`, defaults to (16, 50, 84)
+        :type percentiles: tuple, optional
+        :param bins: Number of histogram bins per pixel, defaults to 32
+        :type bins: int, optional
+        :param low: Lower edge of the histograms, per pixel or scalar; defaults to the range of the first batch
+        :type low: numpy.ndarray, float, optional
+        :param high: Upper edge of the histograms, per pixel or scalar; defaults to the range of the first batch
+        :type high: numpy.ndarray, float, optional
+        """
+
+        self.shape = tuple(shape)
+        self.percentiles = tuple(percentiles)
+        self.bins = int(bins)
+        self.low, self.high = low, high
+
+        self.count = 0
+        self._mean = np.zeros(self.shape, dtype=np.float64)
+        self._m2 = np.zeros(self.shape, dtype=np.float64)
+        self._hist = np.zeros((int(np.prod(self.shape)), self.bins), dtype=np.uint8)
+
+    def update(self, members):
+        """Adds a batch of maps to the statistics
+
+        :param members: Maps of shape (nbatch, y, x)
+        :type members: numpy.ndarray
+        """
+
+        members = np.asarray(members)
+        nbatch = len(members)
+        if self.low is None or self.high is None:
+            spread = members.max(axis=0) - members.min(axis=0)
+            self.low = members.min(axis=0) - spread
+            self.high = members.max(axis=0) + spread
+        self.low = np.broadcast_to(np.asarray(self.low, dtype=np.float64), self.shape)
+        self.high = np.broadcast_to(np.asarray(self.high, dtype=np.float64), self.shape)
+
+        # Chan et al. update of the mean and the sum of squared deviations
+        batch_mean = members.mean(axis=0, dtype=np.float64)
+        batch_m2 = ((members - batch_mean)**2).sum(axis=0)
+        total = self.count + nbatch
+        delta = batch_mean - self._mean
+        self._mean += delta * nbatch / total
+        self._m2 += batch_m2 + delta**2 * self.count * nbatch / total
+        self.count = total
+
+        # Counters widened before they could overflow
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if total <= np.iinfo(dtype).max:
+                break
+        if np.iinfo(dtype).max > np.iinfo(self._hist.dtype).max:
+            self._hist = self._hist.astype(dtype)
+
+        # One member at a time: every pixel gets exactly one count, so that the flat indices of a
+        # member are unique and a plain fancy-index increment is exact
+        scale = self.bins / np.where(self.high > self.low, self.high - self.low, 1.)
+        offsets = np.arange(self._hist.shape[0], dtype=np.intp).reshape(self.shape) * self.bins
+        counts = self._hist.reshape(-1)
+        for member in members:
+            index = np.clip((member - self.low) * scale, 0, self.bins - 1).astype(np.intp)
+            counts[(offsets + index).ravel()] += 1
+
+    @property
+    def mean(self):
+        """Per-pixel mean"""
+        return self._mean.copy()
+
+    @property
+    def std(self):
+        """Per-pixel standard deviation (ddof=0)"""
+        return np.sqrt(self._m2 / max(self.count, 1))
+
+    def percentile(self, q):
+        """Per-pixel percentile, interpolated within the histogram bins
+
+        :param q: Percentile in [0, 100]
+        :type q: float
+        :return: Map of the percentile
+        :rtype: numpy.ndarray
+        """
+
+        target = q / 100. * self.count
+        position = np.empty(self._hist.shape[0])
+        for start in range(0, len(position), self.CHUNK):
+            hist = self._hist[start:start + self.CHUNK]
+            cumulative = np.cumsum(hist, axis=1, dtype=np.uint64)
+            above = np.argmax(cumulative >= target, axis=1)
+            rows = np.arange(len(above))
+            before = np.where(above > 0, cumulative[rows, above - 1], 0)
+            inside = hist[rows, above]
+            fraction = np.divide(target - before, inside, out=np.zeros(len(above)), where=inside > 0)
+            position[start:start + self.CHUNK] = above + fraction
+        width = (self.high - self.low).ravel() / self.bins
+        return (self.low.ravel() + position * width).reshape(self.shape)
+
+    def summary(self):
+        """Mean, standard deviation and the tracked percentiles
+
+        :return: Dictionary of maps keyed by 'mean', 'std' and 'p<q>'
+        :rtype: dict
+        """
+        result = {'mean': self.mean, 'std': self.std}
+        result.update({f"p{q:g}": self.percentile(q) for q in self.percentiles})
+        return result
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# Per-stage instrumentation of the synthetic image pipeline: wall time, CPU time and peak memory
+# of each stage, kept as records, optionally written as JSON lines and passed to profiler hooks
+
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Environment variable enabling the timers of all synthetic images: '1' to record the stages,
+# '-' to also log them to stderr, any other value is the path of a JSON lines log
+ENV_VARIABLE = 'RUSHLIGHT_TIMINGS'
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class StageTimer:
+    """
+    ## Recorder of the stages of a computation
+
+    `stage(name)` is a context manager measuring the wall time, CPU time (of the process) and,
+    with `memory`, the peak of the memory traced by `tracemalloc` above its level at the start of
+    the stage. Stages may be nested: records name their `parent` stage, and the peak memory of a
+    stage includes that of its children. A disabled timer returns a shared no-op context manager,
+    so instrumented code costs one method call per stage.
+
+    Hooks attach other profilers: a hook is called with the name of every stage and returns a
+    context manager entered around the stage, or None. For instance, `cProfile.Profile` objects
+    are context managers, so `timer.add_hook(lambda stage: profiler if stage == 'projection' else None)`
+    profiles the projections only.
+    """
+
+    def __init__(self, enabled=True, memory=False, log=None, hooks=None):
+        """
+        ### Constructor
+
+        :param enabled: Record the stages, defaults to True
+        :type enabled: bool, optional
+        :param memory: Record the peak memory of the stages (starts `tracemalloc`, which slows
+            down allocations until `close`), defaults to False
+        :type memory: bool, optional
+        :param log: Path of a JSON lines file (appended to) or stream receiving every record,
+            defaults to None
+        :type log: str, file-like, optional
+        :param hooks: Profiler hooks, see the class description, defaults to None
+        :type hooks: list, optional
+        """
+
+        self.enabled = enabled
+        self.memory = memory
+        self.log = log
+        self.hooks = list(hooks or [])
+        self.records = []
+        self._stack = []
+        self._tracing = enabled and memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    def close(self):
+        """Stops the memory tracing started by the timer"""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def add_hook(self, hook):
+        """Adds a profiler hook, see the class description
+
+        :param hook: Function of the stage name returning a context manager or None
+        :type hook: callable
+        """
+        self.hooks.append(hook)
+
+    def stage(self, name):
+        """Context manager recording a stage
+
+        :param name: Name of the stage
+        :type name: str
+        :rtype: contextlib.AbstractContextManager
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._record(name)
+
+    @contextlib.contextmanager
+    def _record(self, name):
+        frame = {'peak': 0, 'memory': 0}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['memory'] = current
+        parent = self._stack[-1]['name'] if self._stack else None
+        frame['name'] = name
+        self._stack.append(frame)
+
+        with contextlib.ExitStack() as hooks:
+            for hook in self.hooks:
+                manager = hook(name)
+                if manager is not None:
+                    hooks.enter_context(manager)
+            started = time.time()
+            wall, cpu = (time.perf_counter(), time.process_time())
+            try:
+                yield
+            finally:
+                wall, cpu = (time.perf_counter() - wall, time.process_time() - cpu)
+                self._stack.pop()
+                record = {'stage': name, 'parent': parent, 'started': started, 'wall': wall, 'cpu': cpu,
+                          'peak_memory': None}
+                if self.memory:
+                    peak = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+                    record['peak_memory'] = peak - frame['memory']
+                    if self._stack:
+                        self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+                    tracemalloc.reset_peak()
+                self.records.append(record)
+                self._write(record)
+
+    def _write(self, record):
+        """Writes a record to the JSON lines log"""
+
+        if self.log is None:
+            return
+        line = json.dumps(record) + '\n'
+        if isinstance(self.log, (str, os.PathLike)):
+            with open(self.log, 'a') as f:
+                f.write(line)
+        else:
+            self.log.write(line)
+            self.log.flush()
+
+    def summary(self):
+        """Totals of the records per stage
+
+        :return: Stage -> number of calls, total wall and CPU times in seconds, and largest peak memory in bytes
+        :rtype: dict
+        """
+
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'calls': 0, 'wall': 0., 'cpu': 0., 'peak_memory': None})
+            total['calls'] += 1
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+            if record['peak_memory'] is not None:
+                total['peak_memory'] = max(total['peak_memory'] or 0, record['peak_memory'])
+        return totals
+
+    def reset(self):
+        """Drops the records"""
+        self.records = []
+
+
+# Disabled timer of the objects created without instrumentation
+NULL_TIMER = StageTimer(enabled=False)
+
+
+def as_timer(timer=None):
+    """Timer of an instrumented object
+
+    :param timer: True for a new timer, a timer, False for no instrumentation, or None for the
+        timer set by the `RUSHLIGHT_TIMINGS` environment variable (none if it is not set; '-'
+        logs to stderr), defaults to None
+    :type timer: bool, StageTimer, optional
+    :rtype: StageTimer
+    """
+
+    if isinstance(timer, StageTimer):
+        return timer
+    if timer:
+        return StageTimer()
+    setting = os.environ.get(ENV_VARIABLE, '')
+    if timer is None and setting and setting.lower() not in ('0', 'false', 'no'):
+        if setting.lower() in ('1', 'true', 'yes'):
+            return StageTimer()
+        return StageTimer(log=sys.stderr if setting == '-' else setting)
+    return NULL_TIMER
+
+
+def timed(stage):
+    """Decorator recording the calls of a method as a stage of the `timer` of its object
+
+    :param stage: Name of the stage
+    :type stage: str
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with getattr(self, 'timer', NULL_TIMER).stage(stage):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Deferred imports of the heavy dependencies (yt, sunpy, matplotlib, ...), so that importing
+# rushlight modules stays cheap in worker processes and command line tools
+
+import importlib
+
+
+class LazyModule:
+    """
+    ## Module imported on the first access to one of its attributes
+
+    Stands in for a module at the top of a rushlight module: `yt = lazy_import('yt')` costs nothing
+    until the first `yt.<name>` lookup. Submodules that the package does not import itself are
+    imported on access as well, so that `sunpy.map.Map` works from `lazy_import('sunpy')`.
+    """
+
+    def __init__(self, name, setup=None):
+        """
+        ### Constructor, the module is not imported
+
+        :param name: Full name of the module
+        :type name: str
+        :param setup: Function called with the module once it is imported, defaults to None
+        :type setup: callable, optional
+        """
+
+        self._name = name
+        self._setup = setup
+        self._module = None
+
+    def _load(self):
+        """Imports the module on first use"""
+
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            if self._setup is not None:
+                self._setup(module)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        module = self._load()
+        try:
+            return getattr(module, attr)
+        except AttributeError:
+            try:
+                return importlib.import_module(f"{self._name}.{attr}")
+            except ModuleNotFoundError:
+                raise AttributeError(f"module '{self._name}' has no attribute '{attr}'") from None
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'{'' if self._module is None else ' (imported)'}>"
+
+
+def lazy_import(name, setup=None):
+    """Module imported on first attribute access, see `LazyModule`
+
+    :param name: Full name of the module, e.g. 'yt' or 'matplotlib.colors'
+    :type name: str
+    :param setup: Function called with the module once it is imported, e.g. to set yt's log level
+    :type setup: callable, optional
+    :rtype: LazyModule
+    """
+    return LazyModule(name, setup)
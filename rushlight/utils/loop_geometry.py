@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# Vectorized geometry of semi-circular and semi-elliptical coronal loops, following the loop
+# parameters of CoronalLoopBuilder (radius / majax, minax, height, phi0, theta0, el, az, samples_num)
+
+import numpy as np
+
+import astropy.units as u
+import astropy.constants as const
+
+# Solar radius in Mm, the length unit of the loop coordinates
+R_SUN = const.R_sun.to_value(u.Mm)
+
+
+def _values(quantity, unit):
+    """Plain array of `quantity` in `unit`; numbers without units are taken to be in `unit`"""
+    return np.asarray(u.Quantity(quantity, unit).to_value(unit), dtype=np.float64)
+
+
+def loop_points(radius=10. * u.Mm, majax=0. * u.Mm, minax=0. * u.Mm, height=0. * u.Mm, phi0=0. * u.deg,
+                theta0=0. * u.deg, el=90. * u.deg, az=0. * u.deg, samples_num=100):
+    """Heliographic Stonyhurst coordinates of loops, for any number of loops at once
+
+    Every parameter may be an array; parameters are broadcast against each other, one loop per element.
+    Each loop is the part of a circle (or ellipse) above the plane tangent to the solar surface at
+    (`phi0`, `theta0`). The loop plane has the normal vector (sin el cos az, sin el sin az, cos el)
+    in the local (west, north, up) frame, so that `el` = 90 deg gives a vertical loop whose footpoints
+    lie along the azimuth `az` + 90 deg, and the circle center is `height` above the surface
+    (negative heights give loops flatter than a half circle).
+
+    :param radius: Radius of circular loops, in Mm if no unit is given, defaults to 10 Mm
+    :type radius: astropy.units.Quantity, float, numpy.ndarray
+    :param majax: Semi-axis of elliptical loops along their footpoint baseline, defaults to 0 (circular loop)
+    :type majax: astropy.units.Quantity, float, numpy.ndarray
+    :param minax: Semi-axis of elliptical loops towards their apex, defaults to 0 (circular loop)
+    :type minax: astropy.units.Quantity, float, numpy.ndarray
+    :param height: Height of the circle (or ellipse) center above the surface, defaults to 0 Mm
+    :type height: astropy.units.Quantity, float, numpy.ndarray
+    :param phi0: Stonyhurst longitude of the loop base, in degrees if no unit is given, defaults to 0
+    :type phi0: astropy.units.Quantity, float, numpy.ndarray
+    :param theta0: Stonyhurst latitude of the loop base, defaults to 0
+    :type theta0: astropy.units.Quantity, float, numpy.ndarray
+    :param el: Polar angle of the loop plane normal from the local vertical, defaults to 90 deg
+    :type el: astropy.units.Quantity, float, numpy.ndarray
+    :param az: Azimuth of the loop plane normal from the local west direction, defaults to 0
+    :type az: astropy.units.Quantity, float, numpy.ndarray
+    :param samples_num: Number of points along each loop, defaults to 100
+    :type samples_num: int
+    :raises ValueError: Raised if a loop does not reach above the surface
+    :return: Cartesian Stonyhurst coordinates in Mm, of shape (..., samples_num, 3) where ... is
+        the broadcast shape of the parameters
+    :rtype: numpy.ndarray
+    """
+
+    radius, majax, minax, height = (_values(q, u.Mm) for q in (radius, majax, minax, height))
+    phi0, theta0, el, az = (np.radians(_values(q, u.deg)) for q in (phi0, theta0, el, az))
+    radius, majax, minax, height, phi0, theta0, el, az = np.broadcast_arrays(radius, majax, minax, height,
+                                                                             phi0, theta0, el, az)
+
+    # Semi-axes along the baseline (a) and towards the apex (b); circles where no ellipse is given
+    ellipse = (majax > 0) & (minax > 0)
+    a = np.where(ellipse, majax, radius)[..., None]
+    b = np.where(ellipse, minax, radius)[..., None]
+    height, phi0, theta0, el, az = (p[..., None] for p in (height, phi0, theta0, el, az))
+
+    # Footpoints where the height above the tangent plane, height + b sin(t) sin(el), vanishes
+    rise = b * np.sin(el)
+    if np.any(np.abs(height) >= rise):
+        raise ValueError("Loops should reach above the surface: |height| < minor semi-axis * sin(el)")
+    t_foot = np.arcsin(-height / rise)
+    t = t_foot + (np.pi - 2 * t_foot) * np.linspace(0., 1., samples_num)
+
+    # Baseline (u) and apex (w) directions in the local (west, north, up) frame
+    u_vec = np.stack(np.broadcast_arrays(-np.sin(az), np.cos(az), np.zeros_like(az)), axis=-1)
+    w_vec = np.stack(np.broadcast_arrays(-np.cos(el) * np.cos(az), -np.cos(el) * np.sin(az), np.sin(el)),
+                     axis=-1)
+    local = (np.cos(t) * a)[..., None] * u_vec + (np.sin(t) * b)[..., None] * w_vec
+    local[..., 2] += height
+
+    # Local frame at the loop base -> Stonyhurst Cartesian
+    r_hat = np.stack([np.cos(theta0) * np.cos(phi0), np.cos(theta0) * np.sin(phi0), np.sin(theta0)], axis=-1)
+    west = np.stack([-np.sin(phi0), np.cos(phi0), np.zeros_like(phi0)], axis=-1)
+    north = np.stack([-np.sin(theta0) * np.cos(phi0), -np.sin(theta0) * np.sin(phi0), np.cos(theta0)], axis=-1)
+    return (local[..., 0:1] * west + local[..., 1:2] * north + (R_SUN + local[..., 2:3]) * r_hat)
+
+
+def loop_frames(points):
+    """Footpoint and apex vectors of loops, as used by `synth_tools.calc_vect`
+
+    :param points: Loop coordinates of shape (..., samples_num, 3), e.g. from `loop_points`
+    :type points: numpy.ndarray
+    :return: First footpoint, last footpoint and middle point of each loop, each of shape (..., 3)
+    :rtype: tuple (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+
+    points = np.asarray(points)
+    return points[..., 0, :], points[..., -1, :], points[..., int(points.shape[-2] / 2.), :]
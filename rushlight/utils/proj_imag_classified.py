@@ -6,37 +6,48 @@ from datetime import datetime
 import numpy as np
 from scipy import ndimage
 
-import yt
-from yt.utilities.orientation import Orientation
-yt.set_log_level(50)
-
-from rushlight.emission_models import uv, xrt
+from rushlight.emission_models import uv, xrt, xray_bremsstrahlung
 from rushlight.utils import synth_tools as st
 from rushlight.utils.dcube import Dcube
-
-from skimage.util import random_noise
+from rushlight.utils.projector import GridProjector, BrickMap, BrickCube, project_tiled, grid_extent
+from rushlight.utils.instrument import InstrumentModel
+from rushlight.utils.synth_result import SyntheticResult, DiagnosticMaps
+from rushlight.utils.alignment import PhaseCorrelator, center_to_shape
+from rushlight.utils.view_search import ViewSearch, orientation_vectors
+from rushlight.utils.synth_catalog import SynthCatalog, CATALOG_SUFFIXES
+from rushlight.utils.lazy import lazy_import
+from rushlight.utils.instrumentation import NULL_TIMER, as_timer, timed
 
 import astropy.units as u
-import matplotlib.colors as colors
-
-import sunpy.map
-from sunpy.map.header_helper import make_fitswcs_header
-from sunpy.coordinates.sun import _radius_from_angular_radius
-from sunpy.visualization import colormaps as cm
-
-from astropy.coordinates import SkyCoord
-from astropy.time import Time, TimeDelta
-import astropy.constants as const
 
 import pickle
 import textwrap
 import os
-from unyt import unyt_array
-
 from abc import ABC
+from collections import OrderedDict
+
+# Heavy dependencies, imported by the code paths that need them
+yt = lazy_import('yt', setup=lambda module: module.set_log_level(50))
+unyt = lazy_import('unyt')
+sunpy = lazy_import('sunpy')
+cm = lazy_import('sunpy.visualization.colormaps')
+colors = lazy_import('matplotlib.colors')
+coordinates = lazy_import('astropy.coordinates')
+const = lazy_import('astropy.constants')
 
 # TODO - create a method summary here
 
+# Predefined diagnostic maps: (field, weight, power, FITS unit);
+# the 'emission' weight stands for the emission field of the current channel
+DIAGNOSTIC_MAPS = {
+    'emission_measure': (('gas', 'number_density'), None, 2, 'cm-5'),
+    'column_density': (('gas', 'number_density'), None, 1, 'cm-2'),
+    'temperature': (('gas', 'temperature'), 'emission', 1, 'K'),
+}
+
+# Options of `proj_and_imag` selecting a `GridProjector` projection of the intensity; at most one applies
+GRID_METHODS = ('absorption', 'slab', 'tile_size', 'sparse', 'skip_empty')
+
 class SyntheticImage(ABC):
 
     """
@@ -52,6 +63,9 @@ class SyntheticImage(ABC):
     **observation wavelength**, as well as setting appropriate **colormap parameters**.
     """
 
+    timer = NULL_TIMER  # stage instrumentation, see `timings`
+    SLAB_CACHE_SIZE = 2  # views whose partial integrals are kept by `slab_image`
+
     def __init__(self, dataset = None, smap_path: str=None, smap=None, **kwargs):
         """
         ### Constructor for the synthetic image class.
@@ -66,12 +80,19 @@ class SyntheticImage(ABC):
         :type smap_path: str, optional
         :param smap: Sunpy map object of the reference map, defaults to None
         :type smap: sunpy.map.Map, optional
+        :param timer: Records the time and memory of the stages of the synthetic image (see
+            `timings`): True, a `StageTimer` (e.g. shared by several images, with a JSON lines log
+            or profiler hooks), or False; defaults to the `RUSHLIGHT_TIMINGS` environment variable
+        :type timer: bool, StageTimer, optional
         :raises Exception: _description_
         """
 
+        self.timer = as_timer(kwargs.get('timer', None))
+
         # Initializes self.ref_img as either a provided sunpy map
         # or as a generated default map
-        self.ref_img = st.get_reference_image(smap_path, smap, **kwargs)
+        with self.timer.stage('reference_image'):
+            self.ref_img = st.get_reference_image(smap_path, smap, **kwargs)
 
         # Properties extracted from the header metadata of the reference image
         instr = self.ref_img.instrument.split(' ')[0].lower()
@@ -86,7 +107,8 @@ class SyntheticImage(ABC):
         self.obs = kwargs.get('obs', "DefaultInstrument")  # Name of the observatory
 
         # Initialize the 3D MHD file to be used for synthetic image
-        ds = Dcube(dataset)
+        with self.timer.stage('dataset'):
+            ds = Dcube(dataset)
         self.box = ds.box
         self.data = ds.data
         self.domain_width = ds.domain_width
@@ -120,7 +142,7 @@ class SyntheticImage(ABC):
 
         # The coordinate to which the projection will be aligned
         self.mpt_obstime = kwargs.get('mpt_obstime', self.obstime)
-        self.mpt = SkyCoord(lon=self.lon, lat=self.lat, radius=const.R_sun,
+        self.mpt = coordinates.SkyCoord(lon=self.lon, lat=self.lat, radius=const.R_sun,
                     frame='heliographic_stonyhurst',
                     observer='earth', obstime=self.mpt_obstime).transform_to(frame='helioprojective')
 
@@ -137,9 +159,10 @@ class SyntheticImage(ABC):
             self.ifpd, self.normvector, self.northvector = (None, None, None)
             obsframe=self.mpt.frame
             
-            self.normvector, self.northvector, self.ifpd = st.calc_vect(self.ref_img, vector_arr=self.vector_arr, 
-                                                                        loop_coords=self.loop_coords, default=False,
-                                                                        obsframe=obsframe)
+            with self.timer.stage('view_vectors'):
+                self.normvector, self.northvector, self.ifpd = st.calc_vect(self.ref_img, vector_arr=self.vector_arr,
+                                                                            loop_coords=self.loop_coords, default=False,
+                                                                            obsframe=obsframe)
         # Group the normal and north vectors in self.view_settings
         self.view_settings = {'normal_vector': self.normvector,
                               'north_vector': self.northvector}
@@ -157,8 +180,17 @@ class SyntheticImage(ABC):
 
 
         self.imag_field, self.image = (None, None)
+        self.imaging_model, self.optical_depth = (None, None)
+        self.diagnostic_images, self.diagnostic_units, self.diagnostic_maps = ({}, {}, {})
+        self.doppler_cube, self.velocity_edges, self.doppler_wavelengths = (None, None, None)
+        self.emission_cubes, self.occupancy_maps, self.skip_report = ({}, {}, None)
+        self.width_scale = 1.
+        self.slab_sums, self.slab_bounds, self.forward_model = (OrderedDict(), None, None)
+        self.header, self.result = (None, None)
+        self._correlator, self._correlator_key, self.alignment = (None, None, None)
+        self.view_search, self._view_search_key = (None, None)
         self.proj_and_imag(**kwargs)
-        self.make_synthetic_map(**kwargs)
+        self.make_synthetic_result(**kwargs)
 
     def set_loop_params(self, **kwargs):
         '''
@@ -204,6 +236,7 @@ class SyntheticImage(ABC):
         self.az = self.dims['az']
         self.samples_num = self.dims['samples_num']
 
+    @timed('diff_roll')
     def diff_roll(self, **kwargs):
         """Calculate amount to shift image by difference between observed foot midpoint
         and selected "shift origin"
@@ -215,13 +248,13 @@ class SyntheticImage(ABC):
         self.zoom = kwargs.get('zoom', self.scale_factor())
 
         # Synthetic Foot Midpoint (0,0,0 in code_units)
-        north_q = unyt_array(self.northvector, self.data.units.code_length)
-        norm_q = unyt_array(self.normvector, self.data.units.code_length)
+        north_q = unyt.unyt_array(self.northvector, self.data.units.code_length)
+        norm_q = unyt.unyt_array(self.normvector, self.data.units.code_length)
 
-        ds_orientation = Orientation(norm_q, north_vector=north_q)
+        ds_orientation = yt.utilities.orientation.Orientation(norm_q, north_vector=north_q)
 
         origin = kwargs.get('origin', [0,0,0])
-        synthbox_origin = unyt_array(origin, self.data.units.code_length)
+        synthbox_origin = unyt.unyt_array(origin, self.data.units.code_length)
 
         synth_fpt_2d = st.coord_projection(self.data, synthbox_origin, ds_orientation)
         synth_fpt_asec = st.code_coords_to_arcsec(synth_fpt_2d, self.ref_img, box=self.box)
@@ -291,6 +324,7 @@ class SyntheticImage(ABC):
 
 
         imaging_model.make_intensity_fields(self.data)
+        self.imaging_model = imaging_model
 
         field = str(self.instr) + '_filter_band'
         self.imag_field = field
@@ -298,12 +332,44 @@ class SyntheticImage(ABC):
         if self.plot_settings:
             self.plot_settings['cmap'] = cmap[self.instr]
 
+    @timed('proj_and_imag')
     def proj_and_imag(self, **kwargs):
         """Projects the synthetic dataset and applies image zoom and shift
 
         :param bkg_fill: Value to fill the background (where image values are less than or equal to 0).
             If None, the background is not filled.
         :type bkg_fill: float, optional
+        :param projector: Projection of the intensity: 'yt' for `yt.off_axis_projection`, or 'grid'
+            for the nearest-sample `GridProjector`, which reuses the emission cube cached per channel
+            and supports `depth`, `slab`, `tile_size`, `sparse` and `skip_empty`; defaults to 'yt'
+        :type projector: str, optional
+        :param absorption: Include absorption by cool material (EUV channels only), projected with
+            `GridProjector` whatever `projector`, see `proj_absorbing`; if it is negligible (see
+            `absorption_negligible`), the image is the standard projection; defaults to False
+        :type absorption: bool, optional
+        :param tau_thin: Optical depth below which absorption is neglected, defaults to 1e-3
+        :type tau_thin: float, optional
+        :param diagnostics: Extra maps, see `proj_diagnostics`; they are projected together with the
+            intensity with `projector='grid'`, and in a separate `GridProjector` pass otherwise
+        :type diagnostics: list, optional
+        :param depth: Extent of the integration along the line of sight in code units, defaults to
+            `prjw`; requires `projector='grid'`
+        :type depth: float, optional
+        :param slab: (start, depth) of a slab along the line of sight, see `slab_image`; requires
+            `projector='grid'`
+        :type slab: tuple, optional
+        :param tile_size: Render the image in tiles of this many pixels, see `proj_tiled`; requires
+            `projector='grid'`
+        :type tile_size: int, optional
+        :param sparse: Project a brick-compressed emissivity, see `proj_sparse`; a number sets the
+            emptiness threshold relative to the peak emissivity; requires `projector='grid'`
+        :type sparse: bool or float, optional
+        :param skip_empty: Skip bricks of the box that do not emit in the current channel, see
+            `proj_skip_empty`; a number sets the emptiness threshold relative to the peak emissivity;
+            requires `projector='grid'`, as does `prjw='tight'`
+        :type skip_empty: bool or float, optional
+        :raises ValueError: Raised if projection options require `projector='grid'` or select
+            different projections, see `projection_method`
 
         :notes: The center position is offset by 0.5 in the y-axis, which is dataset-dependent.
             Transposes the synthetic image to swap axes for `imshow`.
@@ -312,28 +378,68 @@ class SyntheticImage(ABC):
             along the y and x axes, respectively.
         """
 
-        self.make_filter_image_field()  # Create emission fields
+        with self.timer.stage('emission_field'):
+            self.make_filter_image_field()  # Create emission fields
 
         try:
             center = self.box.domain_center.value
         except:
             center = self.box.center
 
-        prji = yt.off_axis_projection(
-            self.box,
-            center, # center position in code units
-            normal_vector=self.view_settings['normal_vector'],  # normal vector (z axis)
-            width= kwargs.get('prjw', self.data.domain_width[0].value),  # width in code units
-            resolution=self.plot_settings['resolution'],  # image resolution
-            item=self.imag_field,  # respective field that is being projected
-            north_vector=self.view_settings['north_vector'],
-            # depth = kwargs.get('depth', None)
-            )
+        with self.timer.stage('projection'):
+            method = self.projection_method(**kwargs)
+            self.width_scale, self.optical_depth = (1., None)
+            thin = method == 'absorption' and self.absorption_negligible(kwargs.get('tau_thin', 1e-3))
+            if thin:
+                # Optically thin everywhere: the standard projection, with no optical depth
+                method = kwargs.get('projector', 'yt')
+            diagnostics = kwargs.get('diagnostics', None)
+            self.diagnostic_images, self.diagnostic_units = ({}, {})
+            if method == 'absorption':
+                # Front-to-back integration through cool absorbing material
+                prji = self.proj_absorbing(**kwargs)
+            elif method == 'slab':
+                # Depth-limited slab from the cached partial integrals of this view
+                prji = self.slab_image(*kwargs['slab'], **kwargs).T
+            elif method == 'tile_size':
+                # Image plane rendered tile by tile, for very large resolutions
+                prji = self.proj_tiled(**kwargs)
+            elif method == 'sparse':
+                # Emissivity stored and projected only where the channel emits
+                prji = self.proj_sparse(**kwargs)
+            elif method == 'skip_empty':
+                # Only the emitting part of the box is traversed
+                prji = self.proj_skip_empty(**kwargs)
+            elif method == 'grid' and diagnostics:
+                # Intensity and diagnostic maps from a single traversal
+                prji = self.proj_diagnostics(**kwargs)
+            elif method == 'grid':
+                # Emission cube cached per channel, optionally depth-limited
+                projector = self._projector(**kwargs)
+                prji = projector.integrate(self.emission_cube(projector))[0]
+            else:
+                prji = yt.off_axis_projection(
+                    self.box,
+                    center, # center position in code units
+                    normal_vector=self.view_settings['normal_vector'],  # normal vector (z axis)
+                    width= kwargs.get('prjw', self.data.domain_width[0].value),  # width in code units
+                    resolution=self.plot_settings['resolution'],  # image resolution
+                    item=self.imag_field,  # respective field that is being projected
+                    north_vector=self.view_settings['north_vector'],
+                    )
+            if diagnostics and not (method == 'grid'):
+                self.proj_diagnostics(**kwargs)
+            if thin:
+                self.optical_depth = np.zeros(np.shape(prji)).T
 
         # NOTE: Confirm that this is not band-aid for incorrect norm vector
         # transpose synthetic image (swap axes for imshow)
         self.image = np.array(prji).T
 
+        # Velocity-resolved cube from the same view, if requested
+        if kwargs.get('doppler', False):
+            self.make_doppler_cube(**kwargs)
+
         # Determines the number of pixels required to shift the synthetic image
         # to align MHD origin with loop foot midpoint. Additionally, determines
         # the lower left pixel of the synthetic image, relative to the lower left pixel
@@ -352,6 +458,367 @@ class SyntheticImage(ABC):
         self.bkg_fill = kwargs.get('bkg_fill', None)
         if self.bkg_fill: self.image[self.image <= 0] = self.bkg_fill
 
+        # Noise-free image, kept for noise ensembles
+        self.clean_image = self.image
+
+    def projection_method(self, **kwargs):
+        """Projection of the intensity selected by the options of `proj_and_imag`
+
+        :raises ValueError: Raised for an unknown `projector`, for `GridProjector` options without
+            `projector='grid'`, and for options selecting different projections (e.g. `slab` and
+            `tile_size`), instead of silently ignoring some of them
+        :return: 'yt', 'grid', or the option selecting a `GridProjector` method (see `GRID_METHODS`)
+        :rtype: str
+        """
+
+        projector = kwargs.get('projector', 'yt')
+        if projector not in ('yt', 'grid'):
+            raise ValueError(f"Unknown projector '{projector}', choose 'yt' or 'grid'")
+
+        def given(name):
+            value = kwargs.get(name, None)
+            return value is not None if name == 'slab' else bool(value)
+
+        options = [name for name in GRID_METHODS if given(name)]
+        if kwargs.get('prjw', None) == 'tight':
+            options.append("prjw='tight'")
+        methods = {'skip_empty' if name == "prjw='tight'" else name for name in options}
+        if len(methods) > 1:
+            raise ValueError(f"Options {', '.join(options)} select different projections, choose one of them")
+
+        grid_only = [name for name in options + (['depth'] if given('depth') else []) if name != 'absorption']
+        if projector == 'yt' and grid_only:
+            raise ValueError(f"{', '.join(grid_only)} require{'s' if len(grid_only) == 1 else ''} "
+                             f"projector='grid' (not supported by yt.off_axis_projection)")
+        return methods.pop() if methods else projector
+
+    def _view(self, **kwargs):
+        """View arguments of `GridProjector` matching `proj_and_imag`
+
+        :return: Center, normal / north vectors, width and resolution of the current view
+        :rtype: dict
+        """
+
+        try:
+            center = self.box.domain_center.value
+        except:
+            center = self.box.center
+
+        width = kwargs.get('prjw', None)
+        if width is None or width == 'tight':
+            width = self.data.domain_width[0].value
+
+        return {'center': center,
+                'normal_vector': self.view_settings['normal_vector'],
+                'width': width,
+                'resolution': self.plot_settings['resolution'],
+                'north_vector': self.view_settings['north_vector'],
+                'depth': kwargs.get('depth', None)}
+
+    def _projector(self, **kwargs):
+        """Sets up a `GridProjector` with the same view as `proj_and_imag`
+
+        :return: Projector through `self.box` along the current view settings
+        :rtype: GridProjector
+        """
+
+        return GridProjector(self.box, **self._view(**kwargs))
+
+    def emission_cube(self, projector):
+        """Emission field of the current channel sampled on the projector cells
+
+        The cube does not depend on the view, so it is cached per instrument and channel
+        and reused by every projection of this box.
+
+        :param projector: Projector through `self.box`
+        :type projector: GridProjector
+        :return: Cell values of shape (ncells, 1)
+        :rtype: numpy.ndarray
+        """
+
+        key = (self.instr, str(self.channel))
+        if key not in self.emission_cubes:
+            self.emission_cubes[key] = projector.sample_cube([('gas', self.imag_field)])
+        return self.emission_cubes[key]
+
+    def occupancy(self, projector, brick_size=8):
+        """Brick min / max summary of the emission field of the current channel, cached per channel
+
+        :param projector: Projector through `self.box`
+        :type projector: GridProjector
+        :param brick_size: Number of cells along each brick edge, defaults to 8
+        :type brick_size: int, optional
+        :return: Occupancy summary of the emission field
+        :rtype: BrickMap
+        """
+
+        key = (self.instr, str(self.channel), brick_size)
+        if key not in self.occupancy_maps:
+            self.occupancy_maps[key] = BrickMap(self.emission_cube(projector)[:, 0], projector.dims, brick_size)
+        return self.occupancy_maps[key]
+
+    def proj_skip_empty(self, **kwargs):
+        """Projects the emission field, skipping bricks that do not emit in the current channel
+
+        Bricks whose emissivity stays below `skip_empty` times the peak emissivity are not traversed.
+        With `prjw='tight'` the image plane width is reduced to the projected extent of the
+        emitting bricks, and `self.width_scale` records the matching factor applied to the pixel
+        scale of the reference image in the header. The speedup, skipped fraction and absolute error bound of the pixel values
+        are stored in `self.skip_report` (see `GridProjector.skip_report`).
+
+        :param skip_empty: Emptiness threshold relative to the peak emissivity, defaults to 1e-6
+        :type skip_empty: float, optional
+        :param brick_size: Number of cells along each brick edge, defaults to 8
+        :type brick_size: int, optional
+        :param prjw: Image plane width in code units, or 'tight'
+        :type prjw: float or str, optional
+        :return: Channel intensity in the layout of `yt.off_axis_projection`
+        :rtype: numpy.ndarray
+        """
+
+        threshold = kwargs.get('skip_empty', True)
+        threshold = 1e-6 if threshold is True or not threshold else threshold
+
+        projector = self._projector(**kwargs)
+        cube = self.emission_cube(projector)
+        bricks = self.occupancy(projector, kwargs.get('brick_size', 8))
+        projector.skip_empty(bricks, threshold * bricks.peak)
+
+        if kwargs.get('prjw', None) == 'tight' and projector.tight_width > 0:
+            projector = self._projector(**{**kwargs, 'prjw': projector.tight_width})
+            projector.skip_empty(bricks, threshold * bricks.peak)
+            self.width_scale = projector.tight_width / self.data.domain_width[0].value
+
+        image = projector.integrate(cube)[0]
+        self.skip_report = projector.skip_report()
+
+        return image
+
+    def slab_image(self, start, depth, **kwargs):
+        """Image of a slab of the current view, from partial integrals computed once per view
+
+        The first call for a view integrates the emission field once, storing the partial integrals
+        every `slab_stride` depth steps; later slabs of the same view (e.g. a scan of the slab center
+        through the box) are differences of two stored integrals. Slab boundaries are snapped to the
+        closest stored depths, which are about 1 / `slab_edges` of the view depth apart by default;
+        the actual front and back of the last slab are stored in `self.slab_bounds`. The partial
+        integrals of the `SLAB_CACHE_SIZE` most recently used views are kept.
+
+        :param start: Front of the slab along the line of sight, in code units from the box center
+        :type start: float
+        :param depth: Thickness of the slab in code units
+        :type depth: float
+        :param slab_stride: Number of depth steps between stored partial integrals, defaults to the
+            stride storing at most `slab_edges` + 1 depths
+        :type slab_stride: int, optional
+        :param slab_edges: Bound on the number of stored slab boundaries, which bounds the memory of
+            the partial integrals to (`slab_edges` + 1) images, defaults to 64
+        :type slab_edges: int, optional
+        :return: Slab intensity, transposed for `imshow` as `self.image`
+        :rtype: numpy.ndarray
+        """
+
+        view = self._view(**kwargs)
+        stride, edges = (kwargs.get('slab_stride', None), kwargs.get('slab_edges', 64))
+        key = (self.instr, str(self.channel), tuple(np.ravel(view['normal_vector'])),
+               tuple(np.ravel(view['north_vector'])), tuple(np.ravel(view['width'])),
+               tuple(np.ravel(view['resolution'])), view['depth'], stride, edges)
+
+        if key not in self.slab_sums:
+            projector = GridProjector(self.box, **view)
+            self.slab_sums[key] = projector.cumulative(self.emission_cube(projector), stride=stride,
+                                                       max_edges=edges)
+            while len(self.slab_sums) > self.SLAB_CACHE_SIZE:
+                self.slab_sums.popitem(last=False)
+        self.slab_sums.move_to_end(key)
+
+        sums = self.slab_sums[key]
+        self.slab_bounds = sums.bounds(start, depth)
+        return sums.slab(start, depth)[0].T
+
+    def proj_tiled(self, **kwargs):
+        """Projects the emission field tile by tile, with bounded memory
+
+        Tiles are bit-identical to the same pixels of an untiled `GridProjector` render of the view.
+
+        :param tile_size: Number of pixels along each tile edge
+        :type tile_size: int
+        :param workers: Number of worker processes rendering tiles in parallel, defaults to serial rendering
+        :type workers: int, optional
+        :param tile_out: Path of a .npy file receiving the image as a memory map, defaults to an in-memory array
+        :type tile_out: str, optional
+        :return: Channel intensity in the layout of `yt.off_axis_projection`
+        :rtype: numpy.ndarray
+        """
+
+        # A single-pixel projector is enough to sample the (view independent) emission cube
+        view = self._view(**kwargs)
+        cube = self.emission_cube(GridProjector(self.box, **{**view, 'resolution': 1}))
+
+        image = project_tiled(self.box, cube=cube, tile_size=kwargs['tile_size'],
+                              out=kwargs.get('tile_out', None), workers=kwargs.get('workers', None), **view)
+        return image[0]
+
+    def proj_sparse(self, **kwargs):
+        """Projects the emission field from a brick-compressed representation
+
+        The emissivity is computed by the imaging model one slab of bricks at a time and only bricks
+        reaching `sparse` times the peak emissivity are stored (cached per instrument and channel),
+        so memory and projection time scale with the emitting volume.
+
+        :param sparse: Emptiness threshold relative to the peak emissivity, defaults to 1e-6
+        :type sparse: float, optional
+        :param brick_size: Number of cells along each brick edge, defaults to 8
+        :type brick_size: int, optional
+        :return: Channel intensity in the layout of `yt.off_axis_projection`
+        :rtype: numpy.ndarray
+        """
+
+        threshold = kwargs.get('sparse', True)
+        threshold = 1e-6 if threshold is True else threshold
+        brick_size = kwargs.get('brick_size', 8)
+
+        key = (self.instr, str(self.channel), 'sparse', brick_size, threshold)
+        if key not in self.emission_cubes:
+            self.emission_cubes[key] = BrickCube.from_model(
+                self.imaging_model, self.box, brick_size=brick_size, rel_threshold=threshold)
+
+        return self._projector(**kwargs).integrate(self.emission_cubes[key])[0]
+
+    def proj_diagnostics(self, **kwargs):
+        """Projects the channel intensity together with diagnostic maps in one traversal
+
+        Entries of `diagnostics` are either names from `DIAGNOSTIC_MAPS` ('emission_measure',
+        'column_density', 'temperature' weighted by the channel emission) or dictionaries with
+        keys 'name', 'field' and optionally 'weight', 'power' and 'unit'. Results are stored
+        in `self.diagnostic_images` (same orientation as `self.image`).
+
+        :param diagnostics: Diagnostic maps to compute
+        :type diagnostics: list
+        :raises ValueError: Raised if a diagnostic name is not predefined
+        :return: Channel intensity in the layout of `yt.off_axis_projection`
+        :rtype: numpy.ndarray
+        """
+
+        emission = ('gas', self.imag_field)
+        names, fields, weights, powers, self.diagnostic_units = ([], [emission], [None], [1], {})
+        for entry in kwargs.get('diagnostics', []):
+            if isinstance(entry, str):
+                if entry not in DIAGNOSTIC_MAPS:
+                    raise ValueError(f"Unknown diagnostic map '{entry}', choose from {list(DIAGNOSTIC_MAPS)}"
+                                     " or provide a dictionary with 'name' and 'field'")
+                field, weight, power, unit = DIAGNOSTIC_MAPS[entry]
+                name = entry
+            else:
+                name, field = entry['name'], entry['field']
+                weight, power, unit = entry.get('weight', None), entry.get('power', 1), entry.get('unit', None)
+            names.append(name)
+            fields.append(field)
+            weights.append(emission if weight == 'emission' else weight)
+            powers.append(power)
+            self.diagnostic_units[name] = unit
+
+        projector = self._projector(**kwargs)
+        images = projector.project_fields(fields, weights=weights, powers=powers)
+
+        # transpose diagnostic maps (swap axes for imshow), as for self.image
+        self.diagnostic_images = {name: img.T for name, img in zip(names, images[1:])}
+
+        return images[0]
+
+    def absorption_negligible(self, tau_thin=1e-3):
+        """Whether the absorption of cool plasma is negligible for every view of the box
+
+        Bounds the optical depth by the largest absorption coefficient of the box times its diagonal,
+        from a reduction of the absorption field, without sampling it on a projector grid.
+
+        :param tau_thin: Optical depth below which absorption is neglected, defaults to 1e-3
+        :type tau_thin: float, optional
+        :raises ValueError: Raised if the imaging model has no absorption coefficient (e.g. XRT)
+        :rtype: bool
+        """
+
+        if not hasattr(self.imaging_model, 'make_absorption_fields'):
+            raise ValueError("Absorption is only modelled for EUV channels")
+        self.imaging_model.make_absorption_fields(self.data)
+
+        ds, left_edge, right_edge, _ = grid_extent(self.box)
+        source = self.box if hasattr(self.box, 'max') else ds.all_data()
+        kappa = float(source.max(('gas', 'aia_absorption')).to('1/cm').d)
+        diagonal = float(np.linalg.norm(right_edge - left_edge)) * float(ds.length_unit.to('cm').d)
+        return kappa * diagonal < tau_thin
+
+    def proj_absorbing(self, **kwargs):
+        """Projects the emission field front to back, attenuated by cool absorbing plasma
+
+        `proj_and_imag` uses the standard projection instead when `absorption_negligible`.
+
+        :param tau_max: Optical depth at which rays are terminated, defaults to 10
+        :type tau_max: float, optional
+        :raises ValueError: Raised if the imaging model has no absorption coefficient (e.g. XRT)
+        :return: Emergent intensity in the layout of `yt.off_axis_projection`
+        :rtype: numpy.ndarray
+        """
+
+        if not hasattr(self.imaging_model, 'make_absorption_fields'):
+            raise ValueError("Absorption is only modelled for EUV channels")
+        self.imaging_model.make_absorption_fields(self.data)
+
+        projector = self._projector(**kwargs)
+        cube = projector.sample_cube([('gas', self.imag_field), ('gas', 'aia_absorption')])
+        image, tau = projector.integrate_absorbing(cube, tau_max=kwargs.get('tau_max', 10.))
+
+        # transpose optical depth (swap axes for imshow), as for self.image
+        self.optical_depth = tau.T
+
+        return image
+
+    def make_doppler_cube(self, **kwargs):
+        """Bins the emission of the current channel by line-of-sight velocity in a single projection pass
+
+        :param vmin: Lower velocity limit in km/s, defaults to -300
+        :type vmin: float, optional
+        :param vmax: Upper velocity limit in km/s, defaults to 300
+        :type vmax: float, optional
+        :param vbins: Number of velocity bins, defaults to 60
+        :type vbins: int, optional
+        :param bulk_velocity: Velocity (km/s) of the frame the LOS velocities are measured in, defaults to 0
+        :type bulk_velocity: array-like, optional
+        :param rest_wavelength: Rest wavelength used to convert velocities to wavelengths,
+            defaults to the AIA channel wavelength (no wavelength axis for XRT)
+        :type rest_wavelength: astropy.units.Quantity, optional
+        :return: Spectral cube of shape (lambda, y, x); positive velocities are redshifts
+        :rtype: numpy.ndarray
+        """
+
+        if self.imag_field is None:
+            self.make_filter_image_field()
+        uv.make_los_velocity_field(self.data, self.view_settings['normal_vector'])
+
+        self.velocity_edges = np.linspace(kwargs.get('vmin', -300.), kwargs.get('vmax', 300.),
+                                          kwargs.get('vbins', 60) + 1)
+
+        field_parameters = {}
+        if kwargs.get('bulk_velocity', None) is not None:
+            field_parameters['bulk_velocity'] = self.data.arr(kwargs['bulk_velocity'], 'km/s')
+
+        projector = self._projector(**kwargs)
+        cube = projector.sample_cube([('gas', self.imag_field), ('gas', 'los_velocity')],
+                                     field_parameters=field_parameters)
+        doppler = projector.integrate_binned(cube, self.velocity_edges)
+
+        # transpose every velocity slice (swap axes for imshow), as for self.image
+        self.doppler_cube = np.ascontiguousarray(doppler.transpose(0, 2, 1))
+
+        rest_wavelength = kwargs.get('rest_wavelength', None)
+        if rest_wavelength is None and self.instr == 'aia':
+            rest_wavelength = u.Quantity(self.channel, u.angstrom)
+        if rest_wavelength is not None:
+            v_centers = 0.5 * (self.velocity_edges[1:] + self.velocity_edges[:-1]) * u.km / u.s
+            self.doppler_wavelengths = rest_wavelength * (1 + v_centers / const.c)
+
+        return self.doppler_cube
+
     def scale_factor(self):
         """
         This function will determine a scale factor to use with zoom_out method based on
@@ -412,19 +879,51 @@ class SyntheticImage(ABC):
         :return: Synthetic sunpy map created with projected dataset and specified header data
         :rtype: sunpy.map.Map
         """
+        result = self.make_synthetic_result(**kwargs)
+        with self.timer.stage('synthetic_map'):
+            return result.map
+
+    @property
+    def synth_map(self):
+        """Synthetic sunpy map, created from `self.result` on first access"""
+        if self.result.has_map:
+            return self.result.map
+        with self.timer.stage('synthetic_map'):
+            return self.result.map
+
+    @property
+    def timings(self):
+        """Records of the instrumented stages (reference_image, dataset, view_vectors, proj_and_imag
+        with its emission_field and projection, diff_roll, synthetic_result, synthetic_map), with
+        their parent stage, wall and CPU times in seconds and peak memory in bytes; empty if the
+        image has no `timer`. `timer.summary()` gives the totals per stage.
+
+        :rtype: list
+        """
+        return self.timer.records
+
+    @timed('synthetic_result')
+    def make_synthetic_result(self, **kwargs):
+        """
+        Attaches the FITS header to the synthetic image without creating a sunpy map
+
+        :return: Synthetic image and header; the sunpy map is built on access to its `map` attribute
+        :rtype: SyntheticResult
+        """
         # Define header parameters for the synthetic image
 
         # Coordinates can be passed from sunpy maps that comparisons are made width
         self.reference_coord = self.ref_img.reference_coordinate
         self.reference_pixel = u.Quantity(self.ref_img.reference_pixel)
 
-        asec2cm = _radius_from_angular_radius(1. * u.arcsec, 1 * u.AU).to(u.cm)  # centimeters per arcsecond at 1 AU
+        asec2cm = sunpy.coordinates.sun._radius_from_angular_radius(1. * u.arcsec, 1 * u.AU).to(u.cm)  # centimeters per arcsecond at 1 AU
         resolution = self.plot_settings['resolution']
         domain_size = self.domain_width.max()
         len_asec = (domain_size/asec2cm).value
         scale_ = [len_asec/resolution, len_asec/resolution]
 
-        self.scale = kwargs.get('scale', u.Quantity(self.ref_img.scale))
+        # A narrowed image plane (prjw='tight') spreads the same pixels over a smaller width
+        self.scale = kwargs.get('scale', self.width_scale * u.Quantity(self.ref_img.scale))
         self.telescope = kwargs.get('telescope', self.ref_img.detector)
         self.observatory = kwargs.get('observatory', self.ref_img.observatory)
         self.detector = kwargs.get('detector', self.ref_img.detector)
@@ -435,67 +934,200 @@ class SyntheticImage(ABC):
         self.poisson = kwargs.get('poisson', None)
 
         if self.poisson:
+            from skimage.util import random_noise
             self.image = 0.5*np.max(self.image) * random_noise(self.image / (0.5*np.max(self.image)), mode='poisson')
+
+        # PSF, photon statistics and read noise of the instrument, converting DN/s into DN
+        if kwargs.get('forward_model', False):
+            self.image = self.make_forward_model(**kwargs).apply(np.array(self.image, dtype=np.float32),
+                                                                 seed=kwargs.get('seed', None),
+                                                                 psf=kwargs.get('psf', True),
+                                                                 noise=kwargs.get('noise', True))
         
         ref_pix = u.Quantity((self.reference_pixel[0].value, # - self.image_shift[0],
                               self.reference_pixel[1].value) # - self.image_shift[1],
                               ) * u.pix
 
-        if self.instr.lower() == 'xrt':
-            header = make_fitswcs_header(self.image,
-                                         coordinate=self.reference_coord,
-                                         reference_pixel=ref_pix,
-                                         scale=self.scale,
-                                         telescope=self.telescope,
-                                         detector=self.detector,
-                                         instrument=self.instrument,
-                                         observatory=self.observatory,
-                                         wavelength=self.wavelength,
-                                         exposure=self.exposure,
-                                         unit=self.unit,
-                                         )
-
-            # Determine filter wheel
-            filter_wheel1_measurements = ["Al_med", "Al_poly", "Be_med",
-                                  "Be_thin", "C_poly", "Open"]
-            filter_wheel2_measurements = ["Open", "Al_mesh", "Al_thick",
-                                        "Be_thick", "Gband", "Ti_poly"]
-
-            if self.channel.replace("-", "_") in filter_wheel1_measurements:
-                # Add support only for one filter in the filter wheel
-                header['EC_FW1_'] = self.channel.replace("-", "_")
-                header['EC_FW2_'] = 'Open'
-            elif self.channel.replace("-", "_") in filter_wheel2_measurements:
-                header['EC_FW1_'] = 'Open'
-                header['EC_FW2_'] = self.channel.replace("-", "_")
-
-
-
-            s_map = sunpy.map.Map(self.image, header)
-            self.synth_map = sunpy.map.sources.XRTMap(s_map.data, s_map.fits_header)
-
-            self.synth_map.plot_settings['norm'] = colors.LogNorm(self.ref_img.min(), self.ref_img.max())
-            self.synth_map.plot_settings['cmap'] = self.plot_settings['cmap']
+        # The header only depends on the view settings and the image shape: reuse it as a template
+        header_key = (self.image.shape, str(self.reference_coord), tuple(ref_pix.value), str(self.scale),
+                      self.telescope, self.detector, self.instrument, self.observatory, str(self.wavelength),
+                      str(self.exposure), str(self.unit), self.instr, str(self.channel))
+        if self.header is None or self._header_key != header_key:
+            self.header = sunpy.map.make_fitswcs_header(self.image,
+                                              coordinate=self.reference_coord,
+                                              reference_pixel=ref_pix,
+                                              scale=self.scale,
+                                              telescope=self.telescope,
+                                              detector=self.detector,
+                                              instrument=self.instrument,
+                                              observatory=self.observatory,
+                                              wavelength=self.wavelength,
+                                              exposure=self.exposure,
+                                              unit=self.unit,
+                                              )
+
+            if self.instr.lower() == 'xrt':
+                # Determine filter wheel
+                filter_wheel1_measurements = ["Al_med", "Al_poly", "Be_med",
+                                      "Be_thin", "C_poly", "Open"]
+                filter_wheel2_measurements = ["Open", "Al_mesh", "Al_thick",
+                                            "Be_thick", "Gband", "Ti_poly"]
+
+                if self.channel.replace("-", "_") in filter_wheel1_measurements:
+                    # Add support only for one filter in the filter wheel
+                    self.header['EC_FW1_'] = self.channel.replace("-", "_")
+                    self.header['EC_FW2_'] = 'Open'
+                elif self.channel.replace("-", "_") in filter_wheel2_measurements:
+                    self.header['EC_FW1_'] = 'Open'
+                    self.header['EC_FW2_'] = self.channel.replace("-", "_")
+            self._header_key = header_key
+        header = self.header
+
+        # The sunpy map and its plot normalization are only built when accessed
+        self.result = SyntheticResult(self.image, header, instr=self.instr, cmap=self.plot_settings['cmap'],
+                                      norm_source=self.ref_img)
+
+        # Diagnostic maps share the WCS header of the synthetic image and are built on access
+        self.diagnostic_maps = DiagnosticMaps(self.diagnostic_images, header, self.diagnostic_units)
+
+        return self.result
+
+    def make_forward_model(self, **kwargs):
+        """Instrument forward model at the scale and exposure of the synthetic map
+
+        The model (and its cached PSF FFTs) is reused as long as the instrument, channel, exposure
+        and scale are unchanged.
+
+        :param psf_kernel: Measured PSF at the map scale, replacing the parametric PSF, defaults to None
+        :type psf_kernel: numpy.ndarray, optional
+        :return: Forward model of the instrument
+        :rtype: InstrumentModel
+        """
 
-        else:
-            header = make_fitswcs_header(self.image,
-                                         coordinate=self.reference_coord,
-                                         reference_pixel=ref_pix,
-                                         scale=self.scale,
-                                         telescope=self.telescope,
-                                         detector=self.detector,
-                                         instrument=self.instrument,
-                                         observatory=self.observatory,
-                                         wavelength=self.wavelength,
-                                         exposure=self.exposure,
-                                         unit=self.unit)
+        exposure = self.exposure if self.exposure is not None else 1. * u.s
+        scale = u.Quantity(self.scale).ravel()[0]
+        key = (self.instr, str(self.channel), u.Quantity(exposure, u.s).value, scale.value)
+
+        if self.forward_model is None or self._forward_model_key != key or 'psf_kernel' in kwargs:
+            self.forward_model = InstrumentModel(self.instr, channel=self.channel, exposure=exposure,
+                                                 scale=scale, psf=kwargs.get('psf_kernel', None))
+            self._forward_model_key = key
+        return self.forward_model
+
+    def noise_ensemble(self, n, seed=None, batch=32, stats=True, **kwargs):
+        """Noisy realizations of the projected image through the instrument forward model
+
+        Reuses the projected `image` (before any noise was added by `make_synthetic_map`) and the
+        cached forward model; no map or header is rebuilt. Member `i` is reproducible from `seed`.
+
+        :param n: Number of realizations
+        :type n: int
+        :param seed: Root seed of the ensemble, defaults to None
+        :type seed: int, optional
+        :param batch: Number of realizations generated at once, defaults to 32
+        :type batch: int, optional
+        :param stats: Stream the members into summary statistics instead of returning them, defaults to True
+        :type stats: bool, optional
+        :param percentiles: Percentiles tracked when streaming, defaults to (16, 50, 84)
+        :type percentiles: tuple, optional
+        :return: Streamed statistics, or all members as an array of shape (n, y, x) in DN
+        :rtype: EnsembleStats or numpy.ndarray
+        """
 
-            self.synth_map = sunpy.map.Map(self.image, header)
+        model = self.make_forward_model(**kwargs)
+        psf = kwargs.get('psf', True)
+        if stats:
+            return model.ensemble_stats(self.clean_image, n, seed=seed, batch=batch, psf=psf,
+                                        percentiles=kwargs.get('percentiles', (16, 50, 84)))
+        return model.realizations(self.clean_image, n, seed=seed, psf=psf)
+
+    def align_to_reference(self, **kwargs):
+        """Sub-pixel offset (and optionally rotation and scale) of the synthetic image relative to
+        the reference image, by FFT phase correlation
+
+        The correlator holding the windowed reference spectrum is cached, so aligning many views
+        against the same observation costs one FFT per view; it can also be shared between
+        instances through the `correlator` keyword.
+
+        :param correlator: Correlator built for the reference image, defaults to a cached one
+        :type correlator: rushlight.utils.alignment.PhaseCorrelator, optional
+        :param rotation_scale: Also estimate rotation and scale, defaults to False
+        :type rotation_scale: bool, optional
+        :param upsample: Sub-pixel precision of the shift is 1 / `upsample` pixels, defaults to 20
+        :type upsample: int, optional
+        :return: Dictionary with 'shift' (dy, dx) in pixels moving the synthetic image onto the reference,
+            'rotation' in degrees, 'scale' and 'peak' (correlation peak), also stored as `alignment`.
+            Images of different shapes are compared with their centers on top of each other
+        :rtype: dict
+        """
 
-            self.synth_map.plot_settings['norm'] = colors.LogNorm(self.ref_img.min(), self.ref_img.max())
-            self.synth_map.plot_settings['cmap'] = self.plot_settings['cmap']
+        correlator = kwargs.get('correlator', None)
+        if correlator is None:
+            key = (id(self.ref_img), kwargs.get('rotation_scale', False), kwargs.get('upsample', 20))
+            if self._correlator_key != key:
+                self._correlator = PhaseCorrelator(self.ref_img.data, upsample=key[2], rotation_scale=key[1])
+                self._correlator_key = key
+            correlator = self._correlator
+
+        # Pad or crop the synthetic image about its center to the shape of the reference; the shift
+        # is that of the exactly centered image
+        image, offset = center_to_shape(self.result.data, correlator.shape)
+
+        self.alignment = correlator.align(image)
+        self.alignment['shift'] = np.asarray(self.alignment['shift']) + offset
+        return self.alignment
+
+    def fit_view(self, bounds=None, **kwargs):
+        """Searches the view orientation that best reproduces the reference image
+
+        Tilts and rolls of the current view (see `view_search.orientation_vectors`) are rendered
+        from the cached emission cube and scored against the reference, coarse to fine; the search
+        is kept as `view_search`, so repeated calls with the same settings reuse its scores; a new base
+        view (e.g. after the update of a previous fit), `view`, `view_kwargs` or `checkpoint` starts a
+        new search. Other parametrizations (e.g. loop parameters) can be searched with `view` and
+        `view_kwargs`, see `ViewSearch`.
+
+        :param bounds: Parameter name -> (low, high), defaults to +-30 degrees of lon, lat and roll
+        :type bounds: dict, optional
+        :param samples: Number of grid points per parameter and level, defaults to 5
+        :type samples: int, optional
+        :param levels: Fraction of the full resolution rendered at each level, defaults to (0.25, 0.5, 1)
+        :type levels: tuple, optional
+        :param keep: Number of best candidates refined at the next level, defaults to 1
+        :type keep: int, optional
+        :param workers: Number of worker processes, defaults to serial rendering
+        :type workers: int, optional
+        :param checkpoint: JSON lines file of the scores, to resume an interrupted search, defaults to None
+        :type checkpoint: str, optional
+        :param update: Re-project the image along the best view, defaults to True
+        :type update: bool, optional
+        :return: Best parameters, their score and view vectors, see `ViewSearch.search`
+        :rtype: dict
+        """
 
-        return self.synth_map
+        view = self._view(**kwargs)
+        view_kwargs = kwargs.get('view_kwargs', {'normal_vector': view['normal_vector'],
+                                                 'north_vector': view['north_vector']})
+
+        # The search is rebuilt when its view, checkpoint or base view (e.g. after `update_los`) change
+        search_key = (kwargs.get('view', orientation_vectors), kwargs.get('checkpoint', None),
+                      self.instr, str(self.channel), repr(np.round(view['center'], 9).tolist()),
+                      round(float(view['width']), 9),
+                      repr({name: np.round(value, 9).tolist() if np.issubdtype(np.asarray(value).dtype, np.number)
+                            else value for name, value in sorted(view_kwargs.items())}))
+        if self.view_search is None or self._view_search_key != search_key:
+            self._view_search_key = search_key
+            self.view_search = ViewSearch(self.box, self.emission_cube(GridProjector(self.box, **view)),
+                                          self.ref_img.data, view['center'], view['width'],
+                                          view=kwargs.get('view', orientation_vectors), view_kwargs=view_kwargs,
+                                          checkpoint=kwargs.get('checkpoint', None))
+
+        best = self.view_search.search(bounds, samples=kwargs.get('samples', 5),
+                                       levels=kwargs.get('levels', (0.25, 0.5, 1.)),
+                                       keep=kwargs.get('keep', 1), workers=kwargs.get('workers', None))
+        if kwargs.get('update', True):
+            self.update_los(norm=best['normal_vector'], north=best['north_vector'])
+        return best
 
     def project_point(self, y_points):
         """Identify pixels where three-dimensional points from the original dataset are projected
@@ -507,12 +1139,12 @@ class SyntheticImage(ABC):
         :return: x, y -- pixels on which the point inside synthetic datacube projects to
         """
         # Orientation of synthetic flare from CLB
-        north_q = unyt_array(self.northvector, self.data.units.code_length)
-        norm_q = unyt_array(self.normvector, self.data.units.code_length)
-        ds_orientation = Orientation(norm_q, north_vector=north_q)
+        north_q = unyt.unyt_array(self.northvector, self.data.units.code_length)
+        norm_q = unyt.unyt_array(self.normvector, self.data.units.code_length)
+        ds_orientation = yt.utilities.orientation.Orientation(norm_q, north_vector=north_q)
 
         # Sun Center to bottom left pixel displacement
-        sc = SkyCoord(lon=0*u.deg, lat=0*u.deg, radius=1*u.cm,
+        sc = coordinates.SkyCoord(lon=0*u.deg, lat=0*u.deg, radius=1*u.cm,
             frame='heliographic_stonyhurst',
             observer='earth', 
             obstime=self.mpt_obstime
@@ -548,7 +1180,7 @@ class SyntheticImage(ABC):
         return map_ypoints_coords
 
 
-    def update_los(self, norm: unyt_array=None, north: unyt_array=None, **kwargs):
+    def update_los(self, norm: 'unyt_array'=None, north: 'unyt_array'=None, **kwargs):
         """Updates the normal and north vectors for the view settings and regenerates the image.
 
         :param norm: The new normal vector. If not provided, the current normal vector is retained.
@@ -571,7 +1203,7 @@ class SyntheticImage(ABC):
             self.view_settings = {'normal_vector': self.normvector,
                                   'north_vector': self.northvector}
             self.proj_and_imag(**kwargs)  # Re-project the image with new settings
-            self.make_synthetic_map(**kwargs)  # Recreate the synthetic map
+            self.make_synthetic_result(**kwargs)  # Recreate the synthetic image header (map built lazily)
 
         return norm, north  # Return the updated vectors
 
@@ -605,13 +1237,25 @@ class SyntheticImage(ABC):
         then saves it to a file if a file path is provided or creates a new file.
 
         :param target: The target to append to. Can be a file path (str) to a pickled dictionary,
-            an existing dictionary (dir), or None to start with an empty dictionary.
-        :type target: str or dict, optional
+            an existing dictionary (dir), a catalog (`SynthCatalog` or the path of a .db / .sqlite file),
+            or None to start with an empty dictionary.
+        :type target: str or dict or SynthCatalog, optional
         :returns: A tuple containing the updated synthetic object dictionary and the target file path.
+            For catalogs, only the record of this object is returned instead of the whole catalog.
         :rtype: tuple[dict, str]
         :raises TypeError: If `target` is not a string, a dictionary, or None.
         """
 
+        # Catalogs append a single indexed row instead of rewriting the whole file
+        if isinstance(target, SynthCatalog) or (isinstance(target, str) and target.endswith(CATALOG_SUFFIXES)):
+            this_synthobj = self.save_synthobj()
+            if isinstance(target, SynthCatalog):
+                target.add(this_synthobj)
+                return this_synthobj, target.path
+            with SynthCatalog(target) as catalog:
+                catalog.add(this_synthobj)
+            return this_synthobj, target
+
         synthobj = {}  # Initialize an empty dictionary for the synthetic object data
 
         # Load existing data if a target is provided
@@ -709,7 +1353,7 @@ class SyntheticFilterImage(SyntheticImage):
         elif self.instr == 'aia':
             imaging_model = uv.UVModel("temperature", "number_density", self.channel)
             try:
-                cmap['aia'] = cm.cmlist['sdoaia' + str(int(self.channel))]
+                cmap['aia'] = cm.cmlist['sdoaia' + str(int(u.Quantity(self.channel, u.angstrom).value))]
             except ValueError:
                 raise ValueError("AIA wavelength should be one of the following:"
                                  "1600, 1700, 4500, 94, 131, 171, 193, 211, 304, 335.")
@@ -717,7 +1361,7 @@ class SyntheticFilterImage(SyntheticImage):
             self.instr = 'aia'  # Band-aid for lack of different UV model
             imaging_model = uv.UVModel("temperature", "number_density", self.channel)
             try:
-                cmap['aia'] = cm.cmlist['sdoaia' + str(int(self.channel))]
+                cmap['aia'] = cm.cmlist['sdoaia' + str(int(u.Quantity(self.channel, u.angstrom).value))]
             except ValueError:
                 raise ValueError("AIA wavelength should be one of the following:"
                                  "1600, 1700, 4500, 94, 131, 171, 193, 211, 304, 335.")
@@ -730,6 +1374,7 @@ class SyntheticFilterImage(SyntheticImage):
 
         # Adds intensity fields to the self-contained dataset
         imaging_model.make_intensity_fields(self.data)
+        self.imaging_model = imaging_model
 
         field = str(self.instr) + '_filter_band'
         self.imag_field = field
@@ -783,10 +1428,13 @@ class SyntheticBandImage():
         self.binscale = kwargs.get('binscale', 'linear')
         self.obstime = kwargs.get('obstime', '2017-09-10')  # Observation time
 
-        self.view_settings = {'normal_vector': (0.0, 0.0, 1.0),  # pass vectors as mutable arguments
-                              'north_vector': (-0.7, -0.3, 0.0)}
+        self.view_settings = view_settings or {'normal_vector': (0.0, 0.0, 1.0),  # pass vectors as mutable arguments
+                                               'north_vector': (-0.7, -0.3, 0.0)}
+        self.plot_settings = plot_settings or {'resolution': kwargs.get('resolution', 256)}
         self.imag_field = None
+        self.imaging_model = None
         self.image = None
+        self.spectral_cube = None
 
         if self.box:
             self.domain_width = np.abs(self.box.right_edge - self.box.left_edge).in_units('cm').to_astropy()
@@ -794,13 +1442,71 @@ class SyntheticBandImage():
             self.domain_width = self.data.domain_width.in_units("cm").to_astropy()  # convert unyt to astropy.units
 
     def make_band_image_field(self, **kwargs):
+        """Selects the emission model for the energy band and adds its band-integrated field to the dataset
+
+        :raises ValueError: Raised if the emission model is unrecognized
+        """
 
-        cmap = {}
         imaging_model = None
 
         if self.emission_model == 'Thermal':
-            imaging_model = xray_bremsstrahlung.ThermalBremsstrahlungModel
+            imaging_model = xray_bremsstrahlung.ThermalBremsstrahlungModel("temperature", "number_density",
+                                                                           self.emin, self.emax, self.nbins,
+                                                                           binscale=self.binscale)
+        else:
+            raise ValueError("Only the 'Thermal' emission model is currently available")
 
         imaging_model.make_intensity_fields(self.data)
-        field = 'xray_' + str(self.emin) + '_' + str(self.emax) + '_keV_band'
-        self.imag_field = field
+        self.imaging_model = imaging_model
+        self.energy_edges = imaging_model.energy_edges
+
+        self.imag_field = imaging_model.field_name
+
+    def proj_and_imag(self, **kwargs):
+        """Projects the spectral emissivity of all energy bins in a single traversal of the dataset
+
+        The spectrum is evaluated once per cell, for groups of energy bins whose emissivity cube
+        (number of cells x bins) fits in `max_bytes`; each group is projected in one traversal.
+
+        :param prjw: Width of the projection in code units, defaults to the domain width
+        :type prjw: float, optional
+        :param bkg_fill: Value to fill the background (where image values are less than or equal to 0).
+        :type bkg_fill: float, optional
+        :param max_bytes: Memory bound of the emissivity of a group of energy bins, defaults to 256 MB
+        :type max_bytes: int, optional
+
+        :notes: `self.spectral_cube` holds one (y, x) image per energy bin, `self.image` their sum.
+        """
+
+        self.make_band_image_field()
+
+        source = self.box if self.box else self.data
+        try:
+            center = source.domain_center.value
+        except AttributeError:
+            center = source.center.value
+
+        projector = GridProjector(source, center,
+                                  normal_vector=self.view_settings['normal_vector'],
+                                  width=kwargs.get('prjw', self.data.domain_width[0].value),
+                                  resolution=self.plot_settings['resolution'],
+                                  north_vector=self.view_settings['north_vector'])
+
+        # Spectrum of every cell computed once rather than for every ray sample, for as many energy
+        # bins at a time as fit in `max_bytes` (one traversal per group of bins)
+        model = self.imaging_model
+        cube = projector.sample_cube([model.density_field, model.temperature_field])
+        group = int(np.clip(kwargs.get('max_bytes', 1 << 28) // (8 * cube.shape[0]), 1, self.nbins))
+        spectral = np.zeros((self.nbins,) + projector.resolution)
+        for start in range(0, self.nbins, group):
+            bins = slice(start, min(start + group, self.nbins))
+            spectral[bins] = projector.integrate(model.spectrum(cube[:, 0], cube[:, 1], bins=bins))
+
+        # transpose every bin image (swap axes for imshow), as in SyntheticImage
+        self.spectral_cube = np.ascontiguousarray(spectral.transpose(0, 2, 1))
+        self.image = self.spectral_cube.sum(axis=0)
+
+        self.bkg_fill = kwargs.get('bkg_fill', None)
+        if self.bkg_fill: self.image[self.image <= 0] = self.bkg_fill
+
+        return self.spectral_cube
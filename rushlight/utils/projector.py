@@ -0,0 +1,894 @@
+#!/usr/bin/env python
+# Ray-marching projector for uniform-grid datacubes, used where a product needs more than
+# one projected quantity (spectral bins, weighted maps, ...) from a single traversal
+
+import numpy as np
+
+from rushlight.utils.lazy import lazy_import
+from rushlight.utils.worker_pool import imap_shared, forks
+
+yt = lazy_import('yt')
+shared_fields = lazy_import('rushlight.utils.shared_fields')
+
+
+def _integrate_tile(task, tile):
+    """Integrates one tile with the settings of a `project_tiled` call"""
+    args, kwargs, cube, kernel, ncomp = task
+    if isinstance(args[0], shared_fields.SharedFieldsHandle):
+        # Spawned workers attach to the cube published by `project_tiled`
+        with shared_fields.SharedFields.attach(args[0]) as fields:
+            image = GridProjector(fields.dataset(), *args[1:], tile=tile, **kwargs).integrate(
+                fields.cube(), kernel=kernel, ncomp=ncomp)
+        return tile, image
+    return tile, GridProjector(*args, tile=tile, **kwargs).integrate(cube, kernel=kernel, ncomp=ncomp)
+
+
+def project_tiled(box, center, normal_vector, width, resolution, cube, north_vector=None, tile_size=512,
+                  out=None, workers=None, kernel=None, ncomp=None, **kwargs):
+    """Integrates a view tile by tile, bounding the memory used by the rays
+
+    Every tile is traced by its own `GridProjector` and written into `out` as soon as it is done;
+    the stitched image is bit-identical to `GridProjector.integrate` over the full image.
+
+    :param box: Dataset or region containing the cells to project
+    :type box: yt Dataset, YTRegion
+    :param center: Center of the view port in code units
+    :type center: array-like
+    :param normal_vector: Line of sight direction
+    :type normal_vector: array-like
+    :param width: Width of the image plane in code units, either one value or (width_x, width_y)
+    :type width: float, tuple
+    :param resolution: Number of pixels across the image plane, either one value or (nx, ny)
+    :type resolution: int, tuple
+    :param cube: Cell values from `GridProjector.sample_cube` (or `SharedFields.cube`), or a `BrickCube`
+    :type cube: numpy.ndarray, BrickCube
+    :param north_vector: Vector pointing "up" in the image plane, defaults to None
+    :type north_vector: array-like, optional
+    :param tile_size: Number of pixels along each tile edge, defaults to 512
+    :type tile_size: int, optional
+    :param out: Preallocated output of shape (ncomp, nx, ny), or the path of a .npy file to create as
+        a memory map, defaults to a new array
+    :type out: numpy.ndarray, str, optional
+    :param workers: Number of worker processes rendering tiles in parallel, defaults to serial rendering.
+        Where workers cannot be forked, a dense `cube` is shared through `SharedFields` and `kernel`
+        must be picklable
+    :type workers: int, optional
+    :param kernel: Function mapping gathered samples to the integrated quantities, see `GridProjector.integrate`
+    :type kernel: callable, optional
+    :param ncomp: Number of quantities returned by `kernel`, defaults to the number of fields
+    :type ncomp: int, optional
+    :return: Projected images of shape (ncomp, nx, ny)
+    :rtype: numpy.ndarray
+    """
+
+    nx, ny = (int(r) for r in np.broadcast_to(np.asarray(resolution), (2,)))
+    ncomp = ncomp or cube.shape[1]
+    if out is None:
+        out = np.zeros((ncomp, nx, ny), dtype=np.float64)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=np.float64, shape=(ncomp, nx, ny))
+
+    tiles = [(x0, min(x0 + tile_size, nx), y0, min(y0 + tile_size, ny))
+             for x0 in range(0, nx, tile_size) for y0 in range(0, ny, tile_size)]
+
+    # Forked workers inherit the cube and the dataset instead of receiving copies; elsewhere a dense
+    # cube is published once in shared memory and the workers attach to it
+    shared = None
+    if workers and workers > 1 and len(tiles) > 1 and not forks() and isinstance(cube, np.ndarray):
+        shared = shared_fields.SharedFields.share(box, cube)
+    source, values = (box, cube) if shared is None else (shared.handle, None)
+    task = ((source, center, normal_vector, width, (nx, ny), north_vector), kwargs, values, kernel, ncomp)
+    try:
+        for tile, image in imap_shared(_integrate_tile, tiles, task, workers):
+            out[:, tile[0]:tile[1], tile[2]:tile[3]] = image
+    finally:
+        if shared is not None:
+            shared.close()
+
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+def grid_extent(box):
+    """Bounds and number of the cells covered by a dataset or region
+
+    :param box: Dataset or region containing the cells
+    :type box: yt Dataset, YTRegion
+    :return: Dataset, left and right edges in code units and the number of cells along each axis
+    :rtype: tuple
+    """
+
+    ds = box if isinstance(box, yt.data_objects.static_output.Dataset) else box.ds
+    if isinstance(box, yt.data_objects.static_output.Dataset):
+        left_edge = ds.domain_left_edge.to('code_length').d
+        right_edge = ds.domain_right_edge.to('code_length').d
+    else:
+        left_edge = box.left_edge.to('code_length').d
+        right_edge = box.right_edge.to('code_length').d
+
+    cell = (ds.domain_width.to('code_length').d / ds.domain_dimensions)
+    dims = np.rint((right_edge - left_edge) / cell).astype(np.int64)
+    return ds, left_edge, right_edge, dims
+
+
+class GridProjector:
+    """
+    ## Off-axis projector operating on a uniform covering grid of the synthetic datacube
+
+    Reproduces the view geometry of `yt.off_axis_projection` (same center, normal / north vectors,
+    width and resolution) but marches all rays through the cube in lock-step, one depth sample
+    at a time. Every sample gathers *all* requested fields at once, so several quantities (or a
+    vector-valued emissivity such as a spectrum) are integrated in one traversal instead of one
+    projection per quantity.
+
+    Images are returned in the same layout as `yt.off_axis_projection` (first axis along the
+    east vector, second along the north vector) and integrated over path length in cm.
+    """
+
+    def __init__(self, box, center, normal_vector, width, resolution, north_vector=None, depth=None, **kwargs):
+        """
+        ### Constructor for the projector
+
+        :param box: Dataset or region containing the cells to project
+        :type box: yt Dataset, YTRegion
+        :param center: Center of the view port in code units
+        :type center: array-like
+        :param normal_vector: Line of sight direction
+        :type normal_vector: array-like
+        :param width: Width of the image plane in code units, either one value or (width_x, width_y)
+        :type width: float, tuple
+        :param resolution: Number of pixels across the image plane, either one value or (nx, ny)
+        :type resolution: int, tuple
+        :param north_vector: Vector pointing "up" in the image plane, defaults to None
+        :type north_vector: array-like, optional
+        :param depth: Extent of the integration along the line of sight in code units,
+            defaults to the first element of `width` (as in `yt.off_axis_projection`)
+        :type depth: float, optional
+        :param sampling: Depth step as a fraction of the smallest cell size, defaults to 0.5
+        :type sampling: float, optional
+        :param tile: Pixel ranges (x0, x1, y0, y1) of the full image traced by this projector; its images
+            then have the shape of the tile and are bit-identical to the same pixels of the full image.
+            Defaults to the full image
+        :type tile: tuple, optional
+        """
+
+        self.box = box
+        self.ds, self.left_edge, self.right_edge, self.dims = grid_extent(box)
+        self.dx = (self.right_edge - self.left_edge) / self.dims
+        self.strides = np.array([self.dims[1] * self.dims[2], self.dims[2], 1], dtype=np.int64)
+
+        # Camera orientation: [east, north, normal], as used by yt (copies: yt normalizes them in place)
+        normal_vector = np.array(normal_vector, dtype=np.float64)
+        if north_vector is not None:
+            north_vector = np.array(north_vector, dtype=np.float64)
+        orientation = yt.utilities.orientation.Orientation(normal_vector, north_vector=north_vector)
+        self.unit_vectors = np.asarray(orientation.unit_vectors, dtype=np.float64)
+
+        self.center = np.asarray(getattr(center, 'd', center), dtype=np.float64)
+        self.width = np.broadcast_to(np.asarray(width, dtype=np.float64), (2,)).copy()
+        self.full_resolution = tuple(int(r) for r in np.broadcast_to(np.asarray(resolution), (2,)))
+        self.depth = float(depth) if depth else float(self.width[0])
+
+        self.tile = tuple(kwargs.get('tile', None) or (0, self.full_resolution[0], 0, self.full_resolution[1]))
+        self.resolution = (self.tile[1] - self.tile[0], self.tile[3] - self.tile[2])
+
+        # Pixel centers in the image plane, flattened in (east, north) order
+        nx, ny = self.full_resolution
+        px = ((np.arange(self.tile[0], self.tile[1]) + 0.5) / nx - 0.5) * self.width[0]
+        py = ((np.arange(self.tile[2], self.tile[3]) + 0.5) / ny - 0.5) * self.width[1]
+        px, py = np.meshgrid(px, py, indexing='ij')
+        self.pixel_origins = (self.center
+                              + px.reshape(-1, 1) * self.unit_vectors[0]
+                              + py.reshape(-1, 1) * self.unit_vectors[1])
+
+        # Depth sampling, centered on the view port
+        self.step = kwargs.get('sampling', 0.5) * self.dx.min()
+        nsteps = int(np.ceil(self.depth / self.step))
+        self.t = -0.5 * self.depth + (np.arange(nsteps) + 0.5) * self.step
+
+        self.t_near, self.t_far = self._ray_limits(self.left_edge, self.right_edge)
+
+        # Empty-space skipping (see `skip_empty`) and sample counter
+        self._brick_mask, self._brick_size, self._brick_strides = (None, None, None)
+        self.skip_threshold = None
+        self.samples_visited = 0
+
+        # Continuous cell coordinates of each ray: index = origin + t * direction
+        self._cell_origin = (self.pixel_origins - self.left_edge) / self.dx
+        self._cell_direction = self.unit_vectors[2] / self.dx
+
+    @property
+    def path_length(self):
+        """Length of one depth step in cm"""
+        return self.step * float(self.ds.length_unit.to('cm').d)
+
+    def _ray_limits(self, left_edge, right_edge):
+        """Entry and exit parameters of every ray through a box (slab method)
+
+        :param left_edge: Lower corner of the box in code units
+        :type left_edge: numpy.ndarray
+        :param right_edge: Upper corner of the box in code units
+        :type right_edge: numpy.ndarray
+        :return: `t_near`, `t_far` arrays; rays missing the box have `t_near >= t_far`
+        :rtype: tuple (numpy.ndarray, numpy.ndarray)
+        """
+
+        direction = self.unit_vectors[2]
+        t_near = np.full(len(self.pixel_origins), -np.inf)
+        t_far = np.full(len(self.pixel_origins), np.inf)
+
+        for axis in range(3):
+            origin = self.pixel_origins[:, axis]
+            lo, hi = left_edge[axis], right_edge[axis]
+            if direction[axis] == 0:
+                # Rays parallel to this slab either always or never lie within it
+                outside = (origin < lo) | (origin >= hi)
+                t_near[outside] = np.inf
+                t_far[outside] = -np.inf
+                continue
+            t1 = (lo - origin) / direction[axis]
+            t2 = (hi - origin) / direction[axis]
+            t_near = np.maximum(t_near, np.minimum(t1, t2))
+            t_far = np.minimum(t_far, np.maximum(t1, t2))
+
+        return t_near, t_far
+
+    def _count_samples(self, t_near, t_far):
+        """Number of depth samples every ray takes between `t_near` and `t_far`"""
+        return np.clip(np.searchsorted(self.t, t_far) - np.searchsorted(self.t, t_near), 0, None)
+
+    def skip_empty(self, bricks, threshold):
+        """Restricts the traversal to the bricks where the projected field can reach `threshold`
+
+        Rays are clipped to the bounding box of the occupied bricks and samples falling in
+        empty bricks inside it are skipped. The absolute error of an integrated pixel is at most
+        `threshold` times the longest chord through the cells (see `skip_report`).
+
+        :param bricks: Occupancy summary of the projected field
+        :type bricks: BrickMap
+        :param threshold: Absolute value below which a brick is considered empty
+        :type threshold: float
+        """
+
+        full_near, full_far = self._ray_limits(self.left_edge, self.right_edge)
+        self._samples_total = int(self._count_samples(full_near, full_far).sum())
+        self._max_chord = float(np.clip(full_far - full_near, 0, self.depth).max())
+
+        occupied = bricks.occupied(threshold)
+        bounds = bricks.bounds(threshold)
+        self.skip_threshold = threshold
+        self._bricks_skipped = 1. - occupied.mean()
+
+        if bounds is None:
+            self.t_near = np.full(len(self.pixel_origins), np.inf)
+            self.t_far = np.full(len(self.pixel_origins), -np.inf)
+            self.tight_width = 0.
+        else:
+            lo = self.left_edge + bounds[0] * self.dx
+            hi = self.left_edge + bounds[1] * self.dx
+            self.t_near, self.t_far = self._ray_limits(lo, hi)
+
+            # Smallest square image plane width containing the occupied region
+            corners = np.array(np.meshgrid(*zip(lo, hi), indexing='ij')).reshape(3, -1).T - self.center
+            self.tight_width = float(2 * np.abs(corners @ self.unit_vectors[:2].T).max())
+
+        self._brick_mask = occupied.ravel()
+        self._brick_size = bricks.brick_size
+        self._brick_strides = np.array([occupied.shape[1] * occupied.shape[2], occupied.shape[2], 1],
+                                        dtype=np.int64)
+        self.samples_visited = 0
+
+    def skip_report(self):
+        """Summarizes the last traversal with empty-space skipping
+
+        :return: Dictionary with the threshold, fraction of skipped bricks, visited / total ray samples,
+            skipped fraction of the samples, estimated speedup, absolute error bound (integrand times cm)
+            and the tight image plane width (code units)
+        :rtype: dict
+        """
+
+        if self.skip_threshold is None:
+            raise ValueError("Empty-space skipping was not enabled, see GridProjector.skip_empty")
+
+        visited = self.samples_visited
+        return {'threshold': self.skip_threshold,
+                'bricks_skipped': float(self._bricks_skipped),
+                'samples_total': self._samples_total,
+                'samples_visited': visited,
+                'skipped_fraction': 1. - visited / self._samples_total if self._samples_total else 0.,
+                'speedup': self._samples_total / visited if visited else np.inf,
+                'error_bound': self.skip_threshold * self._max_chord * float(self.ds.length_unit.to('cm').d),
+                'tight_width': self.tight_width}
+
+    def sample_cube(self, fields, field_parameters=None):
+        """Reads the requested fields of the projected cells into a single array
+
+        :param fields: Field names, as accepted by yt
+        :type fields: list
+        :param field_parameters: Field parameters used by derived fields (e.g. 'bulk_velocity'), defaults to None
+        :type field_parameters: dict, optional
+        :return: Array of shape (ncells, nfields) in cell order matching the projector indices
+        :rtype: numpy.ndarray
+        """
+
+        cg = self.ds.covering_grid(level=0, left_edge=self.left_edge, dims=self.dims)
+        for name, value in (field_parameters or {}).items():
+            cg.set_field_parameter(name, value)
+        cube = np.empty((int(np.prod(self.dims)), len(fields)), dtype=np.float64)
+        for n, field in enumerate(fields):
+            cube[:, n] = np.asarray(cg[field].d, dtype=np.float64).ravel()
+        return cube
+
+    def march(self, cube, steps=None, active=None):
+        """Walks all rays through the cube one depth step at a time, front to back
+
+        :param cube: Cell values from `sample_cube`, shape (ncells, nfields), or a brick-compressed cube
+        :type cube: numpy.ndarray, BrickCube
+        :param steps: Indices of the depth steps to visit, defaults to all of them
+        :type steps: array-like, optional
+        :param active: Boolean mask of the rays still being traced. It is read at every step, so the
+            caller may switch rays off (early ray termination) while iterating; defaults to all rays
+        :type active: numpy.ndarray, optional
+        :return: Generator of (step index, flat indices of the pixels whose rays are inside the
+            cube, gathered samples of shape (npixels, nfields))
+        :rtype: generator
+        """
+
+        t_near, t_far = self.t_near, self.t_far
+        if isinstance(cube, BrickCube):
+            # Rays only need to cross the bounding box of the stored bricks
+            bounds = cube.bounds()
+            if bounds is None:
+                return
+            near, far = self._ray_limits(self.left_edge + bounds[0] * self.dx, self.left_edge + bounds[1] * self.dx)
+            t_near, t_far = np.maximum(t_near, near), np.minimum(t_far, far)
+
+        if steps is None:
+            # Only the depth range crossed by at least one ray
+            hit = t_near < t_far
+            if not hit.any():
+                return
+            steps = range(np.searchsorted(self.t, t_near[hit].min()),
+                          np.searchsorted(self.t, t_far[hit].max()))
+
+        for k in steps:
+            t = self.t[k]
+            inside = (t_near <= t) & (t < t_far)
+            if active is not None:
+                if not active.any():
+                    return
+                inside &= active
+            pix = np.nonzero(inside)[0]
+            if pix.size == 0:
+                continue
+            idx = (self._cell_origin[pix] + t * self._cell_direction).astype(np.int64)
+            np.clip(idx, 0, self.dims - 1, out=idx)
+            if self._brick_mask is not None:
+                keep = self._brick_mask[(idx // self._brick_size) @ self._brick_strides]
+                pix, idx = pix[keep], idx[keep]
+                if pix.size == 0:
+                    continue
+            if isinstance(cube, BrickCube):
+                keep, samples = cube.gather(idx)
+                pix = pix[keep]
+                if pix.size == 0:
+                    continue
+            else:
+                samples = cube[idx @ self.strides]
+            self.samples_visited += pix.size
+            yield k, pix, samples
+
+    def integrate(self, cube, kernel=None, ncomp=None):
+        """Integrates cell values (or a function of them) along every ray in one traversal
+
+        :param cube: Cell values from `sample_cube`, shape (ncells, nfields), or a brick-compressed cube
+        :type cube: numpy.ndarray, BrickCube
+        :param kernel: Function mapping gathered samples (npixels, nfields) to the integrated
+            quantities (npixels, ncomp), e.g. an emissivity spectrum; defaults to the samples themselves
+        :type kernel: callable, optional
+        :param ncomp: Number of quantities returned by `kernel`, defaults to the number of fields
+        :type ncomp: int, optional
+        :return: Projected images of shape (ncomp, nx, ny) in units of the integrand times cm
+        :rtype: numpy.ndarray
+        """
+
+        ncomp = ncomp or cube.shape[1]
+        image = np.zeros((int(np.prod(self.resolution)), ncomp), dtype=np.float64)
+
+        for k, pix, samples in self.march(cube):
+            image[pix] += kernel(samples) if kernel else samples
+
+        image *= self.path_length
+        return image.T.reshape((ncomp,) + self.resolution)
+
+    def cumulative(self, cube, stride=None, kernel=None, ncomp=None, max_edges=64):
+        """Partial line-of-sight integrals at every `stride` depth steps, from one traversal
+
+        Any slab of the view is then the difference of two partial integrals, see `SlabSums.slab`.
+        The stored integrals take (number of stored depths) x (number of pixels) x `ncomp` x 8 bytes,
+        e.g. 0.5 GB for 65 depths of a 1024 x 1024 image.
+
+        :param cube: Cell values from `sample_cube`, shape (ncells, nfields), or a brick-compressed cube
+        :type cube: numpy.ndarray, BrickCube
+        :param stride: Number of depth steps between stored partial integrals, which sets both the memory
+            use and the granularity of the slab boundaries, defaults to the smallest stride storing at
+            most `max_edges` + 1 depths
+        :type stride: int, optional
+        :param kernel: Function mapping gathered samples to the integrated quantities, see `integrate`
+        :type kernel: callable, optional
+        :param ncomp: Number of quantities returned by `kernel`, defaults to the number of fields
+        :type ncomp: int, optional
+        :param max_edges: Bound on the number of stored slab boundaries without `stride`, defaults to 64
+        :type max_edges: int, optional
+        :return: Stored partial integrals of the view
+        :rtype: SlabSums
+        """
+
+        ncomp = ncomp or cube.shape[1]
+        stride = stride or max(1, int(np.ceil(len(self.t) / max_edges)))
+        bounds = np.append(np.arange(0, len(self.t), stride), len(self.t))
+        sums = np.zeros((len(bounds), int(np.prod(self.resolution)), ncomp), dtype=np.float64)
+        running = np.zeros(sums.shape[1:], dtype=np.float64)
+
+        # sums[j] holds the integral over the depth steps k < bounds[j]
+        j = 0
+        for k, pix, samples in self.march(cube):
+            while bounds[j] <= k:
+                sums[j] = running
+                j += 1
+            running[pix] += kernel(samples) if kernel else samples
+        sums[j:] = running
+
+        sums *= self.path_length
+        t_edges = -0.5 * self.depth + bounds * self.step
+        return SlabSums(sums.transpose(0, 2, 1).reshape((len(bounds), ncomp) + self.resolution), t_edges)
+
+    def project_fields(self, fields, weights=None, powers=None, field_parameters=None):
+        """Projects several fields, optionally weighted, with shared sampling in one traversal
+
+        Every distinct field (including weights) is read once; unweighted entries are integrated
+        along the line of sight, weighted entries are averaged as int(f w dl) / int(w dl), as
+        done by `yt.off_axis_projection` with a `weight`.
+
+        :param fields: Field names to project
+        :type fields: list
+        :param weights: Weight field for every entry, or None for a plain integral, defaults to no weights
+        :type weights: list, optional
+        :param powers: Exponent applied to every field before integration (e.g. 2 for n^2), defaults to 1
+        :type powers: list, optional
+        :param field_parameters: Field parameters used by derived fields, defaults to None
+        :type field_parameters: dict, optional
+        :return: One image of shape (nx, ny) per entry of `fields`
+        :rtype: list of numpy.ndarray
+        """
+
+        weights = weights or [None] * len(fields)
+        powers = powers or [1] * len(fields)
+        weight_fields = list(dict.fromkeys(w for w in weights if w is not None))
+        unique = list(dict.fromkeys(list(fields) + weight_fields))
+        column = {f: n for n, f in enumerate(unique)}
+        nout = len(fields) + len(weight_fields)
+
+        def kernel(samples):
+            out = np.empty((len(samples), nout))
+            for n, (f, w, p) in enumerate(zip(fields, weights, powers)):
+                value = samples[:, column[f]] if p == 1 else samples[:, column[f]]**p
+                out[:, n] = value * samples[:, column[w]] if w is not None else value
+            for m, w in enumerate(weight_fields):
+                out[:, len(fields) + m] = samples[:, column[w]]
+            return out
+
+        images = self.integrate(self.sample_cube(unique, field_parameters), kernel=kernel, ncomp=nout)
+
+        result = []
+        for n, w in enumerate(weights):
+            if w is None:
+                result.append(images[n])
+            else:
+                norm = images[len(fields) + weight_fields.index(w)]
+                result.append(np.divide(images[n], norm, out=np.zeros_like(norm), where=norm > 0))
+        return result
+
+    def integrate_binned(self, cube, bin_edges, kernel=None):
+        """Integrates a quantity along every ray, sorted into bins of a second per-sample quantity
+
+        All bins are preallocated and filled during a single traversal, e.g. emissivity binned by
+        line-of-sight velocity gives a spectral cube. Samples falling outside the bins are dropped.
+
+        :param cube: Cell values from `sample_cube`, shape (ncells, nfields)
+        :type cube: numpy.ndarray
+        :param bin_edges: Monotonically increasing bin edges, length nbins + 1
+        :type bin_edges: array-like
+        :param kernel: Function mapping gathered samples (npixels, nfields) to the integrated quantity
+            and the binned quantity, both (npixels,); defaults to the first and second field
+        :type kernel: callable, optional
+        :return: Binned images of shape (nbins, nx, ny) in units of the integrand times cm
+        :rtype: numpy.ndarray
+        """
+
+        bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        nbins = len(bin_edges) - 1
+        image = np.zeros((int(np.prod(self.resolution)), nbins), dtype=np.float64)
+
+        for k, pix, samples in self.march(cube):
+            weight, value = kernel(samples) if kernel else (samples[:, 0], samples[:, 1])
+            bins = np.searchsorted(bin_edges, value, side='right') - 1
+            inside = (bins >= 0) & (bins < nbins)
+            # Each pixel appears once per step, so (pixel, bin) pairs are unique
+            image[pix[inside], bins[inside]] += weight[inside]
+
+        image *= self.path_length
+        return image.T.reshape((nbins,) + self.resolution)
+
+    def integrate_absorbing(self, cube, tau_max=10.):
+        """Integrates emission through an absorbing medium, front to back along every ray
+
+        Each step adds its emission attenuated by the optical depth accumulated in front of it.
+        Rays are terminated once their optical depth exceeds `tau_max`. Optically thin media are
+        better projected with `integrate`, see `SyntheticImage.absorption_negligible`.
+
+        :param cube: Cell values from `sample_cube`; emissivity in the first column and the
+            absorption coefficient (1/cm) in the second
+        :type cube: numpy.ndarray
+        :param tau_max: Optical depth at which rays are terminated, defaults to 10
+        :type tau_max: float, optional
+        :return: Emergent intensity and total optical depth along the rays (truncated at `tau_max`),
+            both of shape (nx, ny)
+        :rtype: tuple (numpy.ndarray, numpy.ndarray)
+        """
+
+        npix = int(np.prod(self.resolution))
+        ds_cm = self.path_length
+        image = np.zeros(npix, dtype=np.float64)
+        tau = np.zeros(npix, dtype=np.float64)
+        active = np.ones(npix, dtype=bool)
+
+        for k, pix, samples in self.march(cube, active=active):
+            dtau = samples[:, 1] * ds_cm
+            # Fraction of the step's own emission escaping through the step: (1 - exp(-dtau)) / dtau
+            with np.errstate(divide='ignore', invalid='ignore'):
+                escape = np.where(dtau > 1e-8, -np.expm1(-dtau) / dtau, 1. - 0.5 * dtau)
+            image[pix] += samples[:, 0] * ds_cm * np.exp(-tau[pix]) * escape
+            tau[pix] += dtau
+            active[pix] = tau[pix] < tau_max
+
+        return image.reshape(self.resolution), tau.reshape(self.resolution)
+
+
+class SlabSums:
+    """
+    ## Cumulative line-of-sight integrals of one view, from `GridProjector.cumulative`
+
+    Images of depth-limited slabs are differences of two stored partial integrals, so scanning a
+    slab through the volume costs one subtraction per slab instead of a projection.
+    Slab boundaries are snapped to the stored depths `t_edges`.
+    """
+
+    def __init__(self, sums, t_edges):
+        """
+        ### Constructor for the partial integrals
+
+        :param sums: Integrals from the front of the view to every stored depth, shape (nedges, ncomp, nx, ny)
+        :type sums: numpy.ndarray
+        :param t_edges: Stored depths along the line of sight, in code units from the view center
+        :type t_edges: numpy.ndarray
+        """
+
+        self.sums = sums
+        self.t_edges = t_edges
+
+    def _edge(self, t):
+        """Index of the stored depth closest to `t` (the last interval may be shorter than the others)"""
+        k = int(np.clip(np.searchsorted(self.t_edges, t), 1, max(len(self.t_edges) - 1, 1)))
+        return k - 1 if k == len(self.t_edges) or t - self.t_edges[k - 1] <= self.t_edges[k] - t else k
+
+    def bounds(self, start, depth):
+        """Actual front and back of a slab after snapping to the stored depths
+
+        :param start: Front of the slab along the line of sight, in code units from the view center
+        :type start: float
+        :param depth: Thickness of the slab in code units
+        :type depth: float
+        :return: Front and back depths of the slab
+        :rtype: tuple
+        """
+        return self.t_edges[self._edge(start)], self.t_edges[self._edge(start + depth)]
+
+    def slab(self, start, depth):
+        """Integral over a slab of the view
+
+        :param start: Front of the slab along the line of sight, in code units from the view center
+        :type start: float
+        :param depth: Thickness of the slab in code units
+        :type depth: float
+        :return: Images of shape (ncomp, nx, ny) in units of the integrand times cm
+        :rtype: numpy.ndarray
+        """
+        return self.sums[self._edge(start + depth)] - self.sums[self._edge(start)]
+
+    def scan(self, centers, depth):
+        """Slabs of fixed thickness centered on a sequence of depths
+
+        :param centers: Slab centers along the line of sight, in code units from the view center
+        :type centers: array-like
+        :param depth: Thickness of the slabs in code units
+        :type depth: float
+        :return: Images of shape (ncenters, ncomp, nx, ny)
+        :rtype: numpy.ndarray
+        """
+        return np.array([self.slab(center - 0.5 * depth, depth) for center in centers])
+
+
+class BrickMap:
+    """
+    ## Coarse occupancy summary of a cell field
+
+    Stores the minimum and maximum of the field over cubic bricks of `brick_size` cells, so that
+    regions that cannot contribute to a projection are found without touching the cells.
+    Depends only on the field, not on the view, and can be reused for every line of sight.
+    """
+
+    def __init__(self, values, dims, brick_size=8):
+        """
+        ### Constructor for the brick map
+
+        :param values: Cell values in projector order, shape (ncells,)
+        :type values: numpy.ndarray
+        :param dims: Number of cells along each axis
+        :type dims: array-like
+        :param brick_size: Number of cells along each brick edge, defaults to 8
+        :type brick_size: int, optional
+        """
+
+        self.dims = np.asarray(dims, dtype=np.int64)
+        self.brick_size = int(brick_size)
+        self.grid_shape = tuple(-(-self.dims // self.brick_size))
+
+        # Pad with edge values up to whole bricks, then reduce every brick
+        cells = np.asarray(values).reshape(tuple(self.dims))
+        pad = [(0, n * self.brick_size - d) for n, d in zip(self.grid_shape, self.dims)]
+        cells = np.pad(cells, pad, mode='edge')
+        blocks = cells.reshape(self.grid_shape[0], self.brick_size, self.grid_shape[1], self.brick_size,
+                               self.grid_shape[2], self.brick_size)
+        self.vmin = blocks.min(axis=(1, 3, 5))
+        self.vmax = blocks.max(axis=(1, 3, 5))
+
+    @property
+    def peak(self):
+        """Largest absolute value of the field"""
+        return float(max(np.abs(self.vmin).max(), np.abs(self.vmax).max()))
+
+    def occupied(self, threshold):
+        """Bricks containing values whose magnitude reaches `threshold`
+
+        :param threshold: Absolute value below which a brick is considered empty
+        :type threshold: float
+        :return: Boolean array over the bricks
+        :rtype: numpy.ndarray
+        """
+        return np.maximum(np.abs(self.vmin), np.abs(self.vmax)) >= threshold
+
+    def bounds(self, threshold):
+        """Cell index bounding box of the occupied bricks
+
+        :param threshold: Absolute value below which a brick is considered empty
+        :type threshold: float
+        :return: Lower (inclusive) and upper (exclusive) cell indices, or None if all bricks are empty
+        :rtype: tuple (numpy.ndarray, numpy.ndarray)
+        """
+        occupied = np.argwhere(self.occupied(threshold))
+        if len(occupied) == 0:
+            return None
+        lo = occupied.min(axis=0) * self.brick_size
+        hi = np.minimum((occupied.max(axis=0) + 1) * self.brick_size, self.dims)
+        return lo, hi
+
+
+class BrickCube:
+    """
+    ## Brick-compressed cell fields
+
+    Keeps only the bricks of `brick_size` cells in which the first field reaches a threshold,
+    together with a lookup table over the brick grid. Memory (and, through `GridProjector.march`,
+    projection time) scales with the number of emitting cells rather than with the domain size.
+    Cells outside the stored bricks are treated as zero.
+    """
+
+    def __init__(self, dims, brick_size, lookup, bricks):
+        """
+        ### Constructor for the brick-compressed cube, see `from_cube` and `from_grid`
+
+        :param dims: Number of cells along each axis
+        :type dims: array-like
+        :param brick_size: Number of cells along each brick edge
+        :type brick_size: int
+        :param lookup: Index of every brick in `bricks`, -1 for empty bricks, shape of the brick grid
+        :type lookup: numpy.ndarray
+        :param bricks: Values of the stored bricks, shape (nbricks, brick_size**3, nfields)
+        :type bricks: numpy.ndarray
+        """
+
+        self.dims = np.asarray(dims, dtype=np.int64)
+        self.brick_size = int(brick_size)
+        self.lookup = lookup
+        self.bricks = bricks
+        self.grid_shape = lookup.shape
+        self._brick_strides = np.array([self.grid_shape[1] * self.grid_shape[2], self.grid_shape[2], 1],
+                                       dtype=np.int64)
+        self._cell_strides = np.array([self.brick_size**2, self.brick_size, 1], dtype=np.int64)
+
+    @classmethod
+    def from_cube(cls, values, dims, brick_size=8, threshold=0., rel_threshold=None, dtype=np.float64):
+        """Compresses dense cell values, e.g. from `GridProjector.sample_cube`
+
+        :param values: Cell values, shape (ncells, nfields) or (ncells,)
+        :type values: numpy.ndarray
+        :param dims: Number of cells along each axis
+        :type dims: array-like
+        :param brick_size: Number of cells along each brick edge, defaults to 8
+        :type brick_size: int, optional
+        :param threshold: Bricks whose first field stays at or below this absolute value are dropped, defaults to 0
+        :type threshold: float, optional
+        :param rel_threshold: Additional threshold relative to the peak of the first field, defaults to None
+        :type rel_threshold: float, optional
+        :param dtype: Storage type of the bricks, defaults to numpy.float64
+        :type dtype: numpy.dtype, optional
+        :return: Brick-compressed cube
+        :rtype: BrickCube
+        """
+
+        dims = np.asarray(dims, dtype=np.int64)
+        cells = np.asarray(values).reshape(tuple(dims) + (-1,))
+        starts = range(0, dims[0], brick_size)
+        if rel_threshold:
+            peak = max((np.abs(cells[i:i + brick_size, ..., 0]).max(initial=0.) for i in starts), default=0.)
+            threshold = (threshold, rel_threshold * peak)
+        return cls._from_slabs((cells[i:i + brick_size] for i in starts), dims, brick_size, threshold, dtype)
+
+    @classmethod
+    def from_grid(cls, box, fields, brick_size=8, threshold=0., rel_threshold=None, dtype=np.float64,
+                  field_parameters=None):
+        """Reads fields of a dataset or region one slab of bricks at a time, keeping only emitting bricks
+
+        The dense cube is never held in memory: at most one slab of `brick_size` cells is read at once.
+        With `rel_threshold`, a first pass reads the first field slab by slab to find its peak, so
+        that the relative cut already applies while the bricks are collected. Cell order matches a
+        `GridProjector` built on the same `box`.
+
+        :param box: Dataset or region containing the cells
+        :type box: yt Dataset, YTRegion
+        :param fields: Field names, as accepted by yt; the first one decides which bricks are kept
+        :type fields: list
+        :param brick_size: Number of cells along each brick edge, defaults to 8
+        :type brick_size: int, optional
+        :param threshold: Bricks whose first field stays at or below this absolute value are dropped, defaults to 0
+        :type threshold: float, optional
+        :param rel_threshold: Additional threshold relative to the peak of the first field, defaults to None
+        :type rel_threshold: float, optional
+        :param dtype: Storage type of the bricks, defaults to numpy.float64
+        :type dtype: numpy.dtype, optional
+        :param field_parameters: Field parameters used by derived fields, defaults to None
+        :type field_parameters: dict, optional
+        :return: Brick-compressed cube
+        :rtype: BrickCube
+        """
+
+        ds, left_edge, right_edge, dims = grid_extent(box)
+        dx = (right_edge - left_edge) / dims
+
+        def slabs(fields):
+            for i in range(0, dims[0], brick_size):
+                slab_dims = [min(brick_size, dims[0] - i), dims[1], dims[2]]
+                cg = ds.covering_grid(level=0, left_edge=left_edge + [i * dx[0], 0., 0.], dims=slab_dims)
+                for name, value in (field_parameters or {}).items():
+                    cg.set_field_parameter(name, value)
+                yield np.stack([np.asarray(cg[field].d) for field in fields], axis=-1)
+
+        if rel_threshold:
+            peak = max((np.abs(slab).max(initial=0.) for slab in slabs(fields[:1])), default=0.)
+            threshold = (threshold, rel_threshold * peak)
+        return cls._from_slabs(slabs(fields), dims, brick_size, threshold, dtype)
+
+    @classmethod
+    def from_model(cls, model, box, **kwargs):
+        """Computes the emissivity of an imaging model brick by brick, keeping only emitting bricks
+
+        Memory scales with the number of emitting cells (e.g. a compact flare loop) rather than
+        with the domain size.
+
+        :param model: Imaging model with a `make_intensity_fields` method and an `emissivity_field`
+        :type model: UVModel, XRTModel
+        :param box: Dataset or region containing the cells
+        :type box: yt Dataset, YTRegion
+        :param kwargs: `brick_size`, `threshold`, `rel_threshold` and `dtype`, as in `from_grid`
+        :return: Brick-compressed emissivity with a single field
+        :rtype: BrickCube
+        """
+
+        model.make_intensity_fields(grid_extent(box)[0])
+        return cls.from_grid(box, [model.emissivity_field], **kwargs)
+
+    @classmethod
+    def _from_slabs(cls, slabs, dims, brick_size, threshold, dtype):
+        """Splits slabs of `brick_size` cells along the first axis into bricks and keeps the emitting ones
+
+        `threshold` is an absolute threshold, or a pair of an absolute threshold (exclusive) and of
+        an absolute value of the relative threshold (inclusive), applied slab by slab.
+        """
+
+        bs = brick_size
+        shape = tuple(-(-dims // bs))
+        lookup = np.full(shape, -1, dtype=np.int64)
+        threshold, cut = threshold if isinstance(threshold, tuple) else (threshold, None)
+        kept, count = ([], 0)
+
+        for i, slab in enumerate(slabs):
+            nfields = slab.shape[-1]
+            # Zero padding up to whole bricks; padded cells are never sampled
+            pad = [(0, bs - slab.shape[0]), (0, shape[1] * bs - dims[1]), (0, shape[2] * bs - dims[2]), (0, 0)]
+            slab = np.pad(slab, pad)
+            slab = slab.reshape(bs, shape[1], bs, shape[2], bs, nfields).transpose(1, 3, 0, 2, 4, 5)
+            slab = slab.reshape(shape[1] * shape[2], bs**3, nfields)
+
+            peak = np.abs(slab[:, :, 0]).max(axis=1)
+            emitting = peak > threshold
+            if cut is not None:
+                emitting &= peak >= cut
+            keep = np.nonzero(emitting)[0]
+            lookup[i].flat[keep] = count + np.arange(len(keep))
+            kept.append(slab[keep].astype(dtype))
+            count += len(keep)
+
+        bricks = np.concatenate(kept) if count else np.zeros((0, bs**3, 1), dtype=dtype)
+        return cls(dims, bs, lookup, bricks)
+
+    @property
+    def shape(self):
+        """Shape of the equivalent dense cube, (ncells, nfields)"""
+        return (int(np.prod(self.dims)), self.bricks.shape[-1])
+
+    @property
+    def nbytes(self):
+        """Memory used by the stored bricks and the lookup table"""
+        return self.bricks.nbytes + self.lookup.nbytes
+
+    @property
+    def occupancy(self):
+        """Fraction of the bricks that are stored"""
+        return len(self.bricks) / self.lookup.size
+
+    def bounds(self):
+        """Cell index bounding box of the stored bricks
+
+        :return: Lower (inclusive) and upper (exclusive) cell indices, or None if no brick is stored
+        :rtype: tuple (numpy.ndarray, numpy.ndarray)
+        """
+        stored = np.argwhere(self.lookup >= 0)
+        if len(stored) == 0:
+            return None
+        lo = stored.min(axis=0) * self.brick_size
+        hi = np.minimum((stored.max(axis=0) + 1) * self.brick_size, self.dims)
+        return lo, hi
+
+    def gather(self, idx):
+        """Values of the cells with integer indices `idx` that lie in stored bricks
+
+        :param idx: Cell indices, shape (n, 3)
+        :type idx: numpy.ndarray
+        :return: Mask of the cells in stored bricks and their values, shape (nkept, nfields)
+        :rtype: tuple (numpy.ndarray, numpy.ndarray)
+        """
+        brick = self.lookup.ravel()[(idx // self.brick_size) @ self._brick_strides]
+        keep = brick >= 0
+        local = (idx[keep] % self.brick_size) @ self._cell_strides
+        return keep, self.bricks[brick[keep], local]
+
+    def to_dense(self):
+        """Expands the cube back to dense cell values of shape (ncells, nfields)"""
+        bs = self.brick_size
+        cells = np.zeros(tuple(np.array(self.grid_shape) * bs) + (self.shape[1],), dtype=self.bricks.dtype)
+        for brick, index in zip(np.argwhere(self.lookup >= 0), self.lookup[self.lookup >= 0]):
+            lo = brick * bs
+            cells[lo[0]:lo[0] + bs, lo[1]:lo[1] + bs, lo[2]:lo[2] + bs] = self.bricks[index].reshape(bs, bs, bs, -1)
+        return cells[:self.dims[0], :self.dims[1], :self.dims[2]].reshape(self.shape)
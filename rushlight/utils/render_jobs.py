@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# Batch rendering of synthetic maps from a job specification file (TOML or YAML): jobs are
+# expanded into render tasks grouped by dataset, run on a process pool and listed in a manifest
+
+import glob
+import hashlib
+import itertools
+import json
+import math
+import os
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+
+from rushlight.utils.worker_pool import process_context
+
+# Name of the manifest written into the output directory
+MANIFEST_NAME = 'manifest.json'
+
+# Job keys, all other keys of a job are passed to `SyntheticFilterImage`
+JOB_KEYS = ('name', 'datasets', 'references', 'instr', 'channels', 'views', 'loops', 'options')
+
+
+def load_job_file(path):
+    """Reads a job specification from a TOML (.toml) or YAML (.yaml, .yml) file
+
+    :param path: Path of the job file
+    :type path: str
+    :raises ValueError: Raised if the file type is not supported
+    :return: Job specification
+    :rtype: dict
+    """
+
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if suffix in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError as err:
+            raise ImportError("PyYAML is required to read YAML job files, or use a TOML job file") from err
+        with open(path) as f:
+            return yaml.safe_load(f)
+    raise ValueError(f"Unsupported job file type '{suffix}', expected .toml, .yaml or .yml")
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _expand_paths(patterns, base_dir):
+    """Files matching path patterns, relative to `base_dir`, in the order of the patterns"""
+
+    paths = []
+    for pattern in _as_list(patterns):
+        pattern = os.path.join(base_dir, os.path.expanduser(pattern))
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError(f"No files match '{pattern}'")
+        paths += matches
+    return paths
+
+
+def _stem(path):
+    """File name without its extension(s), e.g. 'aia.lev1_euv_12s.2014-01-01T000001Z.171.image_lev1'"""
+
+    if not path:
+        return 'default'
+    name, ext = os.path.splitext(os.path.basename(path))
+    if ext.lower() == '.gz':
+        name = os.path.splitext(name)[0]
+    return name
+
+
+def _digest(*values):
+    """Short hash of the inputs of a task, distinguishing files of the same name and views"""
+    text = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:10]
+
+
+@dataclass
+class RenderTask:
+    """
+    ## One synthetic map: a dataset seen in one channel along one view
+    """
+
+    job: str
+    dataset: str
+    reference: str
+    instr: str
+    channel: object
+    view: str
+    settings: dict = field(default_factory=dict)
+    output: str = ''
+
+    def kwargs(self):
+        """Keyword arguments of `SyntheticFilterImage`, with EUV channels in Angstrom"""
+
+        import astropy.units as u
+
+        channel = self.channel if isinstance(self.channel, str) else self.channel * u.angstrom
+        return {'smap_path': self.reference, 'instr': self.instr, 'channel': channel, **self.settings}
+
+    def record(self):
+        """Description of the task in the manifest"""
+        return asdict(self)
+
+
+def expand_jobs(spec, output_dir, base_dir='.'):
+    """Render tasks of a job specification
+
+    Every job renders the product of its datasets, references, channels and views (given as
+    normal / north vectors or other view settings in `views`, and as loop parameter pickles in
+    `loops`); the keys of `defaults` apply to all jobs. Outputs are named after the inputs, followed
+    by a hash of their full paths and of the view and render settings, so that the same task
+    always gives the same output path whatever its position in the specification.
+
+    :param spec: Job specification, e.g. from `load_job_file`
+    :type spec: dict
+    :param output_dir: Directory of the rendered maps
+    :type output_dir: str
+    :param base_dir: Directory of the relative paths of the specification, defaults to '.'
+    :type base_dir: str, optional
+    :raises ValueError: Raised if several tasks have the same output (e.g. a repeated view)
+    :return: Render tasks
+    :rtype: list
+    """
+
+    tasks = []
+    for k, job in enumerate(spec.get('jobs', [])):
+        job = {**spec.get('defaults', {}), **job}
+        name = str(job.get('name', f"job{k}"))
+        instr = str(job.get('instr', 'aia')).lower()
+        channels = _as_list(job.get('channels', job.get('channel', 171 if instr != 'xrt' else 'Ti-poly')))
+        references = _expand_paths(job['references'], base_dir) if job.get('references') else [None]
+        options = {**job.get('options', {}),
+                   **{key: value for key, value in job.items() if key not in JOB_KEYS + ('channel',)}}
+
+        views = [('view', dict(view)) for view in _as_list(job.get('views'))]
+        views += [(_stem(path), {'pkl': path}) for path in _expand_paths(job.get('loops'), base_dir)]
+
+        for dataset, reference, channel, (view, settings) in itertools.product(
+                _expand_paths(job['datasets'], base_dir), references, channels, views or [('view', {})]):
+            settings = {**options, **settings}
+            digest = _digest(os.path.abspath(dataset), reference and os.path.abspath(reference), instr,
+                             str(channel), {key: os.path.abspath(value) if key == 'pkl' else value
+                                            for key, value in settings.items()})
+            output = os.path.join(output_dir, name, f"{_stem(dataset)}_{_stem(reference)}_{instr}"
+                                                    f"{str(channel).replace(' ', '')}_{view}_{digest}.fits")
+            tasks.append(RenderTask(name, dataset, reference, instr, channel, view, settings, output))
+
+    outputs = {}
+    for task in tasks:
+        if task.output in outputs:
+            raise ValueError(f"Jobs '{outputs[task.output].job}' and '{task.job}' both render {task.dataset} "
+                             f"({task.channel}, {task.view} {task.settings}) to {task.output}")
+        outputs[task.output] = task
+    return tasks
+
+
+def task_graph(tasks, workers=1):
+    """Groups of tasks sharing a dataset, each loaded once by the worker rendering the group
+
+    Datasets with many tasks are split into several groups when there are fewer datasets than workers.
+
+    :param tasks: Render tasks
+    :type tasks: list
+    :param workers: Number of workers, defaults to 1
+    :type workers: int, optional
+    :return: Groups of tasks
+    :rtype: list
+    """
+
+    by_dataset = OrderedDict()
+    for task in tasks:
+        by_dataset.setdefault(task.dataset, []).append(task)
+
+    splits = max(1, math.ceil((workers or 1) / max(1, len(by_dataset))))
+    groups = []
+    for dataset_tasks in by_dataset.values():
+        size = math.ceil(len(dataset_tasks) / min(splits, len(dataset_tasks)))
+        groups += [dataset_tasks[k:k + size] for k in range(0, len(dataset_tasks), size)]
+    return groups
+
+
+def _render_group(group):
+    """Loads the dataset of a group of tasks once and renders the tasks (run in the worker processes)"""
+
+    import yt
+    from rushlight.utils.proj_imag_classified import SyntheticFilterImage
+
+    records, dataset = ([], None)
+    for task in group:
+        start = time.perf_counter()
+        record = task.record()
+        try:
+            if dataset is None:
+                dataset = yt.load(task.dataset)
+            synth = SyntheticFilterImage(dataset=dataset, **task.kwargs())
+            os.makedirs(os.path.dirname(task.output), exist_ok=True)
+            temporary = f"{task.output}.{os.getpid()}.tmp"
+            synth.synth_map.save(temporary, filetype='fits', overwrite=True)
+            os.replace(temporary, task.output)
+            record['status'] = 'rendered'
+        except Exception as err:
+            record['status'] = 'failed'
+            record['error'] = ''.join(traceback.format_exception_only(type(err), err)).strip()
+        record['seconds'] = time.perf_counter() - start
+        records.append(record)
+    return records
+
+
+def run_jobs(spec, output_dir=None, workers=None, overwrite=False, base_dir='.'):
+    """Renders the tasks of a job specification and writes the manifest of the run
+
+    Tasks whose output exists are skipped unless `overwrite` is set, so that an interrupted run
+    is resumed by running it again. Outputs are written atomically.
+
+    :param spec: Job specification, e.g. from `load_job_file`
+    :type spec: dict
+    :param output_dir: Directory of the maps and of the manifest, defaults to the 'output' of the
+        specification, or 'renders'
+    :type output_dir: str, optional
+    :param workers: Number of worker processes, defaults to the 'workers' of the specification, or 1
+    :type workers: int, optional
+    :param overwrite: Render tasks whose output exists, defaults to False
+    :type overwrite: bool, optional
+    :param base_dir: Directory of the relative paths of the specification, defaults to '.'
+    :type base_dir: str, optional
+    :return: Manifest of the run, with one record per task
+    :rtype: dict
+    """
+
+    output_dir = output_dir or os.path.join(base_dir, spec.get('output', 'renders'))
+    workers = workers or spec.get('workers', 1)
+    tasks = expand_jobs(spec, output_dir, base_dir=base_dir)
+
+    records = {}
+    pending = []
+    for task in tasks:
+        if not overwrite and os.path.exists(task.output):
+            records[task.output] = {**task.record(), 'status': 'skipped'}
+        else:
+            pending.append(task)
+
+    groups = task_graph(pending, workers)
+    if workers > 1 and len(groups) > 1:
+        # Task groups are picklable, so platforms without a safe fork spawn the workers
+        with process_context().Pool(min(workers, len(groups))) as pool:
+            for group_records in pool.imap_unordered(_render_group, groups):
+                records.update((record['output'], record) for record in group_records)
+    else:
+        for group in groups:
+            records.update((record['output'], record) for record in _render_group(group))
+
+    manifest = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'workers': workers,
+                'tasks': [records[task.output] for task in tasks]}
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, default=str)
+    os.replace(f"{path}.tmp", path)
+    return manifest
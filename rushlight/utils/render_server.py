@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# Local render server: one long-lived process keeps datasets, imaging models and emission cubes
+# in memory and renders views requested over HTTP on localhost by several clients
+
+import base64
+import io
+import json
+import queue
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from rushlight.utils.render_jobs import RenderTask
+
+# Default port of `RenderServer` and `RenderClient`
+DEFAULT_PORT = 8765
+
+
+def encode_array(array):
+    """Array as base64 text of its .npy serialization"""
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array), allow_pickle=False)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def decode_array(text):
+    """Array from `encode_array` text"""
+    return np.load(io.BytesIO(base64.b64decode(text)), allow_pickle=False)
+
+
+def _json_default(value):
+    """JSON values of numpy scalars and other header values"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class _Job:
+    """Render request waiting in the queue, shared by identical requests"""
+
+    def __init__(self, key, request):
+        self.key, self.request = (key, request)
+        self.submitted = time.perf_counter()
+        self.started, self.finished = (None, None)
+        self.result, self.error = (None, None)
+        self.waiters = 0
+        self.done = threading.Event()
+
+
+class RenderServer:
+    """
+    ## Render server keeping synthetic image scenes warm
+
+    A scene is a `SyntheticFilterImage` of one dataset, reference map, instrument, channel and
+    setup (constructor options such as loop parameters, 'pkl', or 'vector_arr'): its
+    dataset (loaded once and shared by the scenes of all channels), emission fields and imaging
+    model stay in memory. Views are rendered by `proj_and_imag`, so that the server returns the
+    images of the `render` command and of notebooks for the same options; the `projector='grid'`
+    option reuses the emission cube cached by the scene, so that a new view only costs one
+    `GridProjector` integration. Requests without a view get the initial view of the scene, set by
+    the loop parameters or vectors of its setup, whatever the views requested before; they are
+    rejected for scenes whose setup defines no view.
+
+    Requests are queued and rendered one at a time by a worker thread (yt is not thread-safe);
+    identical requests arriving while one is queued or rendering share its result. The least
+    recently used scenes are dropped beyond `max_scenes`.
+
+    Endpoints (JSON): `POST /render` with the fields of `render`, returning the image ('data',
+    see `encode_array'), its FITS header and the latencies of the request; `GET /status`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, max_scenes=8):
+        """
+        ### Constructor, binding the HTTP server
+
+        :param host: Address to listen on, defaults to localhost only
+        :type host: str, optional
+        :param port: Port to listen on, 0 for any free port, defaults to `DEFAULT_PORT`
+        :type port: int, optional
+        :param max_scenes: Number of scenes kept in memory, defaults to 8
+        :type max_scenes: int, optional
+        """
+
+        self.max_scenes = max_scenes
+        self.datasets = {}
+        self.scenes = OrderedDict()
+        self.initial_views = {}
+        self.stats = {'requests': 0, 'renders': 0, 'coalesced': 0, 'errors': 0}
+        self.latencies = deque(maxlen=1000)
+
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()  # guards the scenes, statistics and pending requests
+        self._worker = threading.Thread(target=self._work, name='rushlight-render', daemon=True)
+        self._worker.start()
+
+        self.httpd = ThreadingHTTPServer((host, port), _RenderHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.render_server = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self):
+        """Serves requests until `shutdown`"""
+        self.httpd.serve_forever()
+
+    def start(self):
+        """Serves requests from a background thread (e.g. within a notebook)
+
+        :return: The server
+        :rtype: RenderServer
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name='rushlight-http', daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        """Stops serving and the render worker"""
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+        self.httpd.server_close()
+        self._queue.put(None)
+        self._worker.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def submit(self, request):
+        """Queues a render request and waits for its result, coalescing identical requests
+
+        :param request: Fields of `render`
+        :type request: dict
+        :return: Image, header, latencies in seconds ('queued', 'render', 'total') and whether
+            the request shared the result of an identical one ('coalesced'); or the error
+        :rtype: dict
+        """
+
+        key = json.dumps(request, sort_keys=True, default=str)
+        arrived = time.perf_counter()
+        with self._lock:
+            self.stats['requests'] += 1
+            job = self._pending.get(key)
+            coalesced = job is not None
+            if coalesced:
+                self.stats['coalesced'] += 1
+            else:
+                job = self._pending[key] = _Job(key, request)
+                self._queue.put(job)
+            job.waiters += 1
+
+        job.done.wait()
+        total = time.perf_counter() - arrived
+        with self._lock:
+            self.latencies.append(total)
+        if job.error is not None:
+            return {'error': job.error}
+        image, header = job.result
+        return {'data': image, 'header': header, 'coalesced': coalesced,
+                'timings': {'queued': job.started - job.submitted, 'render': job.finished - job.started,
+                            'total': total}}
+
+    def _work(self):
+        """Renders the queued requests one at a time"""
+
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            job.started = time.perf_counter()
+            try:
+                job.result = self.render(**job.request)
+            except Exception as err:
+                job.error = f"{type(err).__name__}: {err}"
+            job.finished = time.perf_counter()
+            with self._lock:
+                self.stats['errors' if job.error is not None else 'renders'] += 1
+                del self._pending[job.key]
+            job.done.set()
+
+    @staticmethod
+    def _scene_key(dataset, reference, instr, channel, setup):
+        return (dataset, reference, instr, str(channel), json.dumps(setup or {}, sort_keys=True, default=str))
+
+    def scene(self, dataset, reference=None, instr='aia', channel=171, setup=None, view=None):
+        """Synthetic image of a dataset, reference, instrument, channel and setup, created on first use
+
+        The initial view of the scene, set by the 'pkl' or 'vector_arr' of its setup, is stored in
+        `initial_views` (None if the setup defines no view).
+
+        :param setup: Constructor options of `SyntheticFilterImage`, defaults to None
+        :type setup: dict, optional
+        :param view: (normvector, northvector) used to create a scene whose setup defines no view
+        :type view: tuple, optional
+        :raises ValueError: Raised if neither the setup nor `view` defines a view
+        :return: Warm synthetic image object
+        :rtype: SyntheticFilterImage
+        """
+
+        import yt
+        from rushlight.utils.proj_imag_classified import SyntheticFilterImage
+
+        key = self._scene_key(dataset, reference, instr, channel, setup)
+        with self._lock:
+            if key in self.scenes:
+                self.scenes.move_to_end(key)
+                return self.scenes[key]
+
+        if dataset not in self.datasets:
+            self.datasets[dataset] = yt.load(dataset)
+        setup = dict(setup or {})
+        defines_view = bool(setup.get('pkl', None) or setup.get('vector_arr', None))
+        if not defines_view:
+            if view is None:
+                raise ValueError("Render requests need a normvector and northvector, or a 'pkl' or "
+                                 "'vector_arr' setup defining the view of the scene")
+            setup['normvector'], setup['northvector'] = view
+        task = RenderTask('serve', dataset, reference, instr, channel, 'view', setup)
+        synth = SyntheticFilterImage(dataset=self.datasets[dataset], **task.kwargs())
+
+        with self._lock:
+            self.scenes[key] = synth
+            self.initial_views[key] = (synth.normvector, synth.northvector) if defines_view else None
+            while len(self.scenes) > self.max_scenes:
+                evicted, _ = self.scenes.popitem(last=False)
+                del self.initial_views[evicted]
+            used = {scene_key[0] for scene_key in self.scenes}
+        for name in [name for name in self.datasets if name not in used]:
+            del self.datasets[name]
+        return synth
+
+    def render(self, dataset, reference=None, instr='aia', channel=171, normvector=None, northvector=None,
+               options=None, setup=None):
+        """Renders a view of a scene with `proj_and_imag`
+
+        :param dataset: Path of the dataset
+        :type dataset: str
+        :param reference: Path of the reference map, defaults to the default reference image
+        :type reference: str, optional
+        :param instr: Instrument, defaults to 'aia'
+        :type instr: str, optional
+        :param channel: AIA channel in Angstrom or XRT filter, defaults to 171
+        :type channel: int, str, optional
+        :param normvector: Line of sight, defaults to the initial view of the scene
+        :type normvector: list, optional
+        :param northvector: North vector, defaults to the initial view of the scene
+        :type northvector: list, optional
+        :param options: Options of `SyntheticImage.proj_and_imag` and `make_synthetic_result`, e.g.
+            `projector='grid'` to project the cached emission cube, defaults to None
+        :type options: dict, optional
+        :param setup: Constructor options of the scene, e.g. the 'pkl' defining its initial view,
+            defaults to None
+        :type setup: dict, optional
+        :raises ValueError: Raised if no view is given and the setup of the scene defines none
+        :return: Image and FITS header
+        :rtype: tuple (numpy.ndarray, dict)
+        """
+
+        view = None if normvector is None else (normvector, northvector)
+        synth = self.scene(dataset, reference, instr, channel, setup, view)
+        options = options or {}
+        if view is None:
+            view = self.initial_views[self._scene_key(dataset, reference, instr, channel, setup)]
+            if view is None:
+                raise ValueError("The scene has no initial view: pass a normvector and northvector, or a "
+                                 "'pkl' or 'vector_arr' setup")
+        normvector, northvector = view
+
+        synth.normvector, synth.northvector = (normvector, northvector)
+        synth.view_settings = {'normal_vector': normvector, 'north_vector': northvector}
+        synth.proj_and_imag(**options)
+        result = synth.make_synthetic_result(**options)
+        return result.data, dict(result.header)
+
+    def status(self):
+        """Scenes in memory, queue length, request counts and latency percentiles in seconds
+
+        :rtype: dict
+        """
+
+        with self._lock:
+            latencies = np.array(self.latencies)
+            status = {'scenes': [list(key) for key in self.scenes], 'queued': self._queue.qsize(), **self.stats}
+        status['latency'] = ({f"p{p}": float(np.percentile(latencies, p)) for p in (50, 90, 99)}
+                             if latencies.size else {})
+        return status
+
+
+class _RenderHandler(BaseHTTPRequestHandler):
+    """HTTP endpoints of `RenderServer`"""
+
+    def _reply(self, code, content):
+        body = json.dumps(content, default=_json_default).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/status':
+            self._reply(200, self.server.render_server.status())
+        else:
+            self._reply(404, {'error': f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/render':
+            self._reply(404, {'error': f"Unknown endpoint {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(request, dict) or 'dataset' not in request:
+                raise ValueError("Render requests need a 'dataset'")
+        except ValueError as err:
+            self._reply(400, {'error': str(err)})
+            return
+
+        response = self.server.render_server.submit(request)
+        if 'error' in response:
+            self._reply(500, response)
+        else:
+            self._reply(200, {**response, 'data': encode_array(response['data'])})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RenderClient:
+    """
+    ## Client of a `RenderServer`
+    """
+
+    def __init__(self, url=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=600.):
+        """
+        ### Constructor
+
+        :param url: Address of the server, defaults to the default local server
+        :type url: str, optional
+        :param timeout: Seconds to wait for a response, defaults to 600
+        :type timeout: float, optional
+        """
+
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, path, content=None):
+        data = None if content is None else json.dumps(content, default=_json_default).encode()
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as err:
+            raise RuntimeError(json.load(err).get('error', str(err))) from None
+
+    def status(self):
+        """Status of the server, see `RenderServer.status`"""
+        return self._call('/status')
+
+    def render(self, dataset, reference=None, instr='aia', channel=171, normvector=None, northvector=None,
+               setup=None, **options):
+        """Renders a view on the server, see `RenderServer.render`
+
+        :return: Image, FITS header, latencies ('timings') and 'coalesced' flag
+        :rtype: dict
+        """
+
+        response = self._call('/render', {'dataset': dataset, 'reference': reference, 'instr': instr,
+                                          'channel': channel, 'normvector': normvector,
+                                          'northvector': northvector, 'options': options,
+                                          'setup': setup})
+        response['data'] = decode_array(response['data'])
+        return response
+
+    def map(self, *args, **kwargs):
+        """Rendered view as a sunpy map, see `render`
+
+        :rtype: sunpy.map.GenericMap
+        """
+        import sunpy.map
+        response = self.render(*args, **kwargs)
+        return sunpy.map.Map(response['data'], response['header'])
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# Publishes the cell fields of a synthetic datacube once, in shared memory or in memory-mapped files,
+# so that worker processes attach to a single copy instead of pickling or re-loading the dataset
+
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from rushlight.utils.dcube import Dcube
+from rushlight.utils.lazy import lazy_import
+from rushlight.utils.projector import grid_extent
+
+yt = lazy_import('yt')
+
+# Fields published by default: the inputs of every emission model (`publish` adds the emissivity of a model)
+DEFAULT_FIELDS = [("gas", "temperature"), ("gas", "density")]
+
+
+class FieldColumns:
+    """
+    ## Cell fields indexed like a cube of shape (ncells, nfields), without stacking them
+
+    Holds one flat array per field (e.g. views of shared buffers). Indexing with cell indices
+    gathers the requested cells of every field, so only the gathered samples are copied.
+    """
+
+    def __init__(self, arrays):
+        """
+        ### Constructor
+
+        :param arrays: Arrays of the fields, flattened without copying when contiguous
+        :type arrays: list
+        """
+
+        self.arrays = [array.reshape(-1) for array in arrays]
+
+    @property
+    def shape(self):
+        """Shape of the equivalent cube, (ncells, nfields)"""
+        return (self.arrays[0].size, len(self.arrays))
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            cells, field = index
+            if isinstance(field, (int, np.integer)):
+                return self.arrays[field][cells]
+            return FieldColumns(self.arrays[field])[cells]
+        return np.stack([array[index] for array in self.arrays], axis=-1)
+
+
+@dataclass
+class SharedFieldsHandle:
+    """
+    ## Picklable description of published fields, passed to worker processes
+    """
+
+    backing: str  # 'shm' or 'memmap'
+    blocks: dict  # field name -> shared memory block name or .npy path
+    units: dict  # field name -> unit string
+    dims: tuple
+    dtype: str
+    left_edge: tuple  # code units
+    right_edge: tuple  # code units
+    length_unit: float  # cm per code length
+    directory: str = None  # temporary directory of the memory-mapped files, removed by the publisher
+
+
+class SharedFields:
+    """
+    ## Cell fields of a datacube held once in shared memory or memory-mapped files
+
+    The publishing process reads the fields slab by slab into the shared buffers and passes
+    `handle` to its workers; `SharedFields.attach(handle)` then maps the same buffers without copying.
+    Arrays are stored in the cell order of `GridProjector`, so `cube()` can be projected directly,
+    and `dataset()` wraps them in a yt dataset that shares their memory.
+
+    Shared memory blocks are meant for child processes of the publisher (which share its resource
+    tracker); unrelated processes should use the 'memmap' backing.
+    """
+
+    def __init__(self, handle, arrays, buffers=(), owner=False):
+        """
+        ### Constructor, see `publish` and `attach`
+
+        :param handle: Description of the published fields
+        :type handle: SharedFieldsHandle
+        :param arrays: Field name -> array of shape `handle.dims` viewing the shared buffer
+        :type arrays: dict
+        :param buffers: Shared memory blocks backing the arrays, kept alive with them, defaults to ()
+        :type buffers: tuple, optional
+        :param owner: Whether `close` releases the shared buffers, defaults to False
+        :type owner: bool, optional
+        """
+
+        self.handle = handle
+        self.arrays = arrays
+        self._buffers = list(buffers)
+        self._owner = owner
+        self._dataset = None
+
+    @classmethod
+    def publish(cls, source, fields=None, model=None, backing='shm', directory=None, dtype=np.float64, slab=16):
+        """Reads fields of a datacube into shared buffers, one slab of cells at a time
+
+        :param source: Datacube, dataset or region containing the cells
+        :type source: Dcube, yt Dataset, YTRegion
+        :param fields: Field names as accepted by yt, e.g. ('gas', 'aia_filter_band') after
+            `make_intensity_fields`; defaults to temperature and density
+        :type fields: list, optional
+        :param model: Imaging model whose emissivity (`emissivity_field`) is published with the fields, defaults to None
+        :type model: UVModel, XRTModel, optional
+        :param backing: 'shm' for `multiprocessing.shared_memory` or 'memmap' for .npy files, defaults to 'shm'
+        :type backing: str, optional
+        :param directory: Directory of the memory-mapped files, defaults to a new temporary directory
+        :type directory: str, optional
+        :param dtype: Storage type of the fields, defaults to numpy.float64
+        :type dtype: numpy.dtype, optional
+        :param slab: Number of cells along the first axis read at once, defaults to 16
+        :type slab: int, optional
+        :raises ValueError: Raised if the backing is unknown
+        :return: Owner of the published fields
+        :rtype: SharedFields
+        """
+
+        if backing not in ('shm', 'memmap'):
+            raise ValueError("backing should be either 'shm' or 'memmap'")
+
+        box = source.box if isinstance(source, Dcube) else source
+        ds, left_edge, right_edge, dims = grid_extent(box)
+        dx = (right_edge - left_edge) / dims
+        shape = tuple(int(d) for d in dims)
+        fields = list(fields or DEFAULT_FIELDS)
+        if model is not None:
+            model.make_intensity_fields(ds)
+            fields.append(model.emissivity_field)
+        dtype = np.dtype(dtype)
+
+        temporary = backing == 'memmap' and directory is None
+        if backing == 'memmap':
+            directory = directory or tempfile.mkdtemp(prefix='rushlight_fields_')
+            os.makedirs(directory, exist_ok=True)
+
+        arrays, blocks, buffers, units = ({}, {}, [], {})
+        for field in fields:
+            name = field[1] if isinstance(field, tuple) else field
+            arrays[name], blocks[name] = cls._allocate(backing, directory, name, shape, dtype, buffers)
+
+            for i in range(0, dims[0], slab):
+                slab_dims = [min(slab, dims[0] - i), dims[1], dims[2]]
+                cg = ds.covering_grid(level=0, left_edge=left_edge + [i * dx[0], 0., 0.], dims=slab_dims)
+                values = cg[field]
+                arrays[name][i:i + slab_dims[0]] = values.d
+            units[name] = str(values.units)
+
+            if backing == 'memmap':
+                arrays[name].flush()
+
+        handle = SharedFieldsHandle(backing=backing, blocks=blocks, units=units, dims=shape,
+                                    dtype=dtype.str, left_edge=tuple(left_edge), right_edge=tuple(right_edge),
+                                    length_unit=float(ds.length_unit.to('cm').d),
+                                    directory=directory if temporary else None)
+        return cls(handle, arrays, buffers, owner=True)
+
+    @classmethod
+    def share(cls, box, cube, names=None, backing='shm', directory=None):
+        """Publishes cell values already in memory, e.g. a cube from `GridProjector.sample_cube`
+
+        :param box: Dataset or region whose cells the cube holds, in the order of `GridProjector`
+        :type box: yt Dataset, YTRegion
+        :param cube: Cell values of shape (ncells, nfields)
+        :type cube: numpy.ndarray
+        :param names: Names of the fields, defaults to 'field0', 'field1', ...
+        :type names: list, optional
+        :param backing: 'shm' for `multiprocessing.shared_memory` or 'memmap' for .npy files, defaults to 'shm'
+        :type backing: str, optional
+        :param directory: Directory of the memory-mapped files, defaults to a new temporary directory
+        :type directory: str, optional
+        :raises ValueError: Raised if the backing is unknown
+        :return: Owner of the published fields, whose `cube` has the layout of `cube`
+        :rtype: SharedFields
+        """
+
+        if backing not in ('shm', 'memmap'):
+            raise ValueError("backing should be either 'shm' or 'memmap'")
+
+        ds, left_edge, right_edge, dims = grid_extent(box)
+        shape = tuple(int(d) for d in dims)
+        names = names or [f"field{n}" for n in range(cube.shape[1])]
+
+        temporary = backing == 'memmap' and directory is None
+        if backing == 'memmap':
+            directory = directory or tempfile.mkdtemp(prefix='rushlight_fields_')
+            os.makedirs(directory, exist_ok=True)
+
+        arrays, blocks, buffers = ({}, {}, [])
+        for n, name in enumerate(names):
+            arrays[name], blocks[name] = cls._allocate(backing, directory, name, shape, cube.dtype, buffers)
+            arrays[name].reshape(-1)[:] = cube[:, n]
+            if backing == 'memmap':
+                arrays[name].flush()
+
+        handle = SharedFieldsHandle(backing=backing, blocks=blocks, units={name: 'dimensionless' for name in names},
+                                    dims=shape, dtype=cube.dtype.str, left_edge=tuple(left_edge),
+                                    right_edge=tuple(right_edge), length_unit=float(ds.length_unit.to('cm').d),
+                                    directory=directory if temporary else None)
+        return cls(handle, arrays, buffers, owner=True)
+
+    @staticmethod
+    def _allocate(backing, directory, name, shape, dtype, buffers):
+        """Creates the shared buffer of one field
+
+        :return: Array viewing the buffer and name of the buffer (shared memory block or .npy path)
+        :rtype: tuple (numpy.ndarray, str)
+        """
+
+        dtype = np.dtype(dtype)
+        if backing == 'shm':
+            shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize,
+                                             name=f"rushlight_{uuid.uuid4().hex[:16]}")
+            buffers.append(shm)
+            return np.ndarray(shape, dtype=dtype, buffer=shm.buf), shm.name
+        path = os.path.join(directory, f"{name}.npy")
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape), path
+
+    @classmethod
+    def attach(cls, handle):
+        """Maps published fields without copying them
+
+        :param handle: Description of the published fields, from the `handle` attribute of the publisher
+        :type handle: SharedFieldsHandle
+        :return: View of the published fields
+        :rtype: SharedFields
+        """
+
+        arrays, buffers = ({}, [])
+        for name, block in handle.blocks.items():
+            if handle.backing == 'shm':
+                if sys.version_info >= (3, 13):
+                    shm = shared_memory.SharedMemory(name=block, track=False)
+                else:
+                    shm = shared_memory.SharedMemory(name=block)
+                buffers.append(shm)
+                arrays[name] = np.ndarray(handle.dims, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+            else:
+                arrays[name] = np.load(block, mmap_mode='r')
+        return cls(handle, arrays, buffers, owner=False)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def cube(self, *names):
+        """Fields in the layout of `GridProjector.sample_cube`, as views of the shared buffers
+
+        :param names: Names of the fields, defaults to all the published fields
+        :return: Cube of shape (ncells, nfields), projected without stacking the fields
+        :rtype: FieldColumns
+        """
+
+        return FieldColumns([self.arrays[name] for name in names or self.arrays])
+
+    def dataset(self):
+        """yt uniform grid dataset over the shared arrays (built once, without copying them)
+
+        Fields are available as ('stream', name), with the usual ('gas', ...) aliases.
+
+        :return: Dataset covering the published cells
+        :rtype: yt Dataset
+        """
+
+        if self._dataset is None:
+            data = {name: (array, self.handle.units[name]) for name, array in self.arrays.items()}
+            self._dataset = yt.load_uniform_grid(data=data, domain_dimensions=self.handle.dims,
+                                                 length_unit=self.handle.length_unit,
+                                                 bbox=np.array([self.handle.left_edge, self.handle.right_edge]).T)
+        return self._dataset
+
+    def close(self):
+        """Drops the views of the shared fields; the publisher also frees the buffers"""
+
+        self._dataset = None
+        self.arrays = {}
+        for shm in self._buffers:
+            try:
+                shm.close()
+            except BufferError:
+                # Arrays still referenced elsewhere keep the mapping alive until they are released
+                pass
+            if self._owner:
+                shm.unlink()
+        self._buffers = []
+
+        if self._owner and self.handle.backing == 'memmap':
+            for path in self.handle.blocks.values():
+                if os.path.exists(path):
+                    os.remove(path)
+            if self.handle.directory:
+                shutil.rmtree(self.handle.directory, ignore_errors=True)
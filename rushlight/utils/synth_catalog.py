@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# SQLite catalog of synthetic object records (`SyntheticImage.save_synthobj`), indexed by
+# telescope and observation time, replacing the rewrite-on-append pickled dictionaries
+
+import pickle
+import sqlite3
+import time
+
+# File suffixes recognized as catalogs by `SyntheticImage.append_synthobj`
+CATALOG_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT PRIMARY KEY,
+    telescope TEXT NOT NULL,
+    date_obs TEXT NOT NULL,
+    mjd REAL,
+    created REAL NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_telescope_time ON events (telescope, mjd);
+CREATE INDEX IF NOT EXISTS events_time ON events (mjd);
+"""
+
+
+def _mjd(date):
+    """Modified Julian date of a DATE-OBS string, `Time` or datetime (None if it cannot be parsed)"""
+    from astropy.time import Time
+    try:
+        return float(Time(date).mjd)
+    except (ValueError, TypeError):
+        return None
+
+
+class SynthCatalog:
+    """
+    ## Append-only catalog of synthetic object records
+
+    Every `TELESCOP|DATE-OBS` record is one row, with the telescope and observation time as indexed
+    columns and the record itself pickled. Appends insert a single row in their own transaction
+    (a record with an existing key replaces it), so their cost does not grow with the catalog, and
+    the write-ahead log lets several processes append and read the same file concurrently.
+    """
+
+    def __init__(self, path, timeout=60.):
+        """
+        ### Constructor, opening or creating the catalog
+
+        :param path: Path of the SQLite file
+        :type path: str
+        :param timeout: Seconds to wait for a concurrent writer to release the file, defaults to 60
+        :type timeout: float, optional
+        """
+
+        self.path = str(path)
+        self._connection = sqlite3.connect(self.path, timeout=timeout)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def __contains__(self, key):
+        return self._connection.execute("SELECT 1 FROM events WHERE key = ?", (key,)).fetchone() is not None
+
+    def __getitem__(self, key):
+        row = self._connection.execute("SELECT record FROM events WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def close(self):
+        """Closes the connection to the catalog file"""
+        self._connection.close()
+
+    def add(self, synthobj):
+        """Appends records, replacing those with the same keys
+
+        :param synthobj: Key -> record, as returned by `SyntheticImage.save_synthobj` or stored in
+            the pickled catalogs of `append_synthobj`
+        :type synthobj: dict
+        :return: Number of records written
+        :rtype: int
+        """
+
+        rows = []
+        for key, event in synthobj.items():
+            header = event.get('header', {}) if isinstance(event, dict) else {}
+            telescope, _, date_obs = key.partition('|')
+            telescope = header.get('TELESCOP', telescope)
+            date_obs = header.get('DATE-OBS', date_obs)
+            rows.append((key, telescope, date_obs, _mjd(date_obs), time.time(),
+                         pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)))
+
+        with self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def keys(self, telescope=None, start=None, end=None):
+        """Keys of the records matching a query, in order of observation time
+
+        :param telescope: Value of TELESCOP, defaults to any telescope
+        :type telescope: str, optional
+        :param start: Earliest observation time (inclusive), defaults to no limit
+        :type start: str, astropy.time.Time, datetime.datetime, optional
+        :param end: Latest observation time (inclusive), defaults to no limit
+        :type end: str, astropy.time.Time, datetime.datetime, optional
+        :rtype: list
+        """
+        return [row[0] for row in self._select("key", telescope, start, end)]
+
+    def query(self, telescope=None, start=None, end=None):
+        """Records matching a query, in order of observation time, see `keys`
+
+        :return: Key -> record, in the format of the pickled catalogs
+        :rtype: dict
+        """
+        return {key: pickle.loads(record) for key, record in self._select("key, record", telescope, start, end)}
+
+    def _select(self, columns, telescope, start, end):
+        """Rows of `columns` using the telescope / time indices"""
+
+        conditions, values = ([], [])
+        if telescope is not None:
+            conditions.append("telescope = ?")
+            values.append(telescope)
+        if start is not None:
+            conditions.append("mjd >= ?")
+            values.append(_mjd(start))
+        if end is not None:
+            conditions.append("mjd <= ?")
+            values.append(_mjd(end))
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._connection.execute(f"SELECT {columns} FROM events{where} ORDER BY mjd, key", values)
+
+    def import_pickle(self, path):
+        """Imports a pickled catalog written by `SyntheticImage.append_synthobj`
+
+        :param path: Path of the pickled dictionary
+        :type path: str
+        :return: Number of records imported
+        :rtype: int
+        """
+
+        with open(path, 'rb') as f:
+            synthobj = pickle.load(f)
+        return self.add(synthobj)
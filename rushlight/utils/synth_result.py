@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# Lean container for synthetic images: the array and its FITS header, with the sunpy map
+# and the plot normalization built only when they are needed
+
+from collections.abc import Mapping
+
+from rushlight.utils.lazy import lazy_import
+
+colors = lazy_import('matplotlib.colors')
+sunpy = lazy_import('sunpy')
+
+
+class SyntheticResult:
+    """
+    ## Synthetic image together with its FITS header
+
+    Batch runs only need `data` and `header`; the sunpy map (`map`) and the colormap
+    normalization (`norm`) are created on first access and cached. `with_data` reuses the
+    header template for other images of the same view (e.g. noise realizations).
+    """
+
+    def __init__(self, data, header, instr=None, cmap=None, norm_source=None):
+        """
+        ### Constructor for the synthetic result
+
+        :param data: Synthetic image
+        :type data: numpy.ndarray
+        :param header: FITS header of the image, shared as a template and copied when the map is built
+        :type header: sunpy.util.MetaDict, dict
+        :param instr: Instrument name; 'xrt' images become `XRTMap` objects, defaults to None
+        :type instr: str, optional
+        :param cmap: Colormap stored in the plot settings of the map, defaults to None
+        :type cmap: str, matplotlib.colors.Colormap, optional
+        :param norm_source: Map (e.g. the reference image) whose range sets the logarithmic plot
+            normalization, defaults to the range of `data`
+        :type norm_source: sunpy.map.GenericMap, optional
+        """
+
+        self.data = data
+        self.header = header
+        self.instr = instr.lower() if instr else None
+        self.cmap = cmap
+        self._norm_source = norm_source
+        self._map, self._norm = (None, None)
+
+    @property
+    def norm(self):
+        """Logarithmic plot normalization, computed on first access"""
+
+        if self._norm is None:
+            if self._norm_source is not None:
+                self._norm = colors.LogNorm(self._norm_source.min(), self._norm_source.max())
+            else:
+                positive = self.data[self.data > 0]
+                self._norm = colors.LogNorm(positive.min(), positive.max()) if positive.size else colors.LogNorm()
+        return self._norm
+
+    @property
+    def has_map(self):
+        """Whether the sunpy map has been built"""
+        return self._map is not None
+
+    @property
+    def map(self):
+        """sunpy map of the image, built on first access
+
+        :rtype: sunpy.map.GenericMap
+        """
+
+        if self._map is None:
+            header = self.header.copy()
+            if self.instr == 'xrt':
+                self._map = sunpy.map.sources.XRTMap(self.data, header)
+            else:
+                self._map = sunpy.map.Map(self.data, header)
+            self._map.plot_settings['norm'] = self.norm
+            if self.cmap is not None:
+                self._map.plot_settings['cmap'] = self.cmap
+        return self._map
+
+    def with_data(self, data):
+        """Result for another image of the same view, sharing the header template
+
+        :param data: Image with the shape of `data`
+        :type data: numpy.ndarray
+        :return: New result
+        :rtype: SyntheticResult
+        """
+        return SyntheticResult(data, self.header, instr=self.instr, cmap=self.cmap, norm_source=self._norm_source)
+
+
+class DiagnosticMaps(Mapping):
+    """
+    ## Diagnostic images of a synthetic view, as sunpy maps built on access
+
+    Maps share the header template of the synthetic image, with the unit of each diagnostic.
+    Like `SyntheticResult.map`, a map is only created (and then cached) when it is looked up.
+    """
+
+    def __init__(self, images, header, units=None):
+        """
+        ### Constructor for the diagnostic maps
+
+        :param images: Diagnostic name -> image
+        :type images: dict
+        :param header: FITS header of the synthetic image, copied for every map
+        :type header: sunpy.util.MetaDict, dict
+        :param units: Diagnostic name -> unit string ('bunit'), defaults to no units
+        :type units: dict, optional
+        """
+
+        self.images = dict(images)
+        self.header = header
+        self.units = dict(units or {})
+        self._maps = {}
+
+    def __getitem__(self, name):
+        if name not in self._maps:
+            header = self.header.copy()
+            header.pop('bunit', None)
+            if self.units.get(name):
+                header['bunit'] = self.units[name]
+            self._maps[name] = sunpy.map.Map(self.images[name], header)
+        return self._maps[name]
+
+    def __iter__(self):
+        return iter(self.images)
+
+    def __len__(self):
+        return len(self.images)
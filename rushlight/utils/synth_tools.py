@@ -1,21 +1,23 @@
+from __future__ import annotations
+
 import numpy as np
 
 import sys
-# UPDATE LOADING CLB
-# from CoronalLoopBuilder.builder import semi_circle_loop # type: ignore
 
 import pickle
-import sunpy
-from unyt import unyt_array
 import numpy as np
 
 import astropy
-from astropy.coordinates import SkyCoord, CartesianRepresentation
 import astropy.units as u
 
-from rushlight.utils.rimage import ReferenceImage
+from rushlight.utils.lazy import lazy_import
+from rushlight.utils.loop_geometry import loop_points, loop_frames
 
-from yt.utilities.orientation import Orientation
+# Deferred until the first call that needs them
+sunpy = lazy_import('sunpy')
+unyt = lazy_import('unyt')
+yt = lazy_import('yt')
+coordinates = lazy_import('astropy.coordinates')
 
 ###############################################################
 
@@ -57,7 +59,7 @@ def calc_vect(ref_img: astropy.nddata.NDData, vector_arr: np.ndarray = None, loo
 
     # Retrieve vectors that will define projection plane from either CLB loop_coords object, 
     # or from user-defined cartesian vectors (Heliocentric)
-    if loop_coords:
+    if loop_coords is not None:
         try:
             v1 = np.array([loop_coords[0].x.value, 
                         loop_coords[0].y.value,
@@ -80,9 +82,48 @@ def calc_vect(ref_img: astropy.nddata.NDData, vector_arr: np.ndarray = None, loo
     else:
         raise("No valid definition of projection plane provided. Please either define loop_coords or vector_arr.")
 
+    stonyh_to_mhd, ifpd = _mhd_frame(v1, v2, v3)
+    los_vec, camera_vec = _observer_vectors(ref_img, **kwargs)
+    normvector, northvector = _view_vectors(stonyh_to_mhd, los_vec, camera_vec, kwargs.get('default', False))
+
+    return (normvector, northvector, ifpd)
+
+def calc_vect_batch(ref_img: astropy.nddata.NDData, loops: np.ndarray, **kwargs):
+    """Calculates the normal and north vectors of many loops at once, see `calc_vect`
+
+    The observer line of sight and camera north are transformed to Stonyhurst coordinates once,
+    and the MHD frames of all loops are computed as arrays.
+
+    :param ref_img: Reference map providing the observer, obstime and rotation
+    :type ref_img: astropy.nddata.NDData
+    :param loops: Loop coordinates of shape (..., samples_num, 3), e.g. from `loop_geometry.loop_points`
+    :type loops: numpy.ndarray
+    :param obsframe: Observer frame overriding the coordinate frame of `ref_img`, defaults to None
+    :type obsframe: astropy.coordinates.BaseCoordinateFrame, optional
+    :param default: If True, sets the north vector in the MHD frame to [0, 1, 0], defaults to False
+    :type default: bool, optional
+    :return: Normal vectors (..., 3), north vectors (..., 3) and inter-footpoint distances (...)
+        in the units of `loops`
+    :rtype: tuple (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+
+    stonyh_to_mhd, ifpd = _mhd_frame(*loop_frames(loops))
+    los_vec, camera_vec = _observer_vectors(ref_img, **kwargs)
+    normvector, northvector = _view_vectors(stonyh_to_mhd, los_vec, camera_vec, kwargs.get('default', False))
+
+    return (normvector, northvector, ifpd)
+
+def _mhd_frame(v1, v2, v3):
+    """Transformation from Stonyhurst to MHD coordinates of loops given by their footpoints (v1, v2)
+    and apex (v3), vectorized over leading axes
+
+    :return: Transformation matrices (..., 3, 3) and inter-footpoint distances (...)
+    :rtype: tuple (numpy.ndarray, numpy.ndarray)
+    """
+
     # Inter-FootPoint distance
     v_12 = v1-v2  # x-direction in mhd frame
-    ifpd = np.linalg.norm(v_12)
+    ifpd = np.linalg.norm(v_12, axis=-1)
 
     # vectors going from footpoint to top of loop
     v1_loop = v3 - v1
@@ -92,22 +133,31 @@ def calc_vect(ref_img: astropy.nddata.NDData, vector_arr: np.ndarray = None, loo
     cross_product = np.cross(v1_loop, v2_loop) # z-direction in mhd frame
 
     # Normal Vector
-    norm0 = cross_product / np.linalg.norm(cross_product)
+    norm0 = cross_product / np.linalg.norm(cross_product, axis=-1, keepdims=True)
 
     # Defining MHD base coordinate system
     z_mhd = norm0
-    x_mhd = v_12 / np.linalg.norm(v_12)
+    x_mhd = v_12 / np.linalg.norm(v_12, axis=-1, keepdims=True)
     zx_cross = np.cross(z_mhd, x_mhd)
-    y_mhd = zx_cross / np.linalg.norm(zx_cross)
+    y_mhd = zx_cross / np.linalg.norm(zx_cross, axis=-1, keepdims=True)
     
     # Transformation matrix from stonyhurst to MHD coordinates
 
-    mhd_in_stonyh = np.column_stack((x_mhd, y_mhd, z_mhd))
-    stonyh_to_mhd = np.linalg.inv(mhd_in_stonyh)            
-    
+    mhd_in_stonyh = np.stack((x_mhd, y_mhd, z_mhd), axis=-1)
+    stonyh_to_mhd = np.linalg.inv(mhd_in_stonyh)
+
+    return stonyh_to_mhd, ifpd
+
+def _observer_vectors(ref_img, **kwargs):
+    """Unit line of sight and camera north vectors of the reference image in Stonyhurst coordinates
+
+    :return: Line of sight and camera north vectors
+    :rtype: tuple (numpy.ndarray, numpy.ndarray)
+    """
+
     # NOTE - make observation LOS match the time of the alignment coordinate mpt
     obsframe = kwargs.get('obsframe', ref_img.coordinate_frame)
-    los_vector_obs = SkyCoord(CartesianRepresentation(0*u.Mm, 0*u.Mm, -1*u.Mm),
+    los_vector_obs = coordinates.SkyCoord(coordinates.CartesianRepresentation(0*u.Mm, 0*u.Mm, -1*u.Mm),
                         obstime=obsframe.obstime,
                         observer=obsframe.observer,
                         frame="heliocentric")
@@ -117,7 +167,7 @@ def calc_vect(ref_img: astropy.nddata.NDData, vector_arr: np.ndarray = None, loo
     cam_default = np.array([0, 1])
     cam_pt = np.dot(imag_rot_matrix, cam_default)  # camera pointing
     
-    camera_north_obs = SkyCoord(CartesianRepresentation(cam_pt[0]*u.Mm, 
+    camera_north_obs = coordinates.SkyCoord(coordinates.CartesianRepresentation(cam_pt[0]*u.Mm, 
                                                         cam_pt[1]*u.Mm, 
                                                         0*u.Mm),
                         obstime=obsframe.obstime,
@@ -137,26 +187,34 @@ def calc_vect(ref_img: astropy.nddata.NDData, vector_arr: np.ndarray = None, loo
     
     los_vec = los_vector_cart / np.linalg.norm(los_vector_cart)
     camera_vec = camera_north_cart / np.linalg.norm(camera_north_cart)
+
+    return los_vec, camera_vec
+
+def _view_vectors(stonyh_to_mhd, los_vec, camera_vec, default=False):
+    """Normal and north vectors in the MHD frame(s) from Stonyhurst line of sight and camera north
+
+    :return: Normal and north vectors of shape (..., 3)
+    :rtype: tuple (numpy.ndarray, numpy.ndarray)
+    """
+
+    norm_vec = stonyh_to_mhd @ los_vec
+    norm_vec = norm_vec / np.linalg.norm(norm_vec, axis=-1, keepdims=True)
     
-    norm_vec = np.dot(stonyh_to_mhd, los_vec).T
-    norm_vec = norm_vec / np.linalg.norm(norm_vec)
-    
-    north_vec = np.dot(stonyh_to_mhd, camera_vec).T
-    north_vec = north_vec / np.linalg.norm(north_vec)
+    north_vec = stonyh_to_mhd @ camera_vec
+    north_vec = north_vec / np.linalg.norm(north_vec, axis=-1, keepdims=True)
 
     # Inverting y component of the north vector in the MHD reference frame
-    north_vec[1] = - north_vec[1]
+    north_vec[..., 1] = - north_vec[..., 1]
     
     # DEFAULT: CAMERA UP
-    default = kwargs.get('default', False)
     if default:
         north = [0, 1., 0] 
-        north_vec = np.array(north)
+        north_vec = np.broadcast_to(np.array(north), norm_vec.shape).copy()
     
     northvector = north_vec
     normvector = norm_vec
 
-    return (normvector, northvector, ifpd)
+    return (normvector, northvector)
 
 def get_loop_coords(loop_params):
     """
@@ -168,24 +226,22 @@ def get_loop_coords(loop_params):
                         'theta0', 'el', 'az', and 'samples_num'.
     :type loop_params: dict
     :return: An `astropy.coordinates.CartesianRepresentation` object containing the
-             x, y, and z coordinates of the points defining the semi-circular loop.
+             x, y, and z coordinates (Stonyhurst, in Mm) of the points defining the loop,
+             see `loop_geometry.loop_points`.
     :rtype: astropy.coordinates.CartesianRepresentation
     """
 
-    radius = loop_params.get("radius", 10 * u.Mm)
-    height = loop_params.get("height", 0 * u.Mm)
-    phi0 = loop_params.get("phi0", 0 * u.deg)
-    theta0 = loop_params.get("theta0", 0 * u.deg)
-    el = loop_params.get("el", 90 * u.deg)
-    az = loop_params.get("az", 0 * u.deg)
-    samples_num = loop_params.get("samples_num", 100)
-
-    # TODO: Update loading CLB
-    # try:
-    #     loop_coords = semi_circle_loop(radius, 0, 0, False, height, theta0, phi0, el, az, samples_num)[0].cartesian
-    # except:
-    #     print("Error handled: Your CLB does not support semicircles \n")
-    #     loop_coords = semi_circle_loop(radius, height, theta0, phi0, el, az, samples_num)[0].cartesian
+    points = loop_points(radius=loop_params.get("radius", 10 * u.Mm),
+                         majax=loop_params.get("majax", 0 * u.Mm),
+                         minax=loop_params.get("minax", 0 * u.Mm),
+                         height=loop_params.get("height", 0 * u.Mm),
+                         phi0=loop_params.get("phi0", 0 * u.deg),
+                         theta0=loop_params.get("theta0", 0 * u.deg),
+                         el=loop_params.get("el", 90 * u.deg),
+                         az=loop_params.get("az", 0 * u.deg),
+                         samples_num=loop_params.get("samples_num", 100))
+
+    loop_coords = coordinates.CartesianRepresentation(points.T * u.Mm)
 
     return loop_coords
 
@@ -333,6 +389,7 @@ def get_reference_image(smap_path: str = None, smap=None, **kwargs):
         # If all loading attempts fail, generate a default reference image
         print("No reference image provided or loading failed, generating default\n")
 
+        from rushlight.utils.rimage import ReferenceImage
         ref_img = ReferenceImage(**kwargs).map
 
     return ref_img
@@ -381,7 +438,7 @@ def code_coords_to_arcsec(code_coord: unyt_array, ref_img: astropy.nddata.NDData
     print(center[0])
     print(center[1])
 
-    asec_coords = SkyCoord(x_asec, y_asec, frame=frame) #(x_asec, y_asec)
+    asec_coords = coordinates.SkyCoord(x_asec, y_asec, frame=frame) #(x_asec, y_asec)
 
     return asec_coords
 
@@ -408,12 +465,12 @@ def coord_projection(data, coord: unyt_array, orientation: Orientation=None, **k
         else:
             if 'norm_vector' in kwargs:
                 norm_vector = kwargs['norm_vector']
-                norm_vec = unyt_array(norm_vector) * data.domain_center.uq
+                norm_vec = unyt.unyt_array(norm_vector) * data.domain_center.uq
             if 'north_vector' in kwargs:
                 north_vector = kwargs['north_vector']
-                north_vec = unyt_array(north_vector) * data.domain_center.uq
+                north_vec = unyt.unyt_array(north_vector) * data.domain_center.uq
             if 'north_vector' and 'norm_vector' in kwargs:
-                orientation = Orientation(norm_vec, north_vector=north_vec)
+                orientation = yt.utilities.orientation.Orientation(norm_vec, north_vector=north_vec)
                 unit_vectors = orientation.unit_vectors
 
         # NOTE if self.data.domain_center is [0,0,0], then this does nothing
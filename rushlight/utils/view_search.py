@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# Coarse-to-fine search of the view orientation (or of any parameters mapped to view vectors)
+# that best reproduces an observed image, rendered in parallel workers from one emission cube
+
+import hashlib
+import itertools
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+from scipy import ndimage
+
+from rushlight.utils.alignment import PhaseCorrelator
+from rushlight.utils.projector import GridProjector
+from rushlight.utils.worker_pool import imap_shared
+
+# Default parameters of `orientation_vectors` and their search ranges in degrees
+DEFAULT_BOUNDS = {'lon': (-30., 30.), 'lat': (-30., 30.), 'roll': (-30., 30.)}
+
+
+def orientation_vectors(lon=0., lat=0., roll=0., normal_vector=(0., 0., 1.), north_vector=(0., 1., 0.)):
+    """Normal and north vectors of a view tilted away from a base view
+
+    :param lon: Rotation of the line of sight towards the east of the base view, in degrees
+    :type lon: float
+    :param lat: Rotation of the line of sight towards the north of the base view, in degrees
+    :type lat: float
+    :param roll: Rotation of the image plane about the new line of sight, in degrees
+    :type roll: float
+    :param normal_vector: Line of sight of the base view, defaults to the z axis
+    :type normal_vector: array-like, optional
+    :param north_vector: North vector of the base view, defaults to the y axis
+    :type north_vector: array-like, optional
+    :return: Normal and north vectors of the view
+    :rtype: tuple (numpy.ndarray, numpy.ndarray)
+    """
+
+    normal = np.asarray(normal_vector, dtype=np.float64)
+    normal = normal / np.linalg.norm(normal)
+    north = np.asarray(north_vector, dtype=np.float64)
+    north = north - north.dot(normal) * normal
+    north /= np.linalg.norm(north)
+    east = np.cross(north, normal)
+
+    lon, lat, roll = np.radians([lon, lat, roll])
+    new_normal = np.cos(lat) * (np.cos(lon) * normal + np.sin(lon) * east) + np.sin(lat) * north
+    new_north = -np.sin(lat) * (np.cos(lon) * normal + np.sin(lon) * east) + np.cos(lat) * north
+    new_north = np.cos(roll) * new_north + np.sin(roll) * np.cross(new_normal, new_north)
+    return new_normal, new_north
+
+
+def _render_candidate(task, candidate):
+    """Renders and scores one candidate with the settings of a search level"""
+    key, params = candidate
+    box, cube, view, view_kwargs, projector_kwargs, resolution, correlator = task
+    normal, north = view(**params, **view_kwargs)
+    projector = GridProjector(box, normal_vector=normal, north_vector=north, resolution=resolution,
+                              **projector_kwargs)
+    image = projector.integrate(cube)[0].T
+    return key, correlator.similarity(image), image
+
+
+class ViewSearch:
+    """
+    ## Fit of view parameters to an observed image
+
+    Candidates are rendered with `GridProjector` from one emission cube (e.g. `SharedFields.cube`
+    or `SyntheticImage.emission_cube`) and scored by their normalized cross-correlation with the
+    reference at the best shift, which does not depend on the image offset (see `PhaseCorrelator.similarity`).
+    Every level samples a grid of parameters around the best candidates of the previous level,
+    at increasing resolution; scores are cached and appended to a checkpoint file, so a search
+    that is interrupted (or repeated with more levels) only renders the missing candidates.
+    """
+
+    def __init__(self, box, cube, reference, center, width, view=orientation_vectors, view_kwargs=None,
+                 checkpoint=None, cache_size=64, **kwargs):
+        """
+        ### Constructor for the search
+
+        :param box: Dataset or region containing the cells of `cube`
+        :type box: yt Dataset, YTRegion
+        :param cube: Emission cell values from `GridProjector.sample_cube`, or a `BrickCube`
+        :type cube: numpy.ndarray, BrickCube
+        :param reference: Observed image, whose shape sets the full resolution of the renders
+        :type reference: numpy.ndarray
+        :param center: Center of the view port in code units
+        :type center: array-like
+        :param width: Width of the image plane in code units
+        :type width: float
+        :param view: Function mapping the search parameters (as keywords) to the normal and north vectors;
+            it has to be picklable for parallel searches, defaults to `orientation_vectors`
+        :type view: callable, optional
+        :param view_kwargs: Fixed keyword arguments of `view`, e.g. the base normal / north vectors
+        :type view_kwargs: dict, optional
+        :param checkpoint: Path of a JSON lines file recording every score, read back on construction;
+            only the records of searches with the same `view`, `view_kwargs`, view port and reference are used
+        :type checkpoint: str, optional
+        :param cache_size: Number of rendered images kept in memory, defaults to 64
+        :type cache_size: int, optional
+        :param upsample: Sub-pixel precision of the correlator, defaults to 1 (integer shifts)
+        :type upsample: int, optional
+        """
+
+        self.box = box
+        self.cube = cube
+        self.reference = np.nan_to_num(np.asarray(reference, dtype=np.float64))
+        self.view = view
+        self.view_kwargs = view_kwargs or {}
+        self.projector_kwargs = {'center': center, 'width': width}
+        self.upsample = kwargs.get('upsample', 1)
+
+        self.scores = {}
+        self.renders = OrderedDict()
+        self.cache_size = cache_size
+        self._correlators = {}
+        self.best, self.history = (None, [])
+
+        # Records of the checkpoint are tagged with the search they belong to, so searches of other
+        # base views, references or widths sharing the file are ignored
+        self.identity = self._identity()
+        self.checkpoint = checkpoint
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record.get('search') != self.identity:
+                            continue
+                        key = self._key(record['params'], tuple(record['resolution']))
+                        self.scores[key] = record['score']
+
+    def _identity(self):
+        """Hash of the settings the scores depend on: view function and its fixed arguments, view port,
+        reference image and correlator precision"""
+
+        def rounded(value):
+            value = np.asarray(value)
+            return np.round(value, 9).tolist() if np.issubdtype(value.dtype, np.number) else str(value)
+
+        view = f"{getattr(self.view, '__module__', '')}.{getattr(self.view, '__qualname__', repr(self.view))}"
+        description = {'view': view,
+                       'view_kwargs': {name: rounded(value) for name, value in sorted(self.view_kwargs.items())},
+                       'center': rounded(self.projector_kwargs['center']),
+                       'width': rounded(self.projector_kwargs['width']),
+                       'reference': [self.reference.shape, hashlib.sha1(self.reference.tobytes()).hexdigest()],
+                       'upsample': self.upsample}
+        return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _key(params, resolution):
+        """Cache key of a candidate: its resolution and rounded parameter values"""
+        return (tuple(resolution),) + tuple((name, round(float(params[name]), 9)) for name in sorted(params))
+
+    def correlator(self, factor):
+        """Correlator of the reference resampled by `factor`, cached per level resolution
+
+        :param factor: Fraction of the full resolution
+        :type factor: float
+        :rtype: PhaseCorrelator
+        """
+
+        if factor not in self._correlators:
+            reference = self.reference if factor == 1 else ndimage.zoom(self.reference, factor, order=1)
+            self._correlators[factor] = PhaseCorrelator(reference, upsample=self.upsample)
+        return self._correlators[factor]
+
+    def evaluate(self, candidates, factor=1., workers=None):
+        """Scores of parameter sets at a fraction of the full resolution, rendering only uncached ones
+
+        :param candidates: Parameter dictionaries, passed to `view` as keywords
+        :type candidates: list
+        :param factor: Fraction of the full resolution, defaults to 1
+        :type factor: float, optional
+        :param workers: Number of worker processes, defaults to serial rendering
+        :type workers: int, optional
+        :return: Scores in the order of `candidates`
+        :rtype: list
+        """
+
+        correlator = self.correlator(factor)
+        ny, nx = correlator.shape
+        keys = [self._key(params, (nx, ny)) for params in candidates]
+        missing = list({key: (key, params) for key, params in zip(keys, candidates)
+                        if key not in self.scores}.values())
+
+        if missing:
+            # Workers inherit the cube and the dataset instead of receiving copies
+            task = (self.box, self.cube, self.view, self.view_kwargs, self.projector_kwargs, (nx, ny), correlator)
+            params = dict(missing)
+            for key, score, image in imap_shared(_render_candidate, missing, task, workers):
+                self._store(key, score, image, params[key])
+
+        return [self.scores[key] for key in keys]
+
+    def _store(self, key, score, image, params):
+        """Caches a score and its render, and appends it to the checkpoint"""
+
+        self.scores[key] = score
+        self.renders[key] = image
+        while len(self.renders) > self.cache_size:
+            self.renders.popitem(last=False)
+
+        if self.checkpoint:
+            with open(self.checkpoint, 'a') as f:
+                f.write(json.dumps({'search': self.identity,
+                                    'params': {name: float(value) for name, value in params.items()},
+                                    'resolution': list(key[0]), 'score': float(score)}) + '\n')
+
+    def search(self, bounds=None, samples=5, levels=(0.25, 0.5, 1.), keep=1, workers=None):
+        """Coarse-to-fine grid search of the parameters maximizing the similarity with the reference
+
+        :param bounds: Parameter name -> (low, high) of the first level, defaults to `DEFAULT_BOUNDS`
+        :type bounds: dict, optional
+        :param samples: Number of grid points per parameter and level, defaults to 5
+        :type samples: int, optional
+        :param levels: Fraction of the full resolution rendered at each level, defaults to (0.25, 0.5, 1)
+        :type levels: tuple, optional
+        :param keep: Number of best candidates refined at the next level, defaults to 1
+        :type keep: int, optional
+        :param workers: Number of worker processes, defaults to serial rendering
+        :type workers: int, optional
+        :return: Best parameters, their score and view vectors: keys 'params', 'score',
+            'normal_vector', 'north_vector'
+        :rtype: dict
+        """
+
+        bounds = bounds or DEFAULT_BOUNDS
+        names = sorted(bounds)
+        centers = [{name: 0.5 * (bounds[name][0] + bounds[name][1]) for name in names}]
+        half_width = {name: 0.5 * (bounds[name][1] - bounds[name][0]) for name in names}
+
+        for factor in levels:
+            candidates = []
+            for center in centers:
+                axes = [np.linspace(center[name] - half_width[name], center[name] + half_width[name], samples)
+                        for name in names]
+                candidates += [dict(zip(names, values)) for values in itertools.product(*axes)]
+
+            scores = self.evaluate(candidates, factor=factor, workers=workers)
+            order = np.argsort(scores)[::-1]
+            centers = [candidates[i] for i in order[:keep]]
+            self.history.append({'factor': factor, 'params': centers[0], 'score': scores[order[0]]})
+
+            # The next level spans one grid step on either side of the retained candidates
+            half_width = {name: 2 * half_width[name] / max(samples - 1, 1) for name in names}
+
+        normal, north = self.view(**centers[0], **self.view_kwargs)
+        self.best = {'params': {name: float(value) for name, value in centers[0].items()},
+                     'score': self.history[-1]['score'], 'normal_vector': normal, 'north_vector': north}
+        return self.best
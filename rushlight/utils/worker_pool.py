@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# Worker pools whose tasks share large read-only state (datasets, emission cubes, renderers):
+# forked workers inherit the state instead of receiving pickled copies
+
+import functools
+import itertools
+import multiprocessing
+import pickle
+import sys
+from multiprocessing.pool import ThreadPool
+
+# State of the running `imap_shared` calls by token, inherited by forked workers
+_SHARED = {}
+_TOKENS = itertools.count()
+
+
+def _call(token, item):
+    """Applies the function of a running `imap_shared` call to one item"""
+    shared = _SHARED[token]
+    if isinstance(shared, Exception):
+        raise shared
+    function, state = shared
+    return function(state, item)
+
+
+def _install(token, payload):
+    """Initializer of the spawned workers: unpickles the function and state of an `imap_shared` call"""
+    try:
+        _SHARED[token] = pickle.loads(payload)
+    except Exception as error:
+        # Raised by the tasks instead, as a pool restarts the workers whose initializer fails
+        _SHARED[token] = error
+
+
+def process_context():
+    """Context of the worker processes: fork on Linux, the platform default elsewhere (forking
+    a process that has loaded system frameworks, e.g. on macOS, is unsafe)
+
+    :rtype: multiprocessing.context.BaseContext
+    """
+
+    return multiprocessing.get_context('fork' if sys.platform.startswith('linux') else None)
+
+
+def forks():
+    """Whether the workers of `imap_shared` are forked and inherit its state (on Linux, outside
+    the workers of a pool)
+
+    :rtype: bool
+    """
+
+    return sys.platform.startswith('linux') and not multiprocessing.current_process().daemon
+
+
+def make_pool(token, function, state, workers):
+    """Pool of workers sharing the state of an `imap_shared` call
+
+    On Linux the workers are forked and inherit the state. Elsewhere they are spawned and unpickle
+    the state once each; threads are used only when the state is not picklable, and within the
+    (daemonic) workers of a pool, which cannot start processes.
+
+    :param token: Key of the call in the shared state
+    :type token: int
+    :param function: Function applied to the items
+    :type function: callable
+    :param state: Read-only state of all the tasks
+    :type state: object
+    :param workers: Number of workers
+    :type workers: int
+    :rtype: multiprocessing.pool.Pool
+    """
+
+    if forks():
+        return multiprocessing.get_context('fork').Pool(workers)
+    if multiprocessing.current_process().daemon:
+        return ThreadPool(workers)
+    try:
+        payload = pickle.dumps((function, state), protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return ThreadPool(workers)
+    return process_context().Pool(workers, initializer=_install, initargs=(token, payload))
+
+
+def imap_shared(function, items, state, workers=None, chunksize=1):
+    """Applies `function(state, item)` to the items, in parallel workers sharing `state`
+
+    Only the items and the results are sent between processes: `state` is set before the workers
+    start and inherited by forked workers, so `function` and `state` need not be picklable on Linux;
+    see `make_pool` for the other platforms. Calls may be nested.
+
+    :param function: Module-level function of the state and of one item
+    :type function: callable
+    :param items: Inputs of the tasks
+    :type items: list
+    :param state: Read-only state of all the tasks
+    :type state: object
+    :param workers: Number of workers, defaults to running the tasks serially in this process
+    :type workers: int, optional
+    :param chunksize: Number of items sent to a worker at once, defaults to 1
+    :type chunksize: int, optional
+    :return: Results, in the order of `items` when serial and as they complete otherwise
+    :rtype: generator
+    """
+
+    token = next(_TOKENS)
+    _SHARED[token] = (function, state)
+    try:
+        if workers and workers > 1 and len(items) > 1:
+            with make_pool(token, function, state, min(workers, len(items))) as pool:
+                yield from pool.imap_unordered(functools.partial(_call, token), items, chunksize=chunksize)
+        else:
+            for item in items:
+                yield function(state, item)
+    finally:
+        _SHARED.pop(token, None)
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+import pytest
+
+import yt
+import astropy.units as u
+
+from rushlight.utils import dcube
+from rushlight.utils.projector import GridProjector
+from rushlight.emission_models import uv
+
+
+@pytest.fixture(scope="session")
+def dummy_ds():
+    """Default synthetic datacube with the AIA 171 emissivity field"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_file = os.path.join(temp_dir, "test.h5")
+        dcube.Dcube(output_file=temp_file)
+        ds = yt.load(temp_file)
+        uv.UVModel("temperature", "number_density", 171 * u.angstrom).make_intensity_fields(ds)
+        yield ds
+
+
+def make_projector(ds, normal, north=(0., 1., 0.), resolution=64, **kwargs):
+    return GridProjector(ds, ds.domain_center.value, normal_vector=normal, width=ds.domain_width[0].value,
+                         resolution=resolution, north_vector=north, **kwargs)
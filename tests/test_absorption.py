@@ -0,0 +1,58 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+import astropy.units as u
+
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+from tests.conftest import make_projector
+
+
+def test_absorbing_slab(dummy_ds):
+    """Emission behind an absorbing slab is attenuated by exp(-tau); without absorption the thin sum is recovered"""
+    projector = make_projector(dummy_ds, [0., 0., 1.], resolution=16)
+    nx, ny, nz = projector.dims
+    z_index = np.broadcast_to(np.arange(nz), (nx, ny, nz)).ravel()
+
+    emissivity = np.where(z_index >= nz // 2, 1., 0.)
+    kappa = np.where(z_index < nz // 2, 2e-11, 0.)
+    length_cm = float(dummy_ds.length_unit.to('cm').d) * projector.dx[2] * nz / 2
+
+    image, tau = projector.integrate_absorbing(np.column_stack([emissivity, kappa]))
+    inside = tau > 0
+    assert_allclose(tau[inside], 2e-11 * length_cm, rtol=1e-10)
+    assert_allclose(image[inside], length_cm * np.exp(-2e-11 * length_cm), rtol=1e-10)
+
+    thin_cube = np.column_stack([emissivity, np.zeros_like(kappa)])
+    image, tau = projector.integrate_absorbing(thin_cube)
+    assert_allclose(image, projector.integrate(thin_cube)[0], rtol=1e-12)
+    assert np.all(tau == 0)
+
+    # Rays stop once saturated, leaving the optical depth just above tau_max
+    image, tau = projector.integrate_absorbing(np.column_stack([emissivity, 10 * kappa]), tau_max=2.)
+    assert tau[inside].max() < 2. + 10 * 2e-11 * projector.path_length
+
+
+def test_absorption_in_synthetic_image(dummy_ds, monkeypatch):
+    """Cool material of the dummy cube dims the 171 image relative to the optically thin projection"""
+    kwargs = dict(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                  normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.])
+    absorbed = sfi(absorption=True, **kwargs)
+    projector = absorbed._projector()
+    thin = projector.integrate(projector.sample_cube([("gas", absorbed.imag_field)]))[0].T
+
+    assert absorbed.optical_depth.max() > 0.1
+    assert np.all(absorbed.image <= thin * (1 + 1e-12))
+    assert absorbed.image.sum() < thin.sum()
+
+    # Negligible absorption gives the standard projection, without sampling the absorption field
+    assert not absorbed.absorption_negligible()
+    calls = []
+    monkeypatch.setattr(absorbed, 'proj_absorbing', lambda **kwargs: calls.append(kwargs))
+    absorbed.proj_and_imag(absorption=True, tau_thin=1e12)
+    assert calls == []
+    assert_allclose(absorbed.image, sfi(**kwargs).image, rtol=1e-12)
+    assert absorbed.optical_depth.shape == absorbed.image.shape and not absorbed.optical_depth.any()
+
+    # Projections without absorption drop the optical depth of earlier ones
+    absorbed.proj_and_imag()
+    assert absorbed.optical_depth is None
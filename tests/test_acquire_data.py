@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+
+import astropy.units as u
+from astropy.io import fits
+from astropy.table import Table
+
+from rushlight.utils.acquire_data import DirectoryArchive, FidoArchive, _filter_names, acquire, \
+    get_sdo_aia_data, get_hinode_xrt_data
+
+
+class CountingArchive(DirectoryArchive):
+    """Fake remote archive recording its searches"""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.searches = 0
+
+    def search(self, *args):
+        self.searches += 1
+        return super().search(*args)
+
+
+def _write(directory, name, date_obs, telescope='SDO/AIA', instrument='AIA_3', **keys):
+    header = fits.Header({'TELESCOP': telescope, 'INSTRUME': instrument, 'DATE-OBS': date_obs, **keys})
+    fits.PrimaryHDU(np.zeros((4, 4), dtype=np.float32), header).writeto(os.path.join(directory, name))
+
+
+def test_acquire_from_fake_archive(tmp_path):
+    """Only observations missing from the local archive are fetched, and complete requests stay local"""
+    remote = CountingArchive(str(tmp_path / 'remote'))
+    for k, second in enumerate([0, 12, 24, 36, 48]):
+        _write(remote.directory, f'aia_171_{k}.fits', f'2011-03-07T18:06:{second:02d}', WAVELNTH=171)
+        _write(remote.directory, f'aia_193_{k}.fits', f'2011-03-07T18:06:{second:02d}', WAVELNTH=193)
+    _write(remote.directory, 'xrt_ti.fits', '2011-03-07T18:06:30', telescope='HINODE', instrument='XRT',
+           EC_FW1_='Open', EC_FW2_='Ti_poly')
+    _write(remote.directory, 'xrt_al.fits', '2011-03-07T18:06:40', telescope='HINODE', instrument='XRT',
+           EC_FW1_='Al_mesh', EC_FW2_='Open')
+
+    local = str(tmp_path / 'local')
+    os.makedirs(local)
+    _write(local, 'aia_171_1.fits', '2011-03-07T18:06:12', WAVELNTH=171)
+
+    files = acquire('AIA', 171, '2011-03-07T18:06:00', '2011-03-07T18:06:24', local=local, remote=remote,
+                    cadence=12 * u.s, max_workers=2)
+    assert [os.path.basename(f) for f in files] == ['aia_171_0.fits', 'aia_171_1.fits', 'aia_171_2.fits']
+    assert remote.searches == 1
+
+    # Complete requests do not search the remote archive
+    files = get_sdo_aia_data('2011-03-07T18:06:00', channel=171, duration=24, local=local, remote=remote)
+    assert len(files) == 3 and remote.searches == 1
+
+    files = get_hinode_xrt_data('2011-03-07T18:06:00', channel='Ti-poly', duration=60, local=local, remote=remote)
+    assert [os.path.basename(f) for f in files] == ['xrt_ti.fits']
+    assert not os.path.exists(os.path.join(local, 'xrt_al.fits'))
+    searches = remote.searches
+    get_hinode_xrt_data('2011-03-07T18:06:20', channel='Ti-poly', duration=20, local=local, remote=remote)
+    assert remote.searches == searches
+    assert acquire('AIA', 193 * u.AA, '2011-03-07T18:06:00', '2011-03-07T18:07:00', local=local) == []
+
+
+def test_fido_filter_selection(monkeypatch):
+    """XRT search results of other filters are dropped before fetching"""
+    assert _filter_names('Open/Ti-poly') == {'open', 'ti_poly'}
+    sunpy_net = pytest.importorskip('sunpy.net')
+
+    table = Table({'Start Time': ['2011-03-07 18:06:10', '2011-03-07 18:06:20', '2011-03-07 18:06:30'],
+                   'Filter': ['Open/Ti_poly', 'Al_mesh/Open', 'Open/Ti_poly']})
+    monkeypatch.setattr(sunpy_net.Fido, 'search', lambda *query: [table])
+
+    records = FidoArchive().search('XRT', 'Ti-poly', '2011-03-07T18:06:00', '2011-03-07T18:07:00')
+    assert [record['ref'][1] for record in records] == [0, 2]
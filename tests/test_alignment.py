@@ -0,0 +1,94 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy import ndimage
+import pytest
+
+import astropy.units as u
+
+from rushlight.utils.alignment import PhaseCorrelator, center_to_shape
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+
+
+def _blobs(size=128, n=25, seed=0):
+    """Image of random Gaussian blobs, kept away from the edges"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:size, :size]
+    image = np.zeros((size, size))
+    for _ in range(n):
+        cy, cx = rng.uniform(0.25 * size, 0.75 * size, 2)
+        sigma = rng.uniform(2., 6.)
+        image += rng.uniform(1., 5.) * np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / (2 * sigma ** 2))
+    return image
+
+
+def test_subpixel_shift():
+    """Sub-pixel translations are recovered, reusing the cached reference spectrum"""
+    image = _blobs()
+    reference = ndimage.shift(image, (3.3, -5.7), order=3)
+    correlator = PhaseCorrelator(reference)
+    spectrum = correlator.reference_spectrum
+
+    shift, peak = correlator.shift(image)
+    assert_allclose(shift, (3.3, -5.7), atol=0.1)
+    assert 0. < peak <= 1.
+    assert correlator.shift(reference)[1] > peak
+    assert correlator.reference_spectrum is spectrum
+
+    assert_allclose(correlator.similarity(reference), 1.)
+    assert 0.9 < correlator.similarity(image) < 1.
+
+    with pytest.raises(ValueError):
+        correlator.shift(image[:64])
+
+
+@pytest.mark.parametrize("rotation, scale", [(10., 1.), (-15., 0.92), (170., 1.05)])
+def test_rotation_scale(rotation, scale):
+    """Rotation and scale from log-polar spectra, with the transform aligning the image"""
+    image = _blobs()
+    correlator = PhaseCorrelator(image, rotation_scale=True)
+    reference = ndimage.shift(correlator.transform(image, rotation, scale), (2., 1.5))
+    correlator = PhaseCorrelator(reference, rotation_scale=True)
+
+    result = correlator.align(image)
+    assert abs((result['rotation'] - rotation + 180.) % 360. - 180.) < 1.
+    assert_allclose(result['scale'], scale, rtol=0.02)
+    aligned = correlator.transform(image, result['rotation'], result['scale'], result['shift'])
+    assert np.corrcoef(aligned.ravel(), reference.ravel())[0, 1] > 0.98
+
+
+def test_center_to_shape():
+    """Images are padded or cropped about their center"""
+    image = np.arange(35.).reshape(5, 7)
+    padded, offset = center_to_shape(image, (9, 8))
+    assert padded.shape == (9, 8) and np.array_equal(padded[2:7, 0:7], image)
+    assert_allclose(offset, (0, -0.5))
+
+    cropped, offset = center_to_shape(image, (3, 4))
+    assert np.array_equal(cropped, image[1:4, 2:6])
+    assert np.array_equal(center_to_shape(cropped, (5, 7))[0][1:4, 1:5], cropped)
+    assert_allclose(offset, (0, -0.5))
+
+
+def test_align_to_reference(dummy_ds):
+    """Phase correlation recovers a known offset of the synthetic image, with a cached correlator"""
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.])
+    assert synth.alignment is None
+
+    synth.align_to_reference()
+    correlator = synth._correlator
+    assert correlator.shape == synth.ref_img.data.shape
+    synth.align_to_reference()
+    assert synth._correlator is correlator
+
+    shifted = PhaseCorrelator(np.roll(synth.image, (3, -2), axis=(0, 1)))
+    alignment = synth.align_to_reference(correlator=shifted)
+    assert alignment is synth.alignment
+    assert_allclose(alignment['shift'], (3, -2), atol=0.1)
+
+    # Images of another shape are padded about their center, without a spurious offset
+    full = PhaseCorrelator(synth.image)
+    synth.result = synth.result.with_data(synth.image[6:-6, 6:-6])
+    assert_allclose(synth.align_to_reference(correlator=full)['shift'], (0, 0), atol=0.1)
+    synth.result = synth.result.with_data(synth.image[6:-7, 6:-7])
+    assert_allclose(synth.align_to_reference(correlator=full)['shift'], (-0.5, -0.5), atol=0.1)
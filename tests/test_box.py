@@ -0,0 +1,64 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import astropy.units as u
+from astropy.coordinates import SkyCoord, CartesianRepresentation
+from astropy.time import Time
+from sunpy.coordinates import Helioprojective, Heliocentric, get_earth
+
+from rushlight.utils.box import Box
+
+
+@pytest.fixture(scope='module')
+def box():
+    time = Time('2024-05-09T17:12:00')
+    observer = get_earth(time)
+    frame_obs = Helioprojective(observer=observer, obstime=time)
+    box_origin = SkyCoord(lon=20 * u.deg, lat=-10 * u.deg, radius=1 * u.R_sun, frame='heliographic_stonyhurst',
+                          observer=observer, obstime=time)
+    origin_hcc = box_origin.transform_to(Heliocentric(observer=box_origin, obstime=time))
+    box_center = SkyCoord(x=origin_hcc.x, y=origin_hcc.y, z=origin_hcc.z + 25 * u.Mm, frame=origin_hcc.frame)
+    return Box(frame_obs=frame_obs, box_origin=box_origin, box_center=box_center,
+               box_dims=u.Quantity([100, 80, 50], u.Mm), box_res=1.4 * u.Mm)
+
+
+def test_box_edges(box):
+    """Edges match the pairwise construction of corners differing in one dimension"""
+
+    corners = list(itertools.product(*(box.box_dims[k].to_value(u.Mm) / 2 * np.array([-1, 1]) for k in range(3))))
+    expected = [edge for edge in itertools.combinations(corners, 2)
+                if np.count_nonzero(np.subtract(*edge)) == 1]
+    assert box.edges.shape == (12, 2, 3) and box.bottom.sum() == 4
+    assert np.allclose(box.edges.to_value(u.Mm), expected)
+    assert u.allclose(box.edges[box.bottom][..., 2], -25 * u.Mm)
+    # Lists of two-point edges, as before the edges were held as arrays
+    assert len(box.bottom_edges) == 4 and len(box.non_bottom_edges) == 8
+    assert len(box.bottom_edges + box.non_bottom_edges) == 12 and box.all_edges[0].shape == (2,)
+    assert u.allclose(box.all_edges[3].cartesian.xyz, box.bottom_edges[3].cartesian.xyz)
+
+
+def test_box_transform(box):
+    """Edges are transformed at once, once per frame"""
+
+    frame = Helioprojective(observer=box._frame_obs.observer, obstime=box._frame_obs.obstime)
+    edges = box.transform_edges(frame)
+    assert box.transform_edges(box._frame_obs) is edges
+
+    edge = box.non_bottom_edges[3].transform_to(frame)
+    assert u.allclose(edges[~box.bottom][3].Tx, edge.Tx) and u.allclose(edges[~box.bottom][3].Ty, edge.Ty)
+
+    bottom_left, top_right = box.bounds_coords_bl_tr()
+    assert u.isclose(bottom_left.Tx, edges.Tx.min()) and u.isclose(top_right.Ty, edges.Ty.max())
+    bounds = box.bottom_bounds_coords
+    assert u.isclose(bounds.Tx[1], edges[box.bottom].Tx.max())
+
+    moved = SkyCoord(CartesianRepresentation(edges.cartesian.xyz), frame=edges.frame)
+    assert moved.shape == edges.shape
+
+    # Only the most recently used frames are kept
+    for minutes in range(1, box.TRANSFORM_CACHE_SIZE + 2):
+        box.transform_edges(Helioprojective(observer=frame.observer, obstime=frame.obstime + minutes * u.min))
+    assert len(box._transformed) == box.TRANSFORM_CACHE_SIZE
+    assert not any(cached.is_equivalent_frame(frame) for cached, _ in box._transformed)
@@ -0,0 +1,94 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+
+import astropy.units as u
+
+from rushlight.utils.projector import BrickMap, BrickCube
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+from rushlight.emission_models import uv
+from tests.conftest import make_projector
+
+
+def test_empty_space_skipping(dummy_ds):
+    """Skipping faint bricks stays within the reported error bound and tightens the width"""
+    field = ("gas", "aia_filter_band")
+    projector = make_projector(dummy_ds, [0.3, 0.2, 1.])
+    cube = projector.sample_cube([field])
+    full = projector.integrate(cube)[0]
+
+    bricks = BrickMap(cube[:, 0], projector.dims, brick_size=4)
+    projector = make_projector(dummy_ds, [0.3, 0.2, 1.])
+    projector.skip_empty(bricks, 0.1 * bricks.peak)
+    skipped = projector.integrate(cube)[0]
+    report = projector.skip_report()
+
+    assert report['skipped_fraction'] > 0.5 and report['speedup'] > 2.
+    assert np.abs(skipped - full).max() <= report['error_bound']
+
+    # Emission confined to the central bricks gives a narrower image plane
+    local = np.zeros(projector.dims)
+    local[4:8, 8:16, 8:16] = 1.
+    projector.skip_empty(BrickMap(local.ravel(), projector.dims, brick_size=4), 0.5)
+    assert projector.tight_width < 0.5 * dummy_ds.domain_width[0].value
+
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.], skip_empty=1e-3,
+                projector='grid')
+    assert synth.skip_report['error_bound'] < 1e-2 * synth.image.max()
+
+    # The header pixel scale follows the narrowed image plane
+    reference = u.Quantity(synth.synth_map.scale).value
+    key = (synth.instr, str(synth.channel))
+    synth.emission_cubes[key] = local.reshape(-1, 1)
+    synth.occupancy_maps = {}
+    synth.proj_and_imag(skip_empty=0.5, brick_size=4, prjw='tight', projector='grid')
+    synth.make_synthetic_result()
+    ratio = synth.skip_report['tight_width'] / dummy_ds.domain_width[0].value
+    assert 0 < ratio < 0.5 and synth.width_scale == pytest.approx(ratio)
+    assert_allclose(u.Quantity(synth.synth_map.scale).value, ratio * reference)
+
+
+def test_sparse_emissivity(dummy_ds):
+    """Brick-compressed emissivity projects like the dense cube restricted to the same bricks"""
+    field = ("gas", "aia_filter_band")
+    projector = make_projector(dummy_ds, [0.3, 0.2, 1.])
+    cube = projector.sample_cube([field])
+
+    dense = BrickCube.from_cube(cube, projector.dims, brick_size=4)
+    assert np.array_equal(dense.to_dense(), cube)
+    assert_allclose(make_projector(dummy_ds, [0.3, 0.2, 1.]).integrate(dense), projector.integrate(cube))
+
+    model = uv.UVModel("temperature", "number_density", 171 * u.angstrom)
+    sparse = BrickCube.from_model(model, dummy_ds, brick_size=4, rel_threshold=0.1)
+    assert sparse.occupancy < 0.5 and sparse.nbytes < cube.nbytes
+
+    bricks = BrickMap(cube[:, 0], projector.dims, brick_size=4)
+    projector.skip_empty(bricks, 0.1 * bricks.peak)
+    assert_allclose(make_projector(dummy_ds, [0.3, 0.2, 1.]).integrate(sparse), projector.integrate(cube))
+
+    kwargs = dict(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                  normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.])
+    assert_allclose(sfi(sparse=0.1, projector='grid', **kwargs).image,
+                    sfi(skip_empty=0.1, projector='grid', **kwargs).image)
+
+
+def test_sparse_build_memory():
+    """The relative cut applies while bricks are collected: a faint background is never stored"""
+    import tracemalloc
+
+    dims = np.array([64, 64, 64])
+    values = np.full(tuple(dims), 1e-6)
+    values[8:16, 24:40, 24:40] = 1.
+    values = values.reshape(-1, 1)
+
+    tracemalloc.start()
+    try:
+        sparse = BrickCube.from_cube(values, dims, brick_size=8, rel_threshold=1e-3)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert len(sparse.bricks) == 4
+    assert peak < 0.5 * values.nbytes  # a few slabs, never the whole cube
+    assert_allclose(sparse.to_dense().reshape(tuple(dims))[8:16, 24:40, 24:40], 1.)
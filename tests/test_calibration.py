@@ -0,0 +1,76 @@
+import gzip
+import os
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+
+import sunpy.map
+from sunpy.coordinates import frames
+from sunpy.map.header_helper import make_fitswcs_header
+
+from rushlight.utils.calibration import CalibrationCache
+
+
+def double_exposure(smap):
+    """Calibration step for the tests: scales the data by two"""
+    return sunpy.map.Map(smap.data * 2, smap.meta)
+
+
+def _write_map(path, value):
+    coord = SkyCoord(0 * u.arcsec, 0 * u.arcsec, obstime='2012-07-19T10:00:00', observer='earth',
+                     frame=frames.Helioprojective)
+    header = make_fitswcs_header(np.full((16, 16), value, dtype=np.float32), coord,
+                                 scale=[0.6, 0.6] * u.arcsec / u.pix)
+    sunpy.map.Map(np.full((16, 16), value, dtype=np.float32), header).save(path, overwrite=True)
+
+
+def test_calibration_cache(tmp_path):
+    """Files are calibrated once per content and settings, in parallel, and reused afterwards"""
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+    for k in range(3):
+        _write_map(str(raw / f'aia_{k}.fits'), k + 1.)
+
+    cache = CalibrationCache(str(tmp_path / 'lev15'), steps=[double_exposure])
+    outputs = cache.calibrate_directory(str(raw), workers=2)
+    assert cache.stats == {'calibrated': 3, 'cached': 0}
+    assert_allclose([sunpy.map.Map(path).data.mean() for path in outputs], [2., 4., 6.])
+
+    mtimes = [os.stat(path).st_mtime_ns for path in outputs]
+    assert cache.calibrate_directory(str(raw)) == outputs
+    assert cache.stats == {'calibrated': 0, 'cached': 3}
+    assert [os.stat(path).st_mtime_ns for path in outputs] == mtimes
+
+    # Changed inputs and changed settings both produce new entries
+    _write_map(str(raw / 'aia_1.fits'), 10.)
+    updated = cache.calibrate_directory(str(raw))
+    assert cache.stats == {'calibrated': 1, 'cached': 2}
+    assert updated[1] != outputs[1] and updated[0] == outputs[0]
+    assert_allclose(cache.maps([str(raw / 'aia_1.fits')])[0].data, 20.)
+
+    twice = CalibrationCache(str(tmp_path / 'lev15'), steps=[double_exposure, double_exposure])
+    assert set(twice.calibrate_directory(str(raw))).isdisjoint(updated)
+    assert twice.stats['calibrated'] == 3
+
+
+def test_input_hashes(tmp_path, monkeypatch):
+    """Output names keep the dots of the input names, and unchanged inputs are hashed once"""
+    from rushlight.utils import calibration
+
+    raw = str(tmp_path / 'aia.lev1.171.fits')
+    _write_map(raw, 1.)
+    cache = CalibrationCache(str(tmp_path / 'lev15'), steps=[double_exposure])
+    assert os.path.basename(cache.output_path(raw)).startswith('aia.lev1.171_lev15_')
+    with open(raw, 'rb') as f, gzip.open(f"{raw}.gz", 'wb') as g:
+        g.write(f.read())
+    assert os.path.basename(cache.output_path(f"{raw}.gz")).startswith('aia.lev1.171_lev15_')
+
+    hashed = []
+    monkeypatch.setattr(calibration, 'file_hash', lambda path: hashed.append(path) or 'digest')
+    cache = CalibrationCache(str(tmp_path / 'lev15'), steps=[double_exposure])
+    cache.calibrate([raw])
+    cache.calibrate([raw])
+    assert hashed == [raw]
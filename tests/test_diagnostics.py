@@ -0,0 +1,40 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+import yt
+import astropy.units as u
+
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+
+
+def test_diagnostic_maps_single_traversal(dummy_ds):
+    """Diagnostic maps match separate yt projections and share the synthetic WCS"""
+    normal = [0.3, 0.2, 1.]
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                normvector=normal, northvector=[0., 1., 0.],
+                diagnostics=['emission_measure', 'column_density', 'temperature',
+                             {'name': 'density_weighted_temperature', 'field': ('gas', 'temperature'),
+                              'weight': ('gas', 'density'), 'unit': 'K'}])
+
+    assert set(synth.diagnostic_maps) == {'emission_measure', 'column_density', 'temperature',
+                                          'density_weighted_temperature'}
+    assert not synth.diagnostic_maps._maps  # maps are only built on access
+    for smap in synth.diagnostic_maps.values():
+        assert smap.data.shape == synth.synth_map.data.shape
+        assert smap.wcs.wcs.compare(synth.synth_map.wcs.wcs)
+    assert synth.diagnostic_maps['temperature'].unit == u.K
+
+    center = dummy_ds.domain_center.value
+    kwargs = dict(normal_vector=normal, width=dummy_ds.domain_width[0].value, resolution=synth.image.shape[0],
+                  north_vector=[0., 1., 0.])
+    column = np.array(yt.off_axis_projection(dummy_ds, center, item=("gas", "number_density"), **kwargs)).T
+    assert_allclose(synth.diagnostic_images['column_density'].sum(), column.sum(), rtol=0.03)
+
+    t_weighted = np.array(yt.off_axis_projection(dummy_ds, center, item=("gas", "temperature"),
+                                                 weight=("gas", "density"), **kwargs)).T
+    inside = (t_weighted > 0) & (synth.diagnostic_images['density_weighted_temperature'] > 0)
+    assert np.median(np.abs(synth.diagnostic_images['density_weighted_temperature'][inside] / t_weighted[inside] - 1)) < 0.05
+
+    # Emission-weighted temperature lies within the temperature range of the cube
+    t_em = synth.diagnostic_images['temperature']
+    assert t_em.max() <= dummy_ds.all_data()["gas", "temperature"].max().d * (1 + 1e-12)
@@ -0,0 +1,92 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import astropy.units as u
+from astropy.io import fits
+
+from rushlight.utils.fits_index import FitsHeaderIndex, INDEX_NAME
+
+
+def _write(directory, name, telescope, wavelength, date_obs, compressed=False):
+    """Small FITS file with the indexed keywords"""
+    header = fits.Header({'TELESCOP': telescope, 'INSTRUME': telescope.split('/')[-1], 'WAVELNTH': wavelength,
+                          'DATE-OBS': date_obs, 'HGLN_OBS': 0., 'HGLT_OBS': 5., 'DSUN_OBS': 1.5e11})
+    data = np.zeros((8, 8), dtype=np.float32)
+    if compressed:
+        hdul = fits.HDUList([fits.PrimaryHDU(), fits.CompImageHDU(data, header)])
+    else:
+        hdul = fits.HDUList([fits.PrimaryHDU(data, header)])
+    hdul.writeto(os.path.join(directory, name))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    _write(tmp_path, 'aia_171_a.fits', 'SDO/AIA', 171, '2012-07-19T10:00:00', compressed=True)
+    _write(tmp_path, 'aia_171_b.fits', 'SDO/AIA', 171, '2012-07-19T10:30:00')
+    _write(tmp_path, 'aia_193.fits', 'SDO/AIA', 193, '2012-07-19T10:00:00')
+    _write(tmp_path, 'euvi_171.fts', 'STEREO', 171, '2012-07-19T10:10:00')
+    _write(tmp_path, 'euvi_195.fts', 'STEREO', 195, '2012-07-19T11:00:00')
+    _write(tmp_path, 'euvi_304.fts', 'STEREO', 304, '2012-07-19T10:00:00')
+    return str(tmp_path)
+
+
+def test_header_index(archive):
+    """Headers are indexed once, re-read only for changed files and matched by channel"""
+    index = FitsHeaderIndex(archive)
+    assert len(index) == 6
+    assert os.path.exists(os.path.join(archive, INDEX_NAME))
+    assert index['aia_171_a.fits']['telescope'] == 'SDO/AIA'
+    assert index['aia_171_a.fits']['observer']['hglt_obs'] == 5.
+
+    path = lambda name: os.path.join(archive, name)
+    assert index.pairs() == [(path('aia_171_a.fits'), path('euvi_171.fts')),
+                             (path('aia_171_b.fits'), path('euvi_171.fts')),
+                             (path('aia_193.fits'), path('euvi_195.fts'))]
+    assert index.pairs(wavelength=195) == [(path('aia_193.fits'), path('euvi_195.fts'))]
+
+    reloaded = FitsHeaderIndex(archive, update=False)
+    assert reloaded.records == index.records
+    assert reloaded.update() == 0
+
+    time.sleep(0.01)
+    os.remove(path('euvi_304.fts'))
+    _write(archive, 'euvi_304.fts', 'STEREO', 304, '2012-07-19T12:00:00')
+    os.remove(path('aia_193.fits'))
+    assert reloaded.update() == 1
+    assert len(reloaded) == 5
+    assert reloaded['euvi_304.fts']['date_obs'] == '2012-07-19T12:00:00'
+    assert reloaded.pairs(wavelength=193) == []
+
+
+def test_nearest_in_time(archive):
+    """Closest observation of another telescope in the same channel, within a tolerance"""
+    index = FitsHeaderIndex(archive)
+    path = lambda name: os.path.join(archive, name)
+
+    assert index.nearest(path('euvi_171.fts')) == path('aia_171_a.fits')
+    assert index.nearest(path('aia_171_b.fits'), tolerance=30 * u.min) == path('euvi_171.fts')
+    assert index.nearest(path('aia_171_b.fits'), tolerance=600) is None
+    assert index.nearest(path('euvi_304.fts')) is None
+
+    # Files without DATE-OBS are paired by channel but never matched in time
+    _write(archive, 'aia_335.fits', 'SDO/AIA', 335, '2012-07-19T10:00:00')
+    _write(archive, 'euvi_335.fts', 'STEREO', 335, '')
+    index.update()
+    assert index['euvi_335.fts']['mjd'] is None
+    assert index.pairs(wavelength=335) == [(path('aia_335.fits'), path('euvi_335.fts'))]
+    assert index.nearest(path('aia_335.fits')) is None
+    assert index.time_pairs('SDO/AIA', 'STEREO', wavelength=335) == []
+    assert index.time_pairs('SDO/AIA', 'STEREO', tolerance=61 * u.min) == [
+        (path('aia_171_a.fits'), path('euvi_171.fts')), (path('aia_171_b.fits'), path('euvi_171.fts')),
+        (path('aia_193.fits'), path('euvi_195.fts'))]
+
+
+def test_unwritable_index(archive, tmp_path):
+    """An index that cannot be saved is kept in memory"""
+    index_path = str(tmp_path / 'missing' / INDEX_NAME)
+    index = FitsHeaderIndex(archive, index_path=index_path)
+    assert len(index) == 6 and not index.save()
+    assert not os.path.exists(os.path.dirname(index_path))
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from matplotlib.image import imread
+import sunpy.map
+from sunpy.coordinates import frames, get_earth
+from sunpy.map import make_fitswcs_header
+
+from rushlight.utils.box import Box
+from rushlight.utils.frame_renderer import FrameRenderer, render_frames, map_panel, OVERLAY_STYLES
+
+
+def _map(k):
+    reference = SkyCoord(0 * u.arcsec, 0 * u.arcsec, obstime='2011-03-07T18:06:00', observer='earth',
+                         frame=frames.Helioprojective)
+    data = np.outer(np.arange(32), np.ones(48)) + k
+    return sunpy.map.Map(data, make_fitswcs_header(data, reference, scale=[2, 2] * u.arcsec / u.pix))
+
+
+def _frame(k):
+    smap = _map(k)
+    edges = SkyCoord([[-20, 20], [-20, -20]] * u.arcsec, [[-10, -10], [-10, 10]] * u.arcsec,
+                     frame=smap.coordinate_frame)
+    return {'title': f"frame {k}",
+            'panels': [{'map': smap, 'title': 'synthetic', 'overlays': {'box': edges}},
+                       {'map': smap.data[::2, ::2], 'clim': (0, 40), 'overlays': {'los': ([0, 10], [0, 10])}}]}
+
+
+def test_renderer_reuses_figure():
+    """Frames update the artists of one figure"""
+
+    renderer = FrameRenderer(panels=[{}, {'cmap': 'gray'}], overlays={'box': {'color': 'b'}, 'los': {'color': 'r'}})
+    figure = renderer.draw(_frame(0))
+    image = renderer._artists[0]['image']
+    assert renderer.draw(_frame(5)) is figure and renderer._artists[0]['image'] is image
+    assert image.get_clim() == (5., 36.) and renderer._artists[1]['image'].get_clim() == (0., 40.)
+
+    # Two edges joined into one line broken by NaNs
+    x, y = renderer._artists[0]['lines']['box'].get_data()
+    assert len(x) == 6 and np.isnan(x[2]) and np.allclose(x[[0, 1]], [13.5, 33.5])
+    assert len(renderer._artists[0]['lines']['los'].get_data()[0]) == 0
+    assert renderer._artists[1]['ax'].get_xlim() == (-0.5, 23.5)
+
+
+def test_render_frames(tmp_path):
+    """Frames rendered in worker processes are identical to serially rendered frames"""
+
+    renderer = FrameRenderer(overlays={'box': {'color': 'b'}, 'los': {'color': 'r'}}, dpi=40)
+    paths = render_frames(renderer, list(range(4)), str(tmp_path / 'parallel'), prepare=_frame, workers=2)
+    serial = render_frames(renderer, list(range(4)), str(tmp_path / 'serial'), prepare=_frame)
+    assert [os.path.basename(p) for p in paths] == [f"frame_0000{k}.png" for k in range(4)]
+    for parallel_path, serial_path in zip(paths, serial):
+        assert np.array_equal(imread(parallel_path), imread(serial_path))
+    assert not np.array_equal(imread(paths[0]), imread(paths[3]))
+
+    mtime = os.path.getmtime(paths[0])
+    render_frames(renderer, list(range(4)), str(tmp_path / 'parallel'), prepare=_frame, overwrite=False)
+    assert os.path.getmtime(paths[0]) == mtime
+
+
+def test_map_panel():
+    """Box edges, line of sight and contours of the static plots become overlays of a frame"""
+
+    smap = _map(0)
+    time = smap.reference_coordinate.obstime
+    observer = get_earth(time)
+    origin = SkyCoord(lon=0 * u.deg, lat=0 * u.deg, radius=1 * u.R_sun, frame='heliographic_stonyhurst',
+                      observer=observer, obstime=time)
+    origin_hcc = origin.transform_to(frames.Heliocentric(observer=origin, obstime=time))
+    center = SkyCoord(x=origin_hcc.x, y=origin_hcc.y, z=origin_hcc.z + 10 * u.Mm, frame=origin_hcc.frame)
+    box = Box(frame_obs=frames.Helioprojective(observer=observer, obstime=time), box_origin=origin,
+              box_center=center, box_dims=u.Quantity([40, 30, 20], u.Mm), box_res=1.4 * u.Mm)
+    los = SkyCoord([-20, 20] * u.arcsec, [0, 0] * u.arcsec, frame=smap.coordinate_frame)
+    contours = [SkyCoord([0, 4, 4] * u.arcsec, [0, 0, 4] * u.arcsec, frame=smap.coordinate_frame),
+                SkyCoord([8, 10] * u.arcsec, [8, 8] * u.arcsec, frame=smap.coordinate_frame)]
+
+    panel = map_panel(smap, box=box, los=los, contours=contours, title='synthetic')
+    assert panel['title'] == 'synthetic' and set(panel['overlays']) == set(OVERLAY_STYLES)
+
+    renderer = FrameRenderer(panels=1, overlays=OVERLAY_STYLES)
+    renderer.draw([panel])
+    lines = renderer._artists[0]['lines']
+    assert len(lines['box_bottom'].get_data()[0]) == 4 * 3 and len(lines['box'].get_data()[0]) == 8 * 3
+    x, y = lines['ribbon'].get_data()
+    assert len(x) == 3 + 1 + 2 + 1 and np.isnan(x[3]) and np.allclose(x[:3], [23.5, 25.5, 25.5])
+    assert np.allclose(lines['los'].get_data()[1], 15.5)
@@ -0,0 +1,81 @@
+import numpy as np
+from numpy.testing import assert_allclose
+import pytest
+
+import astropy.units as u
+
+from rushlight.utils.instrument import InstrumentModel, EnsembleStats
+
+
+def test_psf_conserves_flux():
+    """PSF convolution spreads a point source symmetrically and keeps its flux"""
+    model = InstrumentModel('aia', channel=171 * u.angstrom, scale=0.6)
+    size = 2 * model.psf.shape[0] + 1
+    image = np.zeros((size, size), dtype=np.float32)
+    image[size // 2, size // 2] = 1000.
+
+    blurred = model.convolve(image)
+    assert blurred is image
+    assert_allclose(blurred.sum(), 1000., rtol=1e-4)
+    assert blurred[size // 2, size // 2] < 1000.
+    assert_allclose(blurred, blurred[::-1, ::-1], atol=1e-3)
+    assert len(model._kernel_ffts) == 1
+
+
+def test_noise_statistics():
+    """Photon and read noise follow the expected mean and variance, reproducibly"""
+    model = InstrumentModel('xrt', exposure=2. * u.s)
+    rates = np.full((3, 128, 128), 50., dtype=np.float32)
+
+    first = model.apply(rates.copy(), seed=1, psf=False)
+    second = model.apply(rates.copy(), seed=1, psf=False)
+    assert first.dtype == np.float32
+    assert np.array_equal(first, second)
+
+    assert_allclose(first.mean(), 100., rtol=0.01)
+    expected_var = model.dn_per_photon * 100. + model.read_noise**2
+    assert_allclose(first.var(), expected_var, rtol=0.05)
+
+
+def test_unknown_instrument():
+    with pytest.raises(ValueError):
+        InstrumentModel('eit')
+
+
+def test_noise_ensemble_streaming():
+    """Ensemble members do not depend on batching, and streamed statistics match the full ensemble"""
+    model = InstrumentModel('aia', channel=171 * u.angstrom, exposure=1.)
+    rng = np.random.default_rng(0)
+    image = rng.uniform(5., 500., (24, 32)).astype(np.float32)
+
+    members = model.realizations(image, 200, seed=7)
+    assert members.shape == (200, 24, 32) and members.dtype == np.float32
+    batched = np.concatenate(list(model.ensemble(image, 200, seed=7, batch=33)))
+    assert np.array_equal(members, batched)
+
+    stats = model.ensemble_stats(image, 200, seed=7, batch=33, percentiles=(16, 50, 84))
+    assert stats.count == 200
+    assert_allclose(stats.mean, members.mean(axis=0), rtol=1e-5)
+    assert_allclose(stats.std, members.std(axis=0), rtol=1e-4)
+
+    summary = stats.summary()
+    bin_width = (stats.high - stats.low) / stats.bins
+    for q in (16, 50, 84):
+        assert np.all(np.abs(summary[f"p{q}"] - np.percentile(members, q, axis=0)) < 2 * bin_width)
+
+
+def test_ensemble_stats_memory(monkeypatch):
+    """Counters use the smallest unsigned type and are widened before overflowing; percentiles are chunked"""
+    rng = np.random.default_rng(1)
+    members = rng.normal(10., 1., (300, 6, 5))
+
+    stats = EnsembleStats((6, 5), bins=16, low=4., high=16.)
+    stats.update(members[:200])
+    assert stats._hist.dtype == np.uint8 and stats._hist.nbytes == 6 * 5 * 16
+    stats.update(members[200:])
+    assert stats._hist.dtype == np.uint16
+    assert np.all(stats._hist.sum(axis=1) == 300)
+
+    monkeypatch.setattr(EnsembleStats, 'CHUNK', 7)
+    bin_width = 12. / 16
+    assert np.all(np.abs(stats.percentile(50) - np.percentile(members, 50, axis=0)) < bin_width)
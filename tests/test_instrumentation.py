@@ -0,0 +1,76 @@
+import io
+import json
+import time
+
+import numpy as np
+import pytest
+
+from rushlight.utils import dcube
+from rushlight.utils.instrumentation import StageTimer, NULL_TIMER, as_timer, ENV_VARIABLE
+
+
+def test_stage_timer():
+    """Nested stages are recorded with their parent, CPU time, peak memory, log lines and hooks"""
+
+    log = io.StringIO()
+    entered = []
+
+    class Hook:
+        def __init__(self, stage):
+            self.stage = stage
+
+        def __enter__(self):
+            entered.append(self.stage)
+
+        def __exit__(self, *args):
+            pass
+
+    timer = StageTimer(memory=True, log=log, hooks=[lambda stage: Hook(stage) if stage == 'inner' else None])
+    with timer.stage('outer'):
+        with timer.stage('inner'):
+            block = np.ones(1_000_000)
+            del block
+        time.sleep(0.01)
+    timer.close()
+
+    inner, outer = timer.records
+    assert (inner['stage'], inner['parent'], outer['parent']) == ('inner', 'outer', None)
+    assert outer['wall'] >= inner['wall'] + 0.01 > 0.01
+    assert inner['cpu'] >= 0.
+    assert outer['peak_memory'] >= inner['peak_memory'] >= 8_000_000
+    assert [json.loads(line) for line in log.getvalue().splitlines()] == timer.records
+    assert entered == ['inner']
+    assert timer.summary()['inner']['calls'] == 1
+
+
+def test_disabled_timer(monkeypatch):
+    """Disabled timers record nothing, and the environment variable enables timers"""
+
+    with NULL_TIMER.stage('stage'):
+        pass
+    assert NULL_TIMER.records == []
+
+    monkeypatch.delenv(ENV_VARIABLE, raising=False)
+    assert as_timer() is NULL_TIMER and as_timer(True).enabled
+    monkeypatch.setenv(ENV_VARIABLE, '1')
+    assert as_timer().enabled and as_timer(False) is NULL_TIMER
+
+
+def test_synthetic_image_timings(tmp_path):
+    """The stages of a synthetic image are recorded in its `timings`"""
+
+    import astropy.units as u
+    import yt
+    from rushlight.utils.proj_imag_classified import SyntheticFilterImage
+
+    path = str(tmp_path / "cube.h5")
+    dcube.Dcube(output_file=path)
+    synth = SyntheticFilterImage(dataset=yt.load(path), instr='aia', channel=171 * u.angstrom,
+                                 normvector=[0., 0., 1.], northvector=[0., 1., 0.], timer=True)
+    synth.synth_map
+    synth.synth_map
+
+    stages = [record['stage'] for record in synth.timings]
+    assert stages == ['reference_image', 'dataset', 'emission_field', 'projection', 'proj_and_imag',
+                      'synthetic_result', 'synthetic_map']
+    assert {record['parent'] for record in synth.timings if record['stage'] == 'projection'} == {'proj_and_imag'}
@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from rushlight.utils.lazy import lazy_import
+
+# Modules deferred by `import rushlight.utils.proj_imag_classified`
+HEAVY_MODULES = ['yt', 'unyt', 'sunpy.map', 'sunpy.coordinates', 'matplotlib', 'skimage', 'astropy.coordinates']
+
+# Import time budget in seconds (about 1 s with deferred imports, 5 s with eager ones), only checked
+# as a benchmark when the RUSHLIGHT_BENCHMARKS environment variable is set: timings vary with the machine
+IMPORT_BUDGET = 3.
+BENCHMARKS = bool(os.environ.get('RUSHLIGHT_BENCHMARKS'))
+
+
+def test_lazy_module():
+    """Modules are imported on first access, submodules included, and set up once"""
+
+    calls = []
+    json_module = lazy_import('json', setup=calls.append)
+    assert calls == [] and 'not' not in repr(json_module)
+    assert json_module.dumps([1]) == '[1]' and json_module.loads('2') == 2
+    assert calls == [json] and 'imported' in repr(json_module)
+
+    xml = lazy_import('xml')
+    assert xml.dom.Node.ELEMENT_NODE == 1
+    with pytest.raises(AttributeError):
+        xml.no_such_module
+
+
+def _import_synthetic_images():
+    """Time and heavy modules loaded by importing the synthetic image classes in a new interpreter"""
+
+    script = ("import json, sys, time\n"
+              "start = time.perf_counter()\n"
+              "import rushlight.utils.proj_imag_classified\n"
+              "elapsed = time.perf_counter() - start\n"
+              f"print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))\n")
+    return json.loads(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                     check=True).stdout.splitlines()[-1])
+
+
+def test_deferred_imports():
+    """Importing the synthetic image classes does not import the heavy dependencies"""
+    assert _import_synthetic_images()[1] == []
+
+
+@pytest.mark.skipif(not BENCHMARKS, reason="set RUSHLIGHT_BENCHMARKS to run the timing benchmarks")
+def test_import_time():
+    """Importing the synthetic image classes stays within the import time budget"""
+    elapsed = min(_import_synthetic_images()[0] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET, f"import took {elapsed:.2f} s"
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+import numpy as np
+from numpy.testing import assert_allclose
+import pytest
+
+import astropy.units as u
+from astropy.coordinates import CartesianRepresentation
+
+from rushlight.utils import synth_tools as st
+from rushlight.utils.loop_geometry import loop_points, loop_frames, R_SUN
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+from rushlight.utils.synth_catalog import SynthCatalog
+
+
+def test_circular_loop():
+    """A vertical loop at disk center rises radius + height above the surface"""
+    points = loop_points(radius=10 * u.Mm, height=2 * u.Mm, samples_num=101)
+    assert points.shape == (101, 3)
+
+    v1, v2, v3 = loop_frames(points)
+    assert_allclose([v1[0], v2[0]], [R_SUN, R_SUN])
+    assert_allclose(np.linalg.norm(v1 - v2), 2 * np.sqrt(10 ** 2 - 2 ** 2))
+    assert_allclose(v3, [R_SUN + 12., 0., 0.], atol=1e-9)
+    assert_allclose(np.linalg.norm(points - [R_SUN + 2., 0., 0.], axis=-1), 10.)
+
+
+def test_elliptical_loop():
+    """Semi-axes of elliptical loops lie along the footpoint baseline and towards the apex"""
+    points = loop_points(majax=20., minax=5., az=0., samples_num=101)
+    v1, v2, v3 = loop_frames(points)
+    assert_allclose(np.linalg.norm(v1 - v2), 40.)
+    assert_allclose(v3, [R_SUN + 5., 0., 0.], atol=1e-9)
+
+    with pytest.raises(ValueError):
+        loop_points(radius=5., height=-6.)
+
+
+def test_loop_batch():
+    """Parameter arrays broadcast to one loop each, matching loops generated one at a time"""
+    rng = np.random.default_rng(0)
+    params = dict(radius=rng.uniform(5., 30., (4, 50)) * u.Mm, height=rng.uniform(-3., 3., 50) * u.Mm,
+                  phi0=rng.uniform(-60., 60., 50) * u.deg, theta0=rng.uniform(-40., 40., 50) * u.deg,
+                  el=rng.uniform(60., 120., 50) * u.deg, az=rng.uniform(0., 360., 50) * u.deg)
+    points = loop_points(samples_num=64, **params)
+    assert points.shape == (4, 50, 64, 3)
+
+    i, j = (2, 17)
+    single = loop_points(samples_num=64, **{key: value[i, j] if value.ndim == 2 else value[j]
+                                            for key, value in params.items()})
+    assert_allclose(points[i, j], single)
+
+
+def test_calc_vect_batch():
+    """Batched view vectors agree with calc_vect applied to each loop"""
+    ref_img = st.get_reference_image(None, None, instr='aia', channel=171 * u.angstrom)
+    loops = loop_points(radius=[8., 15., 25.], phi0=[0., 20., -35.], theta0=[10., -5., 30.], az=[0., 45., 120.])
+    normvectors, northvectors, ifpd = st.calc_vect_batch(ref_img, loops)
+    assert normvectors.shape == northvectors.shape == (3, 3)
+
+    for k in range(3):
+        loop_coords = st.get_loop_coords({'radius': [8., 15., 25.][k] * u.Mm, 'phi0': [0., 20., -35.][k] * u.deg,
+                                          'theta0': [10., -5., 30.][k] * u.deg, 'az': [0., 45., 120.][k] * u.deg})
+        assert isinstance(loop_coords, CartesianRepresentation)
+        normvector, northvector, distance = st.calc_vect(ref_img, loop_coords=loop_coords)
+        assert_allclose(normvectors[k], normvector)
+        assert_allclose(northvectors[k], northvector)
+        assert_allclose(ifpd[k], distance)
+
+
+def test_loop_params_view(dummy_ds):
+    """Loop parameters define the view through the built-in loop geometry"""
+    loop = {'radius': 10 * u.Mm, 'majax': 0 * u.Mm, 'minax': 0 * u.Mm, 'height': 2 * u.Mm, 'phi0': 10 * u.deg,
+            'theta0': 5 * u.deg, 'el': 80 * u.deg, 'az': 20 * u.deg, 'samples_num': 100}
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom, pkl=loop)
+    assert synth.loop_coords.shape == (100,)
+    assert_allclose(synth.ifpd, 2 * np.sqrt(10 ** 2 - (2 / np.sin(np.radians(80))) ** 2))
+    assert_allclose(np.linalg.norm(synth.normvector), 1.)
+    assert synth.image.shape[0] == synth.plot_settings['resolution']
+
+    path = os.path.join(tempfile.mkdtemp(), 'events.db')
+    record, target = synth.append_synthobj(path)
+    assert target == path
+    with SynthCatalog(path) as catalog:
+        key, = record
+        assert catalog.keys() == [key]
+        assert_allclose(catalog[key]['norm_vector'], synth.normvector)
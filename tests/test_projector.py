@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+
+import yt
+import astropy.units as u
+
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+from tests.conftest import make_projector
+
+
+@pytest.mark.parametrize("normal", [[0., 0., 1.], [0.3, 0.2, 1.], [1., 0.5, 0.2]])
+def test_projector_matches_yt(dummy_ds, normal):
+    """The ray-marching projector reproduces the yt off-axis projection geometry and normalization"""
+    field = ("gas", "aia_filter_band")
+    expected = np.array(yt.off_axis_projection(dummy_ds, dummy_ds.domain_center.value, normal_vector=normal,
+                                               width=dummy_ds.domain_width[0].value, resolution=64,
+                                               item=field, north_vector=[0., 1., 0.]))
+
+    projector = make_projector(dummy_ds, normal)
+    image = projector.integrate(projector.sample_cube([field]))[0]
+
+    assert image.shape == expected.shape
+    assert_allclose(image.sum(), expected.sum(), rtol=0.03)
+    assert np.corrcoef(image.ravel(), expected.ravel())[0, 1] > 0.97
+
+
+def test_projection_options(dummy_ds):
+    """Diagnostics keep the yt intensity unless the projector is requested, conflicting options raise"""
+    kwargs = dict(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                  normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.])
+    plain = sfi(**kwargs)
+    with_maps = sfi(diagnostics=['emission_measure'], **kwargs)
+    assert np.array_equal(with_maps.image, plain.image)
+    assert 'emission_measure' in with_maps.diagnostic_images
+
+    grid = sfi(diagnostics=['emission_measure'], projector='grid', **kwargs)
+    projector = grid._projector()
+    assert_allclose(grid.image, projector.integrate(projector.sample_cube([("gas", grid.imag_field)]))[0].T)
+    assert_allclose(grid.diagnostic_images['emission_measure'], with_maps.diagnostic_images['emission_measure'])
+
+    for options, message in [({'depth': 0.5}, "requires projector='grid'"),
+                             ({'prjw': 'tight'}, "requires projector='grid'"),
+                             ({'slab': (0., 0.5), 'tile_size': 16, 'projector': 'grid'}, 'different projections'),
+                             ({'sparse': 0.1, 'skip_empty': 0.1, 'projector': 'grid'}, 'different projections'),
+                             ({'absorption': True, 'sparse': 0.1, 'projector': 'grid'}, 'different projections'),
+                             ({'projector': 'gpu'}, 'Unknown projector')]:
+        with pytest.raises(ValueError, match=message):
+            plain.proj_and_imag(**options)
+    assert plain.projection_method(skip_empty=0.1, prjw='tight', projector='grid') == 'skip_empty'
+    assert plain.projection_method(absorption=True) == 'absorption'
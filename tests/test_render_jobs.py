@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+from rushlight.cli import main
+from rushlight.utils import dcube
+from rushlight.utils.render_jobs import load_job_file, expand_jobs, task_graph, MANIFEST_NAME
+
+JOB = """
+output = "renders"
+workers = 2
+
+[defaults]
+instr = "aia"
+
+[[jobs]]
+name = "dummy"
+datasets = ["data/*.h5"]
+channels = [171, 193]
+views = [{normvector = [0.0, 0.0, 1.0], northvector = [0.0, 1.0, 0.0]},
+         {normvector = [0.3, 0.2, 1.0], northvector = [0.0, 1.0, 0.0]}]
+"""
+
+
+@pytest.fixture(scope="module")
+def job_file(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("job")
+    os.makedirs(directory / "data")
+    dcube.Dcube(output_file=str(directory / "data" / "cube.h5"))
+    path = directory / "job.toml"
+    path.write_text(JOB)
+    return str(path)
+
+
+def _make_runs(directory):
+    """Two runs with the same snapshot names, and one reference map"""
+    for run in ('run1', 'run2'):
+        os.makedirs(directory / run)
+        (directory / run / "snap.h5").write_text('')
+    (directory / "aia.lev1_euv_12s.2014-01-01T000001Z.171.image_lev1.fits").write_text('')
+
+
+def test_expand_jobs(job_file, tmp_path):
+    """Jobs expand into the product of their inputs, grouped by dataset"""
+
+    spec = load_job_file(job_file)
+    tasks = expand_jobs(spec, 'out', base_dir=os.path.dirname(job_file))
+    assert len(tasks) == 4 and len({task.output for task in tasks}) == 4
+    assert os.path.dirname(tasks[0].output) == os.path.join('out', 'dummy')
+    assert os.path.basename(tasks[0].output).startswith('cube_default_aia171_view_')
+    assert tasks[0].kwargs()['normvector'] == [0., 0., 1.]
+    assert [len(group) for group in task_graph(tasks, workers=2)] == [2, 2]
+    assert [len(group) for group in task_graph(tasks, workers=1)] == [4]
+
+    # Outputs depend on the view settings and full paths, not on the order or the file names
+    spec['jobs'][0]['views'].reverse()
+    reordered = expand_jobs(spec, 'out', base_dir=os.path.dirname(job_file))
+    assert {task.output: task.settings['normvector'] for task in reordered} == \
+        {task.output: task.settings['normvector'] for task in tasks}
+    spec['jobs'].append({**spec['jobs'][0], 'name': 'dummy', 'datasets': ['./data/*.h5']})
+    with pytest.raises(ValueError, match='both render'):
+        expand_jobs(spec, 'out', base_dir=os.path.dirname(job_file))
+
+    _make_runs(tmp_path)
+    names = [os.path.basename(task.output) for task in expand_jobs(
+        {'jobs': [{'datasets': ['run*/snap.h5'],
+                   'references': ['aia.lev1_euv_12s.2014-01-01T000001Z.171.image_lev1.fits']}]}, 'out',
+        base_dir=str(tmp_path))]
+    assert len(set(names)) == 2
+    assert all(name.startswith('snap_aia.lev1_euv_12s.2014-01-01T000001Z.171.image_lev1_aia171_view_')
+               for name in names)
+
+    yaml_path = tmp_path / "job.yaml"
+    yaml_path.write_text("jobs:\n  - datasets: [data/*.h5]\n    instr: xrt\n    poisson: true\n")
+    spec = load_job_file(str(yaml_path))
+    task, = expand_jobs(spec, 'out', base_dir=os.path.dirname(job_file))
+    assert task.channel == 'Ti-poly' and task.kwargs()['poisson'] is True
+
+
+def test_render_command(job_file, capsys):
+    """The render command writes the maps and a manifest, and resumes by skipping existing maps"""
+
+    output = os.path.join(os.path.dirname(job_file), "renders")
+    assert main(['render', job_file]) == 0
+    with open(os.path.join(output, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    assert [record['status'] for record in manifest['tasks']] == ['rendered'] * 4
+    assert all(os.path.exists(record['output']) for record in manifest['tasks'])
+
+    os.remove(manifest['tasks'][1]['output'])
+    assert main(['render', job_file, '--dry-run']) == 0
+    assert capsys.readouterr().out.count('pending') == 1
+
+    assert main(['render', job_file, '-j', '1']) == 0
+    with open(os.path.join(output, MANIFEST_NAME)) as f:
+        statuses = [record['status'] for record in json.load(f)['tasks']]
+    assert statuses == ['skipped', 'rendered', 'skipped', 'skipped']
+    assert capsys.readouterr().out.strip().endswith('1 rendered, 3 skipped')
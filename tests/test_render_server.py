@@ -0,0 +1,101 @@
+import pickle
+import threading
+import time
+
+import astropy.units as u
+import numpy as np
+import pytest
+
+from rushlight.utils import dcube
+from rushlight.utils.render_server import RenderServer, RenderClient
+
+VIEW = {'normvector': [0.3, 0.2, 1.0], 'northvector': [0.0, 1.0, 0.0]}
+LOOP = {'radius': 10 * u.Mm, 'majax': 0 * u.Mm, 'minax': 0 * u.Mm, 'height': 2 * u.Mm, 'phi0': 10 * u.deg,
+        'theta0': 5 * u.deg, 'el': 80 * u.deg, 'az': 20 * u.deg, 'samples_num': 100}
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("server") / "cube.h5")
+    dcube.Dcube(output_file=path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def server():
+    with RenderServer(port=0) as server:
+        yield server
+
+
+def test_render(server, dataset, tmp_path):
+    """Views are rendered like `proj_and_imag` of a notebook, the cached emission cube on request"""
+
+    import yt
+    from rushlight.utils.proj_imag_classified import SyntheticFilterImage
+
+    client = RenderClient(server.url)
+    loop = str(tmp_path / "loop.pkl")
+    first = client.render(dataset, **VIEW)
+    second = client.render(dataset, normvector=[0.0, 0.0, 1.0], northvector=[0.0, 1.0, 0.0])
+    assert first['data'].shape == second['data'].shape
+    assert not np.allclose(first['data'], second['data'])
+    assert int(first['header']['wavelnth']) == 171
+    assert set(first['timings']) == {'queued', 'render', 'total'} and not first['coalesced']
+
+    synth = SyntheticFilterImage(dataset=yt.load(dataset), instr='aia', channel=171 * u.angstrom, **VIEW)
+    np.testing.assert_array_equal(first['data'], synth.image)
+    synth.proj_and_imag(projector='grid')
+    np.testing.assert_allclose(client.render(dataset, projector='grid', **VIEW)['data'], synth.image, rtol=1e-6)
+
+    # Requests without a view get the initial view of the scene, whatever the views requested before
+    with open(loop, 'wb') as f:
+        pickle.dump(LOOP, f)
+    setup = {'pkl': loop}
+    default = client.render(dataset, setup=setup)['data']
+    client.render(dataset, setup=setup, **VIEW)
+    np.testing.assert_array_equal(client.render(dataset, setup=setup)['data'], default)
+    initial = SyntheticFilterImage(dataset=yt.load(dataset), instr='aia', channel=171 * u.angstrom, pkl=LOOP)
+    np.testing.assert_array_equal(default, initial.image)
+    with pytest.raises(RuntimeError, match='no initial view'):
+        client.render(dataset)
+
+    status = client.status()
+    assert len(status['scenes']) == 2 and status['renders'] >= 5
+    assert set(status['latency']) == {'p50', 'p90', 'p99'}
+    assert client.map(dataset, **VIEW).data.shape == first['data'].shape
+
+
+def test_coalescing(server, dataset):
+    """Identical requests waiting together are rendered once"""
+
+    request = {'dataset': dataset, 'options': {}, **VIEW}
+    renders = server.stats['renders']
+    render, gate = (server.render, threading.Event())
+    server.render = lambda **kwargs: (gate.wait(), render(**kwargs))[1]  # hold the worker
+    responses = []
+    try:
+        threads = [threading.Thread(target=lambda: responses.append(server.submit(request))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while not server._pending or next(iter(server._pending.values())).waiters < 3:
+            time.sleep(0.01)
+        gate.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        gate.set()
+        del server.render
+
+    assert server.stats['renders'] == renders + 1
+    assert sorted(response['coalesced'] for response in responses) == [False, True, True]
+    assert all(response['data'] is responses[0]['data'] for response in responses)
+
+
+def test_errors(server):
+    """Failed renders and malformed requests are reported to the client"""
+
+    client = RenderClient(server.url)
+    with pytest.raises(RuntimeError, match='FileNotFoundError|No such file'):
+        client.render('missing.h5')
+    with pytest.raises(RuntimeError, match="need a 'dataset'"):
+        client._call('/render', {'channel': 171})
@@ -0,0 +1,44 @@
+import multiprocessing
+
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+
+from rushlight.utils.shared_fields import SharedFields, DEFAULT_FIELDS
+from tests.conftest import make_projector
+
+
+def _project_shared(args):
+    handle, normal = args
+    fields = SharedFields.attach(handle)
+    projector = make_projector(fields.dataset(), normal)
+    image = projector.integrate(fields.cube("aia_filter_band"))[0]
+    fields.close()
+    return image
+
+
+@pytest.mark.parametrize("backing", ["shm", "memmap"])
+def test_shared_fields(dummy_ds, backing):
+    """Workers attached to published fields reproduce the projection of the original dataset"""
+    field = ("gas", "aia_filter_band")
+    with SharedFields.publish(dummy_ds, DEFAULT_FIELDS + [field], backing=backing, slab=5) as shared:
+        attached = SharedFields.attach(shared.handle)
+        assert_allclose(attached["temperature"], dummy_ds.r[:, :, :]["gas", "temperature"].d.reshape(attached["temperature"].shape))
+        # The yt dataset wraps the shared arrays without copying them
+        stream = attached.dataset().stream_handler.fields[0][("stream", "temperature")]
+        assert np.shares_memory(stream, attached["temperature"])
+        # Cubes view the shared buffers field by field
+        cube = attached.cube("temperature", "density")
+        assert cube.shape == (attached["temperature"].size, 2)
+        assert np.shares_memory(cube.arrays[1], attached["density"])
+        assert_allclose(cube[[0, 5]], np.stack([attached["temperature"].ravel()[[0, 5]],
+                                                attached["density"].ravel()[[0, 5]]], axis=-1))
+        attached.close()
+
+        normals = [[0., 0., 1.], [0.3, 0.2, 1.]]
+        with multiprocessing.get_context("fork").Pool(2) as pool:
+            images = pool.map(_project_shared, [(shared.handle, normal) for normal in normals])
+
+    for normal, image in zip(normals, images):
+        projector = make_projector(dummy_ds, normal)
+        assert_allclose(image, projector.integrate(projector.sample_cube([field]))[0])
@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+
+import astropy.units as u
+
+from rushlight.utils.projector import SlabSums
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+from tests.conftest import make_projector
+
+
+def test_slab_sums(dummy_ds):
+    """Slabs from cached partial integrals add up to the full projection and match depth-limited renders"""
+    field = ("gas", "aia_filter_band")
+    projector = make_projector(dummy_ds, [0.3, 0.2, 1.])
+    cube = projector.sample_cube([field])
+    full = projector.integrate(cube)
+    sums = projector.cumulative(cube, stride=2)
+
+    front, back = sums.slab(-0.5, 0.5), sums.slab(0., 0.5)
+    assert_allclose(front + back, full)
+
+    # Without a stride, the stored depths are bounded whatever the number of depth steps
+    coarse = projector.cumulative(cube, max_edges=4)
+    assert len(coarse.t_edges) <= 5 < len(projector.t)
+    assert_allclose(coarse.slab(-0.5, 1.), full)
+    assert sums.scan([-0.25, 0.25], 0.5).shape == (2,) + full.shape
+
+    limited = make_projector(dummy_ds, [0.3, 0.2, 1.], depth=0.5)
+    assert_allclose(sums.slab(-0.25, 0.5).sum(), limited.integrate(cube).sum(), rtol=0.05)
+
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.], slab=(-0.25, 0.5), projector='grid')
+    limited = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                  normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.], depth=0.5, projector='grid')
+    assert_allclose(synth.image.sum(), limited.image.sum(), rtol=0.05)
+    assert limited.image.sum() < 0.9 * sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                                           normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.]).image.sum()
+    assert len(synth.slab_sums) == 1
+    synth.slab_image(0., 0.25)
+    assert len(synth.slab_sums) == 1
+    front, back = synth.slab_bounds
+    assert front == pytest.approx(0., abs=0.05) and back - front == pytest.approx(0.25, abs=0.05)
+
+    # Only the most recently used views are kept
+    for normal in ([0., 0., 1.], [0.2, 0.3, 1.], [1., 0., 0.2]):
+        synth.update_los(norm=normal, north=[0., 1., 0.])
+        synth.slab_image(0., 0.25)
+    assert len(synth.slab_sums) == synth.SLAB_CACHE_SIZE
+
+    # Nearest stored depths, including the shorter last interval
+    uneven = SlabSums(np.arange(4.)[:, None, None, None], np.array([0., 1., 2., 2.4]))
+    assert [uneven._edge(t) for t in (-1., 0.6, 2.1, 2.3, 5.)] == [0, 1, 2, 3, 3]
@@ -0,0 +1,63 @@
+import pickle
+import multiprocessing
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from rushlight.utils.synth_catalog import SynthCatalog
+
+
+def _event(telescope, date_obs, value=0.):
+    """Record in the format of `SyntheticImage.save_synthobj`"""
+    key = f'{telescope}|{date_obs}'
+    return {key: {'header': {'TELESCOP': telescope, 'DATE-OBS': date_obs},
+                  'loop_params': {'radius': value}, 'norm_vector': np.array([0., 0., 1.]) * value,
+                  'north_vector': np.array([0., 1., 0.])}}
+
+
+def _append_events(args):
+    path, telescope, days = args
+    with SynthCatalog(path) as catalog:
+        for day in days:
+            catalog.add(_event(telescope, f'2012-07-{day:02d}T12:00:00.000', day))
+
+
+def test_catalog_queries(tmp_path):
+    """Records are replaced by key and queried by telescope and time range"""
+    path = str(tmp_path / 'events.db')
+    with SynthCatalog(path) as catalog:
+        catalog.add(_event('SDO/AIA', '2012-07-19T10:00:00.000', 1.))
+        catalog.add(_event('SDO/AIA', '2012-07-19T10:00:00.000', 2.))
+        catalog.add(_event('Hinode', '2012-07-20T10:00:00.000', 3.))
+        catalog.add(_event('SDO/AIA', '2012-07-21T10:00:00.000', 4.))
+
+    with SynthCatalog(path) as catalog:
+        assert len(catalog) == 3
+        assert 'Hinode|2012-07-20T10:00:00.000' in catalog
+        assert catalog['SDO/AIA|2012-07-19T10:00:00.000']['loop_params']['radius'] == 2.
+        assert catalog.keys(telescope='SDO/AIA') == ['SDO/AIA|2012-07-19T10:00:00.000',
+                                                     'SDO/AIA|2012-07-21T10:00:00.000']
+        events = catalog.query(start='2012-07-20', end='2012-07-22')
+        assert list(events) == ['Hinode|2012-07-20T10:00:00.000', 'SDO/AIA|2012-07-21T10:00:00.000']
+        assert_allclose(events['SDO/AIA|2012-07-21T10:00:00.000']['norm_vector'], [0., 0., 4.])
+
+
+def test_catalog_concurrent_appends_and_import(tmp_path):
+    """Concurrent writers do not lose records, and pickled catalogs are imported"""
+    path = str(tmp_path / 'events.db')
+    SynthCatalog(path).close()
+    jobs = [(path, telescope, range(1, 11)) for telescope in ('SDO/AIA', 'Hinode', 'STEREO A')]
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        pool.map(_append_events, jobs)
+
+    legacy = {**_event('SDO/AIA', '2011-01-01T00:00:00.000'), **_event('SDO/AIA', '2012-07-01T12:00:00.000', 5.)}
+    pkl_path = tmp_path / 'loops.pkl'
+    with open(pkl_path, 'wb') as f:
+        pickle.dump(legacy, f)
+
+    with SynthCatalog(path) as catalog:
+        assert len(catalog) == 30
+        assert catalog.import_pickle(str(pkl_path)) == 2
+        assert len(catalog) == 31
+        assert catalog['SDO/AIA|2012-07-01T12:00:00.000']['loop_params']['radius'] == 5.
+        assert len(catalog.keys(telescope='SDO/AIA', end='2011-12-31')) == 1
@@ -0,0 +1,26 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+import astropy.units as u
+
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+
+
+def test_lazy_synthetic_result(dummy_ds):
+    """The sunpy map is only built on access and the header template is reused across views"""
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.])
+    assert synth.result._map is None and synth.result._norm is None
+    header = synth.header
+
+    smap = synth.synth_map
+    assert smap is synth.synth_map
+    assert np.array_equal(smap.data, synth.image)
+
+    synth.update_los(norm=[0.2, 0.3, 1.], north=[0., 1., 0.])
+    assert synth.header is header
+    assert synth.result._map is None
+
+    noisy = synth.result.with_data(synth.image * 2)
+    assert noisy.header is header
+    assert_allclose(noisy.map.data, 2 * synth.image)
@@ -0,0 +1,47 @@
+import pytest
+import numpy as np
+
+import astropy.units as u
+
+from rushlight.utils.projector import project_tiled
+from rushlight.utils.shared_fields import SharedFields
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+from tests.conftest import make_projector
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_tiled_projection(dummy_ds, workers, tmp_path):
+    """Stitched tiles are bit-identical to an untiled render"""
+    field = ("gas", "aia_filter_band")
+    projector = make_projector(dummy_ds, [0.3, 0.2, 1.], resolution=(50, 40))
+    cube = projector.sample_cube([field])
+    expected = projector.integrate(cube)
+
+    out = str(tmp_path / "image.npy")
+    tiled = project_tiled(dummy_ds, dummy_ds.domain_center.value, [0.3, 0.2, 1.], dummy_ds.domain_width[0].value,
+                          (50, 40), cube, north_vector=(0., 1., 0.), tile_size=16, out=out, workers=workers)
+    assert np.array_equal(tiled, expected)
+    assert np.array_equal(np.load(out), expected)
+
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.], tile_size=24, workers=workers,
+                projector='grid')
+    projector = synth._projector()
+    assert np.array_equal(synth.image, projector.integrate(projector.sample_cube([field]))[0].T)
+
+
+def test_tiled_projection_shared(dummy_ds, monkeypatch):
+    """Where workers are not forked, they attach to the cube published in shared memory"""
+    from rushlight.utils import projector as projector_module, worker_pool
+
+    monkeypatch.setattr(projector_module, "forks", lambda: False)
+    monkeypatch.setattr(worker_pool.sys, "platform", "darwin")
+    shared, close = ([], SharedFields.close)
+    monkeypatch.setattr(SharedFields, "close", lambda self: (shared.append(self.handle), close(self)))
+
+    projector = make_projector(dummy_ds, [0.3, 0.2, 1.], resolution=(50, 40))
+    cube = projector.sample_cube([("gas", "aia_filter_band")])
+    tiled = project_tiled(dummy_ds, dummy_ds.domain_center.value, [0.3, 0.2, 1.], dummy_ds.domain_width[0].value,
+                          (50, 40), cube, north_vector=(0., 1., 0.), tile_size=16, workers=2)
+    assert np.array_equal(tiled, projector.integrate(cube))
+    assert len(shared) == 1 and shared[0].backing == "shm"
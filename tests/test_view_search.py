@@ -0,0 +1,98 @@
+import numpy as np
+from numpy.testing import assert_allclose
+import pytest
+
+import yt
+import astropy.units as u
+
+from rushlight.utils.projector import GridProjector
+from rushlight.utils.proj_imag_classified import SyntheticImage as sfi
+from rushlight.utils.view_search import ViewSearch, orientation_vectors
+
+
+@pytest.fixture(scope="module")
+def blobs_ds():
+    """Uniform grid of a few asymmetrically placed emitting blobs"""
+    rng = np.random.default_rng(1)
+    n = 32
+    z, y, x = np.mgrid[:n, :n, :n] / n
+    emission = np.zeros((n, n, n))
+    for _ in range(6):
+        center = rng.uniform(0.25, 0.75, 3)
+        sigma = rng.uniform(0.04, 0.1)
+        emission += np.exp(-((x - center[0]) ** 2 + (y - center[1]) ** 2 + (z - center[2]) ** 2) / (2 * sigma ** 2))
+    return yt.load_uniform_grid({'emission': (emission, 'erg/cm**3/s')}, emission.shape, length_unit=1e9,
+                                bbox=np.array([[0., 1.]] * 3))
+
+
+def test_orientation_vectors():
+    """Tilted views keep orthonormal vectors and reduce to the base view without rotation"""
+    normal, north = orientation_vectors()
+    assert_allclose(normal, [0., 0., 1.])
+    assert_allclose(north, [0., 1., 0.])
+
+    normal, north = orientation_vectors(20., -10., 35., normal_vector=[0.3, 0.2, 1.], north_vector=[0., 1., 0.])
+    assert_allclose([np.linalg.norm(normal), np.linalg.norm(north), normal.dot(north)], [1., 1., 0.], atol=1e-12)
+
+
+def test_view_search(blobs_ds, tmp_path):
+    """Coarse-to-fine search recovers a known view, and a checkpointed search resumes without rendering"""
+    center, width = blobs_ds.domain_center.value, 1.
+    normal, north = orientation_vectors(12., -8., 5.)
+    projector = GridProjector(blobs_ds, center, normal_vector=normal, width=width, resolution=48, north_vector=north)
+    cube = projector.sample_cube([('stream', 'emission')])
+    reference = projector.integrate(cube)[0].T
+
+    checkpoint = str(tmp_path / "search.jsonl")
+    search = ViewSearch(blobs_ds, cube, reference, center, width, checkpoint=checkpoint)
+    best = search.search(samples=5, levels=(0.5, 1., 1.), workers=2)
+    assert_allclose([best['params'][name] for name in ('lon', 'lat', 'roll')], [12., -8., 5.], atol=3.75)
+    assert best['score'] > 0.99
+    assert [level['factor'] for level in search.history] == [0.5, 1., 1.]
+    rendered = len(search.scores)
+
+    resumed = ViewSearch(blobs_ds, cube, reference, center, width, checkpoint=checkpoint)
+    assert len(resumed.scores) == rendered
+    assert resumed.search(samples=5, levels=(0.5, 1., 1.))['params'] == best['params']
+    assert len(resumed.renders) == 0
+
+
+def test_shared_checkpoint(blobs_ds, tmp_path):
+    """Searches from different base views sharing a checkpoint do not reuse each other's scores"""
+    center, width = blobs_ds.domain_center.value, 1.
+    projector = GridProjector(blobs_ds, center, normal_vector=[0., 0., 1.], width=width, resolution=24,
+                              north_vector=[0., 1., 0.])
+    cube = projector.sample_cube([('stream', 'emission')])
+    reference = projector.integrate(cube)[0].T
+
+    checkpoint = str(tmp_path / "search.jsonl")
+    first = ViewSearch(blobs_ds, cube, reference, center, width, checkpoint=checkpoint)
+    first.search(samples=3, levels=(1.,))
+
+    tilted = {'normal_vector': orientation_vectors(30., 30.)[0], 'north_vector': [0., 1., 0.]}
+    other = ViewSearch(blobs_ds, cube, reference, center, width, view_kwargs=tilted, checkpoint=checkpoint)
+    assert other.scores == {}
+    other.search(samples=3, levels=(1.,))
+    assert len(other.renders) == len(other.scores) > 0
+
+    assert len(ViewSearch(blobs_ds, cube, reference, center, width, checkpoint=checkpoint).scores) == \
+        len(first.scores)
+
+
+def test_fit_view(dummy_ds):
+    """The view search renders from the cached emission cube and re-projects along the best view"""
+    synth = sfi(dataset=dummy_ds, instr='aia', channel=171 * u.angstrom,
+                normvector=[0.3, 0.2, 1.], northvector=[0., 1., 0.])
+    best = synth.fit_view(samples=3, levels=(0.25,))
+    assert_allclose(synth.view_settings['normal_vector'], best['normal_vector'])
+    assert synth.view_search.cube is synth.emission_cubes[('aia', str(synth.channel))]
+
+    # The next search perturbs the updated view, and repeating it reuses the scores
+    synth.fit_view(samples=3, levels=(0.25,), update=False)
+    assert_allclose(synth.view_search.view_kwargs['normal_vector'], best['normal_vector'])
+    search, rendered = (synth.view_search, len(synth.view_search.scores))
+    synth.fit_view(samples=3, levels=(0.25,), update=False)
+    assert synth.view_search is search and len(search.scores) == rendered
+
+    synth.fit_view(samples=3, levels=(0.25,), update=False, view_kwargs={'normal_vector': [0., 0., 1.]})
+    assert synth.view_search is not search
@@ -0,0 +1,34 @@
+import os
+
+from rushlight.utils import worker_pool
+from rushlight.utils.worker_pool import imap_shared
+
+
+def _scaled(state, item):
+    return state['scale'](item)
+
+
+def _pid(state, item):
+    return os.getpid()
+
+
+def _nested(state, item):
+    return sorted(imap_shared(_scaled, [item, item + 1], {'scale': lambda x: x * state}, workers=2))
+
+
+def test_imap_shared():
+    """Workers share unpicklable state, and calls can be nested"""
+    state = {'scale': lambda x: 10 * x}
+    assert list(imap_shared(_scaled, [1, 2, 3], state)) == [10, 20, 30]
+    assert sorted(imap_shared(_scaled, [1, 2, 3], state, workers=2)) == [10, 20, 30]
+    assert sorted(imap_shared(_nested, [1, 3], 2, workers=2)) == [[2, 4], [6, 8]]
+
+
+def test_fork_only_on_linux(monkeypatch):
+    """Other platforms spawn workers for picklable state and share unpicklable state between threads"""
+    monkeypatch.setattr(worker_pool.sys, 'platform', 'darwin')
+    assert os.getpid() not in set(imap_shared(_pid, [1, 2], {'scale': abs}, workers=2))
+    assert set(imap_shared(_pid, [1, 2], {'scale': lambda x: -x}, workers=2)) == {os.getpid()}
+    assert sorted(imap_shared(_scaled, [1, 2], {'scale': lambda x: -x}, workers=2)) == [-2, -1]
+    monkeypatch.setattr(worker_pool.sys, 'platform', 'linux')
+    assert worker_pool.process_context().get_start_method() == 'fork'